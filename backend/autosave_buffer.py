@@ -0,0 +1,230 @@
+"""
+Write-behind buffer for MCQ autosaves
+Coalesces repeated answer writes per attempt and flushes them to MongoDB with bulk_write
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Buffer configuration from environment
+WRITE_BEHIND_ENABLED = os.environ.get("MCQ_WRITE_BEHIND", "1") == "1"
+FLUSH_INTERVAL_MS = int(os.environ.get("MCQ_AUTOSAVE_FLUSH_INTERVAL_MS", 1000))
+MAX_LAG_MS = int(os.environ.get("MCQ_AUTOSAVE_MAX_LAG_MS", 5000))
+
+
+class AnswerWriteBuffer:
+    """Per-worker write-behind buffer for attempt mcq_answers
+
+    An attempt's buffered answers are flushed once it has been quiet for
+    `flush_interval_ms`, or at the latest `max_lag_ms` after its first
+    unflushed write. Callers acknowledge on add(); a flush that fails is put
+    back and retried, and the answer snapshot the client sends when it
+    submits covers whatever a submission overtakes. Each answer carries the
+    sequence number of its batch and is only applied while the attempt's
+    stored mcq_seq is lower, so a batch flushed late by one worker never
+    overwrites a newer batch another worker already wrote.
+    """
+
+    def __init__(
+        self,
+        flush_interval_ms: int = FLUSH_INTERVAL_MS,
+        max_lag_ms: int = MAX_LAG_MS,
+        enabled: bool = WRITE_BEHIND_ENABLED
+    ):
+        self.enabled = enabled
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_lag = max(max_lag_ms, flush_interval_ms) / 1000
+        self._collection = None
+        self._write_filter: Dict = {}
+        self._pending: Dict[str, Dict] = {}
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            "writes_received": 0,
+            "writes_flushed": 0,
+            "writes_dropped": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0
+        }
+
+    def start(self, collection, write_filter: Optional[Dict] = None):
+        """Start the background flusher (call from the app startup event)
+
+        write_filter is added to every flushed update so late flushes cannot
+        modify attempts that have moved on (e.g. already submitted).
+        """
+        self._collection = collection
+        self._write_filter = write_filter or {}
+        self._flush_lock = asyncio.Lock()
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(
+                f"MCQ write-behind buffer started (flush {self.flush_interval * 1000:.0f}ms, "
+                f"max lag {self.max_lag * 1000:.0f}ms)"
+            )
+
+    async def stop(self):
+        """Stop the flusher and write out everything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        logger.info("MCQ write-behind buffer stopped")
+
+    def add(self, attempt_id: str, answers: Dict[str, str], seq: Optional[int] = None):
+        """Buffer answers for an attempt; later writes to the same question win"""
+        now = time.monotonic()
+        entry = self._pending.get(attempt_id)
+        if entry is None:
+            entry = {"answers": {}, "seq": None, "first_at": now, "last_at": now}
+            self._pending[attempt_id] = entry
+        for q_id, option in answers.items():
+            self._merge_answer(entry["answers"], q_id, option, seq)
+        entry["last_at"] = now
+        if seq is not None:
+            entry["seq"] = seq if entry["seq"] is None else max(entry["seq"], seq)
+        self.stats["writes_received"] += len(answers)
+
+    @staticmethod
+    def _merge_answer(answers: Dict[str, Tuple[str, Optional[int]]], q_id: str, option: str, seq: Optional[int]):
+        """Keep the answer from the newest batch; unsequenced writes always win"""
+        previous = answers.get(q_id)
+        if seq is None or previous is None or previous[1] is None or previous[1] <= seq:
+            answers[q_id] = (option, seq)
+
+    def has_pending(self, attempt_id: str) -> bool:
+        return attempt_id in self._pending
+
+    async def flush_attempt(self, attempt_id: str):
+        """Synchronously flush one attempt (submission, time expiry)"""
+        await self.flush([attempt_id])
+
+    async def flush(self, attempt_ids: Optional[Iterable[str]] = None):
+        """Flush the given attempts, or everything buffered, in one bulk_write"""
+        if self._collection is None:
+            return
+        async with self._flush_lock:
+            if attempt_ids is None:
+                batch, self._pending = self._pending, {}
+            else:
+                batch = {
+                    attempt_id: self._pending.pop(attempt_id)
+                    for attempt_id in attempt_ids if attempt_id in self._pending
+                }
+            if batch:
+                await self._write(batch)
+
+    async def _flush_due(self):
+        now = time.monotonic()
+        due = [
+            attempt_id for attempt_id, entry in self._pending.items()
+            if now - entry["last_at"] >= self.flush_interval or now - entry["first_at"] >= self.max_lag
+        ]
+        if due:
+            await self.flush(due)
+
+    @staticmethod
+    def _update_pipeline(entry: Dict) -> List[Dict]:
+        """Set each answer only if its batch is newer than the stored mcq_seq (unsequenced answers always)"""
+        stored_seq = {"$ifNull": ["$mcq_seq", 0]}
+        fields = {}
+        for q_id, (option, seq) in entry["answers"].items():
+            value = {"$literal": option}
+            if seq is not None:
+                value = {"$cond": [{"$lt": [stored_seq, seq]}, value, f"$mcq_answers.{q_id}"]}
+            fields[f"mcq_answers.{q_id}"] = value
+        if entry["seq"] is not None:
+            fields["mcq_seq"] = {"$max": [stored_seq, entry["seq"]]}
+        return [{"$set": fields}] if fields else []
+
+    async def _write(self, batch: Dict[str, Dict]):
+        operations = []
+        fields_written = 0
+        for attempt_id, entry in batch.items():
+            pipeline = self._update_pipeline(entry)
+            if pipeline:
+                operations.append(UpdateOne({"id": attempt_id, **self._write_filter}, pipeline))
+                fields_written += len(entry["answers"])
+        if not operations:
+            return
+
+        started = time.perf_counter()
+        try:
+            result = await self._collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            self.stats["flush_errors"] += 1
+            logger.error(f"MCQ autosave flush failed for {len(operations)} attempts, retrying: {e}")
+            self._requeue(batch)
+            return
+        # Writes to attempts submitted meanwhile are dropped by the filter (the submit snapshot has them)
+        self.stats["writes_dropped"] += len(operations) - result.matched_count
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats["flushes"] += 1
+        self.stats["writes_flushed"] += fields_written
+        self.stats["last_flush_ms"] = round(elapsed_ms, 2)
+        self.stats["max_flush_ms"] = round(max(self.stats["max_flush_ms"], elapsed_ms), 2)
+        self.stats["total_flush_ms"] += elapsed_ms
+
+    def _requeue(self, batch: Dict[str, Dict]):
+        """Put a failed batch back without overwriting answers buffered since"""
+        for attempt_id, entry in batch.items():
+            newer = self._pending.get(attempt_id)
+            if newer is None:
+                self._pending[attempt_id] = entry
+                continue
+            for q_id, (option, seq) in newer["answers"].items():
+                self._merge_answer(entry["answers"], q_id, option, seq)
+            newer["answers"] = entry["answers"]
+            newer["first_at"] = entry["first_at"]
+            if entry["seq"] is not None:
+                newer["seq"] = entry["seq"] if newer["seq"] is None else max(entry["seq"], newer["seq"])
+
+    async def _run(self):
+        tick = min(self.flush_interval, self.max_lag) / 2
+        while True:
+            await asyncio.sleep(tick)
+            try:
+                await self._flush_due()
+            except Exception as e:
+                logger.error(f"MCQ autosave flusher error: {e}")
+
+    def metrics(self) -> Dict:
+        flushes = self.stats["flushes"]
+        flushed = self.stats["writes_flushed"]
+        now = time.monotonic()
+        oldest = min((entry["first_at"] for entry in self._pending.values()), default=None)
+        return {
+            "enabled": self.enabled,
+            "flush_interval_ms": int(self.flush_interval * 1000),
+            "max_lag_ms": int(self.max_lag * 1000),
+            "pending_attempts": len(self._pending),
+            "oldest_pending_ms": round((now - oldest) * 1000, 1) if oldest is not None else 0.0,
+            "writes_received": self.stats["writes_received"],
+            "writes_flushed": flushed,
+            "writes_dropped": self.stats["writes_dropped"],
+            "coalescing_ratio": round(self.stats["writes_received"] / flushed, 3) if flushed else 0.0,
+            "flushes": flushes,
+            "flush_errors": self.stats["flush_errors"],
+            "last_flush_ms": self.stats["last_flush_ms"],
+            "max_flush_ms": self.stats["max_flush_ms"],
+            "avg_flush_ms": round(self.stats["total_flush_ms"] / flushes, 2) if flushes else 0.0
+        }
+
+
+# Shared per-process instance
+answer_buffer = AnswerWriteBuffer()
@@ -0,0 +1,127 @@
+"""
+Batch membership for the exam platform
+Stores one document per (batch, student) in `batch_members` and keeps a cached member_count on the batch
+"""
+
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 50
+DUPLICATE_KEY = 11000
+
+
+class BatchMembers:
+    """Membership rows replacing the embedded `batches.student_ids` array
+
+    Adding is an unordered bulk of upserts on the unique (batch_id,
+    student_id) index, so repeats and concurrent adds are no-ops; the batch's
+    member_count moves by exactly the number of rows inserted or deleted.
+    migrate_embedded() moves legacy arrays over and runs as a sweeper job.
+    """
+
+    def __init__(self):
+        self._db = None
+        self.stats = {"added": 0, "removed": 0, "batches_migrated": 0, "last_migration_ms": 0.0}
+
+    def start(self, db):
+        """Bind the database (call from the app startup event)"""
+        self._db = db
+
+    async def ensure_indexes(self):
+        await self._db.batch_members.create_index([("batch_id", 1), ("student_id", 1)], unique=True)
+        await self._db.batch_members.create_index("student_id")
+        await self._db.batch_members.create_index([("batch_id", 1), ("created_at", -1), ("id", -1)])
+
+    async def _insert(self, batch_id: str, student_ids: Iterable[str]) -> int:
+        now = datetime.now(timezone.utc)
+        operations = [
+            UpdateOne(
+                {"batch_id": batch_id, "student_id": student_id},
+                {"$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now}},
+                upsert=True
+            )
+            for student_id in dict.fromkeys(student_ids)
+        ]
+        if not operations:
+            return 0
+        try:
+            result = await self._db.batch_members.bulk_write(operations, ordered=False)
+            return result.upserted_count
+        except BulkWriteError as e:
+            # Two upserts for the same pair raced; the loser's row already exists
+            if any(error.get("code") != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                raise
+            return e.details.get("nUpserted", 0)
+
+    async def add(self, batch_id: str, student_ids: Iterable[str]) -> int:
+        """Add students to a batch; returns how many were not members yet"""
+        added = await self._insert(batch_id, student_ids)
+        if added:
+            await self._db.batches.update_one({"id": batch_id}, {"$inc": {"member_count": added}})
+            self.stats["added"] += added
+        return added
+
+    async def remove(self, batch_id: str, student_id: str) -> bool:
+        result = await self._db.batch_members.delete_one({"batch_id": batch_id, "student_id": student_id})
+        if result.deleted_count:
+            await self._db.batches.update_one({"id": batch_id}, {"$inc": {"member_count": -1}})
+            self.stats["removed"] += 1
+        return result.deleted_count == 1
+
+    async def iter_student_ids(self, batch_id: str, chunk_size: int = 1000) -> AsyncIterator[List[str]]:
+        """A batch's student ids in chunks, read through a cursor"""
+        chunk = []
+        cursor = self._db.batch_members.find({"batch_id": batch_id}, {"_id": 0, "student_id": 1}).batch_size(chunk_size)
+        async for member in cursor:
+            chunk.append(member["student_id"])
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    async def recount(self, batch_id: str) -> int:
+        count = await self._db.batch_members.count_documents({"batch_id": batch_id})
+        await self._db.batches.update_one({"id": batch_id}, {"$set": {"member_count": count}})
+        return count
+
+    async def migrate_embedded(self, limit: Optional[int] = None) -> int:
+        """Move `student_ids` arrays into batch_members (idempotent; sweeper job)"""
+        started = time.perf_counter()
+        migrated = 0
+        while limit is None or migrated < limit:
+            batches = await self._db.batches.find(
+                {"student_ids": {"$exists": True}},
+                {"_id": 0, "id": 1, "student_ids": 1}
+            ).to_list(MIGRATION_BATCH_SIZE)
+            if not batches:
+                break
+            for batch in batches:
+                await self._insert(batch["id"], batch.get("student_ids") or [])
+                # Recount rather than $inc, so a migration repeated after a crash stays exact
+                await self.recount(batch["id"])
+                await self._db.batches.update_one(
+                    {"id": batch["id"], "student_ids": batch.get("student_ids")},
+                    {"$unset": {"student_ids": ""}}
+                )
+                migrated += 1
+        if migrated:
+            logger.info(f"Moved membership of {migrated} batches into batch_members")
+            self.stats["batches_migrated"] += migrated
+            self.stats["last_migration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return migrated
+
+    def metrics(self) -> Dict:
+        return dict(self.stats)
+
+
+# Shared per-process instance
+batch_members = BatchMembers()
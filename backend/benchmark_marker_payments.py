@@ -0,0 +1,131 @@
+"""
+Marker Payments Benchmark
+Compares the old per-marker N+1 admin payments query with the server-side aggregation
+Seeds a throwaway database with 50 markers and 100,000 payment rows
+"""
+
+import asyncio
+import sys
+import os
+import time
+import uuid
+import random
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+from datetime import datetime, timedelta, timezone
+
+from payment_ledger import marker_payment_totals_pipeline
+
+load_dotenv()
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+BENCH_DB_NAME = os.environ.get('BENCH_DB_NAME', 'exam_bureau_benchmark')
+
+MARKER_COUNT = 50
+PAYMENT_COUNT = 100_000
+RUNS = 5
+
+
+async def seed(db):
+    await db.users.drop()
+    await db.marker_payments.drop()
+    await db.users.create_index("id", unique=True)
+    await db.marker_payments.create_index("marker_id")
+    await db.marker_payments.create_index([("status", 1), ("marker_id", 1)])
+
+    markers = [
+        {
+            "id": f"marker_{i:03d}",
+            "email": f"marker{i}@bench.lk",
+            "full_name": f"Marker {i}",
+            "role": "marker",
+            "bank_details": {"bank_name": "Bench Bank", "account_number": f"{i:010d}"}
+        }
+        for i in range(MARKER_COUNT)
+    ]
+    await db.users.insert_many(markers)
+
+    now = datetime.now(timezone.utc)
+    batch = []
+    for i in range(PAYMENT_COUNT):
+        batch.append({
+            "id": str(uuid.uuid4()),
+            "marker_id": random.choice(markers)["id"],
+            "attempt_id": str(uuid.uuid4()),
+            "amount": 50.0,
+            "status": "pending" if random.random() < 0.3 else "paid",
+            "created_at": now - timedelta(minutes=i)
+        })
+        if len(batch) == 10_000:
+            await db.marker_payments.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.marker_payments.insert_many(batch, ordered=False)
+
+
+async def legacy_marker_payments(db, query):
+    """The admin endpoint as it was: capped find, one users lookup per marker, sums in Python"""
+    payments = await db.marker_payments.find(query, {"_id": 0}).to_list(500)
+
+    marker_totals = {}
+    for payment in payments:
+        marker_id = payment["marker_id"]
+        if marker_id not in marker_totals:
+            marker = await db.users.find_one({"id": marker_id}, {"_id": 0, "full_name": 1, "bank_details": 1})
+            marker_totals[marker_id] = {
+                "marker_id": marker_id,
+                "marker_name": marker.get("full_name") if marker else "Unknown",
+                "bank_details": marker.get("bank_details") if marker else None,
+                "total_papers": 0,
+                "total_pending": 0,
+                "total_paid": 0,
+                "payments": []
+            }
+        marker_totals[marker_id]["total_papers"] += 1
+        if payment["status"] == "pending":
+            marker_totals[marker_id]["total_pending"] += payment["amount"]
+        else:
+            marker_totals[marker_id]["total_paid"] += payment["amount"]
+        marker_totals[marker_id]["payments"].append(payment)
+    return list(marker_totals.values())
+
+
+async def aggregated_marker_payments(db, query):
+    return await db.marker_payments.aggregate(marker_payment_totals_pipeline(query)).to_list(None)
+
+
+async def time_runs(label, func, db, query):
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        markers = await func(db, query)
+        timings.append((time.perf_counter() - started) * 1000)
+    papers = sum(m["total_papers"] for m in markers)
+    print(f"{label:<12} median {sorted(timings)[RUNS // 2]:8.1f} ms  best {min(timings):8.1f} ms  "
+          f"markers {len(markers):3d}  payments counted {papers}")
+
+
+async def run_benchmark():
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[BENCH_DB_NAME]
+
+    print(f"Seeding {BENCH_DB_NAME}: {MARKER_COUNT} markers, {PAYMENT_COUNT} payments...")
+    await seed(db)
+
+    for label, query in (("all", {}), ("pending", {"status": "pending"})):
+        print(f"\nstatus_filter={label}")
+        await time_runs("legacy N+1", legacy_marker_payments, db, query)
+        await time_runs("aggregation", aggregated_marker_payments, db, query)
+
+    print("\nNote: the legacy query stops at 500 rows, so its totals are incomplete at this size.")
+    await client.drop_database(BENCH_DB_NAME)
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark())
@@ -32,7 +32,7 @@ async def create_typesetters():
             "assigned_language": "si",
             "assigned_grades": ["grade_2", "grade_3", "grade_4", "grade_5"],
             "hashed_password": pwd_context.hash("typesetter123"),
-            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": datetime.now(timezone.utc),
             "is_active": True
         },
         {
@@ -43,7 +43,7 @@ async def create_typesetters():
             "assigned_language": "ta",
             "assigned_grades": ["grade_2", "grade_3", "grade_4", "grade_5"],
             "hashed_password": pwd_context.hash("typesetter123"),
-            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": datetime.now(timezone.utc),
             "is_active": True
         },
         {
@@ -54,7 +54,7 @@ async def create_typesetters():
             "assigned_language": "en",
             "assigned_grades": ["grade_2", "grade_3", "grade_4", "grade_5"],
             "hashed_password": pwd_context.hash("typesetter123"),
-            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": datetime.now(timezone.utc),
             "is_active": True
         }
     ]
@@ -0,0 +1,72 @@
+"""
+Live exam session registry
+Tracks the WebSocket connections of students sitting an exam on this worker
+"""
+
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional, Set
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+
+class ExamSessionRegistry:
+    """Per-worker map of attempt_id -> open WebSocket connections
+
+    A student normally holds one connection, but a reconnect can briefly
+    overlap the old socket, so each attempt keeps a set.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, Set[WebSocket]] = {}
+        self.stats = {"connected_total": 0, "messages_received": 0, "messages_sent": 0, "send_errors": 0, "protocol_errors": 0}
+
+    def register(self, attempt_id: str, websocket: WebSocket):
+        self._sessions.setdefault(attempt_id, set()).add(websocket)
+        self.stats["connected_total"] += 1
+
+    def unregister(self, attempt_id: str, websocket: WebSocket):
+        sockets = self._sessions.get(attempt_id)
+        if sockets is None:
+            return
+        sockets.discard(websocket)
+        if not sockets:
+            self._sessions.pop(attempt_id, None)
+
+    def is_connected(self, attempt_id: str) -> bool:
+        return attempt_id in self._sessions
+
+    async def send(self, attempt_id: str, message: Dict) -> int:
+        """Send a message to every connection for one attempt; returns how many got it"""
+        delivered = 0
+        for websocket in list(self._sessions.get(attempt_id, ())):
+            try:
+                await websocket.send_json(message)
+                delivered += 1
+                self.stats["messages_sent"] += 1
+            except Exception as e:
+                self.stats["send_errors"] += 1
+                logger.warning(f"Dropping exam session socket for attempt {attempt_id}: {e}")
+                self.unregister(attempt_id, websocket)
+        return delivered
+
+    async def broadcast(self, message: Dict, attempt_ids: Optional[Iterable[str]] = None) -> int:
+        """Send a message to the given attempts (default: every live session on this worker)"""
+        targets = list(self._sessions) if attempt_ids is None else [a for a in attempt_ids if a in self._sessions]
+        if not targets:
+            return 0
+        results = await asyncio.gather(*(self.send(attempt_id, message) for attempt_id in targets))
+        return sum(results)
+
+    def metrics(self) -> Dict:
+        return {
+            "live_attempts": len(self._sessions),
+            "live_connections": sum(len(sockets) for sockets in self._sessions.values()),
+            **self.stats
+        }
+
+
+# Shared per-process instance
+exam_sessions = ExamSessionRegistry()
@@ -0,0 +1,172 @@
+"""
+MCQ grading engine for the exam platform
+Compiles an exam's answer key into a NumPy array and scores attempts by vectorized comparison
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+REGRADE_BATCH_SIZE = 1000
+
+# Encoded answer values: option codes are positions within their question, starting at 1
+UNANSWERED = 0
+UNKNOWN_OPTION = -1  # Student picked something that is not an option of this question
+NO_KEY = -2  # Question has no correct answer recorded; nothing matches it
+CODE_DTYPE = np.int16
+MAX_OPTIONS_PER_QUESTION = int(np.iinfo(CODE_DTYPE).max)
+
+
+@dataclass(frozen=True)
+class CompiledAnswerKey:
+    """An exam's answer key as a fixed question order plus per-question small-int option codes"""
+
+    exam_id: str
+    version: int
+    question_ids: Tuple[str, ...]
+    option_codes: Tuple[Dict[str, int], ...]
+    key: np.ndarray
+
+    @property
+    def total_questions(self) -> int:
+        return len(self.question_ids)
+
+    def encode(self, answers: Dict[str, str]) -> np.ndarray:
+        """Encode one attempt's {question_id: option} map in question order"""
+        return np.fromiter(
+            (
+                codes.get(answers[q_id], UNKNOWN_OPTION) if answers.get(q_id) is not None else UNANSWERED
+                for q_id, codes in zip(self.question_ids, self.option_codes)
+            ),
+            dtype=CODE_DTYPE,
+            count=len(self.question_ids)
+        )
+
+    def score(self, answers: Dict[str, str]) -> int:
+        """Number of correct answers for one attempt"""
+        return int(np.count_nonzero(self.encode(answers) == self.key))
+
+    def score_matrix(self, encoded: np.ndarray) -> np.ndarray:
+        """Scores for a (attempts x questions) matrix of encoded answers"""
+        if encoded.size == 0:
+            return np.zeros(encoded.shape[0], dtype=np.int32)
+        return np.count_nonzero(encoded == self.key, axis=1)
+
+
+def question_key(question: Dict) -> str:
+    """Key of a question in attempt mcq_answers"""
+    return question.get("id") or str(question.get("question_number", ""))
+
+
+def validate_mcq_questions(questions: List[Dict]):
+    """Raise ValueError for questions the grader cannot encode (call when an exam is created or edited)"""
+    for number, question in enumerate(questions, start=1):
+        if len(question.get("options", [])) >= MAX_OPTIONS_PER_QUESTION:
+            raise ValueError(f"Question {number} has more than {MAX_OPTIONS_PER_QUESTION - 1} options")
+
+
+def compile_answer_key(exam: Dict) -> CompiledAnswerKey:
+    """Compile an exam document's MCQ answer key
+
+    Options are numbered within their own question, so exams with arbitrary
+    option ids (e.g. a uuid per option) encode just as compactly as A-D.
+    """
+    questions = exam.get("mcq_questions", [])
+    validate_mcq_questions(questions)
+
+    option_codes = []
+    key = []
+    for question in questions:
+        codes: Dict[str, int] = {}
+        for option in question.get("options", []):
+            option_id = option.get("option_id") or option.get("id")
+            if option_id is not None and option_id not in codes:
+                codes[option_id] = len(codes) + 1
+        correct = question.get("correct_option_id") or question.get("correct_answer")
+        if correct is not None and correct not in codes:
+            # A key outside the listed options still matches students who gave exactly that answer
+            codes[correct] = len(codes) + 1
+        option_codes.append(codes)
+        key.append(codes[correct] if correct is not None else NO_KEY)
+
+    return CompiledAnswerKey(
+        exam_id=exam.get("id"),
+        version=exam.get("version", 0),
+        question_ids=tuple(question_key(q) for q in questions),
+        option_codes=tuple(option_codes),
+        key=np.array(key, dtype=CODE_DTYPE)
+    )
+
+
+async def regrade_attempts(
+    db,
+    answer_key: CompiledAnswerKey,
+    statuses: List[str],
+    completed_status: str,
+    batch_size: int = REGRADE_BATCH_SIZE,
+    on_progress: Optional[Callable[[Dict], object]] = None,
+    query: Optional[Dict] = None
+) -> Dict:
+    """Re-score every attempt of an exam in the given statuses (optionally narrowed by `query`)
+
+    Attempts are streamed in batches, scored as one matrix per batch, and only
+    attempts whose score changed are written back with an unordered bulk_write.
+    Completed attempts also get total_score recomputed from their written score.
+    """
+    progress = {"processed": 0, "changed": 0, "batches": 0, "changed_student_ids": []}
+    started = time.perf_counter()
+
+    cursor = db.attempts.find(
+        {**(query or {}), "exam_id": answer_key.exam_id, "status": {"$in": statuses}},
+        {"_id": 0, "id": 1, "student_id": 1, "status": 1, "mcq_answers": 1, "mcq_score": 1, "written_score": 1}
+    ).batch_size(batch_size)
+
+    batch: List[Dict] = []
+    async for attempt in cursor:
+        batch.append(attempt)
+        if len(batch) >= batch_size:
+            await _regrade_batch(db, answer_key, batch, completed_status, progress)
+            batch = []
+            if on_progress:
+                await on_progress(progress)
+    if batch:
+        await _regrade_batch(db, answer_key, batch, completed_status, progress)
+
+    progress["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(
+        f"Regraded {progress['processed']} attempts for exam {answer_key.exam_id} "
+        f"(v{answer_key.version}): {progress['changed']} changed in {progress['elapsed_ms']}ms"
+    )
+    return progress
+
+
+async def _regrade_batch(db, answer_key: CompiledAnswerKey, batch: List[Dict], completed_status: str, progress: Dict):
+    if answer_key.total_questions:
+        encoded = np.stack([answer_key.encode(a.get("mcq_answers") or {}) for a in batch])
+    else:
+        encoded = np.zeros((len(batch), 0), dtype=CODE_DTYPE)
+    scores = answer_key.score_matrix(encoded)
+
+    now = datetime.now(timezone.utc)
+    operations = []
+    for attempt, score in zip(batch, scores.tolist()):
+        if attempt.get("mcq_score") == score:
+            continue
+        fields = {"mcq_score": score, "mcq_regraded_at": now, "mcq_graded_version": answer_key.version}
+        if attempt.get("status") == completed_status:
+            fields["total_score"] = score + (attempt.get("written_score") or 0)
+        operations.append(UpdateOne({"id": attempt["id"]}, {"$set": fields}))
+        progress["changed_student_ids"].append(attempt.get("student_id"))
+
+    if operations:
+        await db.attempts.bulk_write(operations, ordered=False)
+    progress["processed"] += len(batch)
+    progress["changed"] += len(operations)
+    progress["batches"] += 1
@@ -19,7 +19,7 @@ max_requests_jitter = 100  # Add randomness to max_requests
 # Timeouts
 timeout = 120  # Longer timeout for exam operations
 keepalive = 5
-graceful_timeout = 30
+graceful_timeout = 30  # Must cover the shutdown flush of buffered MCQ autosaves (MCQ_AUTOSAVE_MAX_LAG_MS)
 
 # Logging
 accesslog = "-"  # Log to stdout
@@ -0,0 +1,162 @@
+"""
+Image normalization pipeline for uploaded paper photos
+Auto-rotates, downscales and re-encodes phone photos on a process pool, producing marking and thumbnail variants
+"""
+
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Pipeline configuration from environment
+PIPELINE_WORKERS = int(os.environ.get("IMAGE_PIPELINE_WORKERS", min(2, os.cpu_count() or 1)))
+MARKING_MAX_EDGE = int(os.environ.get("PAPER_MARKING_MAX_EDGE", 2000))
+THUMBNAIL_MAX_EDGE = int(os.environ.get("PAPER_THUMBNAIL_MAX_EDGE", 320))
+JPEG_QUALITY = int(os.environ.get("PAPER_JPEG_QUALITY", 82))
+WEBP_QUALITY = int(os.environ.get("PAPER_WEBP_QUALITY", 80))
+
+
+def _save_variant(image: Image.Image, out_dir: str, filename: str, fmt: str, **options) -> Dict:
+    path = os.path.join(out_dir, filename)
+    tmp_path = f"{path}.part-{uuid.uuid4().hex[:8]}"
+    try:
+        image.save(tmp_path, fmt, **options)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return {
+        "path": path,
+        "width": image.width,
+        "height": image.height,
+        "bytes": os.path.getsize(path),
+        "sha256": digest.hexdigest()
+    }
+
+
+def normalize_paper_photo(src_path: str, out_dir: str, stem: str) -> Optional[Dict]:
+    """Build the marking (progressive JPEG + WebP) and thumbnail variants of one photo
+
+    Runs inside a pool worker. Returns None for files Pillow cannot decode
+    (e.g. HEIC without a plugin); the original upload is then used as-is.
+    """
+    try:
+        with Image.open(src_path) as source:
+            original_size = source.size
+            # Let the JPEG decoder downscale by a power of two while decoding
+            source.draft("RGB", (MARKING_MAX_EDGE, MARKING_MAX_EDGE))
+            image = ImageOps.exif_transpose(source)
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.thumbnail((MARKING_MAX_EDGE, MARKING_MAX_EDGE), Image.LANCZOS)
+
+            thumbnail = image.copy()
+            thumbnail.thumbnail((THUMBNAIL_MAX_EDGE, THUMBNAIL_MAX_EDGE), Image.LANCZOS)
+
+            variants = {
+                "marking": _save_variant(
+                    image, out_dir, f"{stem}_marking.jpg", "JPEG",
+                    quality=JPEG_QUALITY, progressive=True, optimize=True
+                ),
+                "webp": _save_variant(image, out_dir, f"{stem}_marking.webp", "WEBP", quality=WEBP_QUALITY, method=4),
+                "thumbnail": _save_variant(
+                    thumbnail, out_dir, f"{stem}_thumb.jpg", "JPEG",
+                    quality=JPEG_QUALITY, progressive=True, optimize=True
+                )
+            }
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not normalize paper photo {src_path}: {e}")
+        return None
+
+    return {"original_width": original_size[0], "original_height": original_size[1], "variants": variants}
+
+
+class ImagePipeline:
+    """Async facade over a process pool running the Pillow pipeline
+
+    Decoding and re-encoding multi-megabyte photos is CPU-bound and holds the
+    GIL, so it runs in separate processes. At most `max_workers` photos are
+    processed at once per API worker; the rest wait their turn.
+    """
+
+    def __init__(self, max_workers: int = PIPELINE_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self.stats = {"processed": 0, "failed": 0, "bytes_in": 0, "bytes_out": 0, "total_run_ms": 0.0}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned, not forked: the API process runs an event loop and Motor's threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Image pipeline pool started ({self.max_workers} workers)")
+        return self._executor
+
+    async def process(self, src_path: str, out_dir: str, stem: str) -> Optional[Dict]:
+        """Normalize one photo; returns its variants or None if it could not be processed"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        started_at = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._get_executor(), normalize_paper_photo, src_path, out_dir, stem)
+        except Exception as e:
+            logger.error(f"Image pipeline failed for {src_path}: {e}")
+            result = None
+        finally:
+            self._slots.release()
+            self.stats["total_run_ms"] += (time.perf_counter() - started_at) * 1000
+
+        if result is None:
+            self.stats["failed"] += 1
+            return None
+        self.stats["processed"] += 1
+        self.stats["bytes_in"] += os.path.getsize(src_path)
+        self.stats["bytes_out"] += result["variants"]["marking"]["bytes"]
+        return result
+
+    def metrics(self) -> Dict:
+        done = self.stats["processed"] + self.stats["failed"]
+        return {
+            "max_workers": self.max_workers,
+            "queue_depth": self._waiting,
+            "processed": self.stats["processed"],
+            "failed": self.stats["failed"],
+            "compression_ratio": round(self.stats["bytes_in"] / self.stats["bytes_out"], 2) if self.stats["bytes_out"] else 0.0,
+            "avg_run_ms": round(self.stats["total_run_ms"] / done, 2) if done else 0.0
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Image pipeline pool stopped")
+
+
+# Shared per-process instance
+image_pipeline = ImagePipeline()
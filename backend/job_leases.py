@@ -0,0 +1,89 @@
+"""
+Leases for background jobs
+Ties a running job document to the worker executing it, so jobs orphaned by a recycled worker can be detected
+"""
+
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 120))
+
+# Identifies this process in lease documents
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class LostLease(RuntimeError):
+    """Another worker took the job over; stop without touching its document"""
+
+
+class JobLeases:
+    """Heartbeat leases on the `status: running` documents of one job collection
+
+    A job is created holding a lease (lease_fields()) and renews it with
+    heartbeat() as it makes progress. gunicorn's max_requests recycling or a
+    crash kills the task without running its error handling; once the lease
+    lapses, claim_orphans() hands the job to whoever calls it (a sweeper
+    job on the leader), which can then resume or fail it.
+    """
+
+    def __init__(self, collection_name: str, lease_seconds: float = JOB_LEASE_SECONDS):
+        self.collection_name = collection_name
+        self.ttl = timedelta(seconds=lease_seconds)
+        self._db = None
+        self.stats = {"heartbeats": 0, "lost": 0, "orphans_claimed": 0}
+
+    def start(self, db):
+        """Bind the database (call from the app startup event)"""
+        self._db = db
+
+    @property
+    def collection(self):
+        return self._db[self.collection_name]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("status", 1), ("lease_until", 1)])
+
+    def lease_fields(self) -> Dict:
+        """Fields that give a new or claimed job to this worker"""
+        return {"lease_owner": WORKER_ID, "lease_until": datetime.now(timezone.utc) + self.ttl}
+
+    async def heartbeat(self, job_id: str):
+        """Extend this worker's lease; raises LostLease if the job was claimed away"""
+        result = await self.collection.update_one(
+            {"id": job_id, "status": "running", "lease_owner": WORKER_ID},
+            {"$set": {"lease_until": datetime.now(timezone.utc) + self.ttl}}
+        )
+        if result.matched_count == 0:
+            self.stats["lost"] += 1
+            raise LostLease(f"{self.collection_name} job {job_id} is no longer leased by {WORKER_ID}")
+        self.stats["heartbeats"] += 1
+
+    async def claim_orphans(self, limit: int = 10) -> List[Dict]:
+        """Take over running jobs whose lease lapsed (or that predate leases), one atomic claim each"""
+        claimed = []
+        while len(claimed) < limit:
+            now = datetime.now(timezone.utc)
+            job = await self.collection.find_one_and_update(
+                {"status": "running", "$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}]},
+                {"$set": self.lease_fields(), "$inc": {"resumes": 1}},
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+            if job is None:
+                break
+            claimed.append(job)
+        if claimed:
+            self.stats["orphans_claimed"] += len(claimed)
+            logger.warning(f"Claimed {len(claimed)} orphaned {self.collection_name} jobs")
+        return claimed
+
+    def metrics(self) -> Dict:
+        return dict(self.stats)
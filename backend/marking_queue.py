@@ -0,0 +1,215 @@
+"""
+Marking queue for anonymous written-paper marking
+Hands out the oldest pending paper atomically under a time-limited lease and returns abandoned papers to the queue
+"""
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# Queue configuration from environment
+MARKING_LEASE_MINUTES = int(os.environ.get("MARKING_LEASE_MINUTES", 20))
+MARKER_BATCH_SIZE = int(os.environ.get("MARKER_BATCH_SIZE", 3))  # Papers a marker may hold at once
+
+# Called as (from_status, to_status, count) after papers move between the queue and a lease
+TransitionHook = Callable[[str, str, int], Awaitable]
+
+
+class MarkingQueue:
+    """Claims on attempts in `pending_status`, leased through the shared deadline_at field
+
+    A claim is one find_one_and_update over the (status, created_at) index, so
+    concurrent markers never receive the same paper and never retry. The lease
+    expiry is stored in deadline_at, which lets the deadline sweeper return
+    papers whose marker walked away.
+    """
+
+    def __init__(
+        self,
+        pending_status: str,
+        in_progress_status: str,
+        lease_minutes: int = MARKING_LEASE_MINUTES,
+        batch_size: int = MARKER_BATCH_SIZE,
+        on_transition: Optional[TransitionHook] = None
+    ):
+        self.pending_status = pending_status
+        self.in_progress_status = in_progress_status
+        self.lease = timedelta(minutes=lease_minutes)
+        self.batch_size = max(1, batch_size)
+        self.on_transition = on_transition
+        self._collection = None
+        self.stats = {
+            "claims": 0,
+            "empty_claims": 0,
+            "lease_renewals": 0,
+            "lease_expirations": 0,
+            "releases": 0,
+            "total_claim_ms": 0.0,
+            "max_claim_ms": 0.0
+        }
+
+    def start(self, collection):
+        """Bind the attempts collection (call from the app startup event)"""
+        self._collection = collection
+
+    def _record_claim(self, started: float, found: bool):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats["claims" if found else "empty_claims"] += 1
+        self.stats["total_claim_ms"] += elapsed_ms
+        self.stats["max_claim_ms"] = round(max(self.stats["max_claim_ms"], elapsed_ms), 2)
+
+    async def _notify(self, from_status: str, to_status: str, count: int):
+        if count and self.on_transition is not None:
+            await self.on_transition(from_status, to_status, count)
+
+    def _claim_update(self, marker_id: str, now: datetime) -> Dict:
+        return {
+            "$set": {
+                "status": self.in_progress_status,
+                "marking_assigned_to": marker_id,
+                "marking_started_at": now,
+                "deadline_at": now + self.lease
+            }
+        }
+
+    async def claim_next(
+        self,
+        marker_id: str,
+        grade: Optional[str] = None,
+        language: Optional[str] = None,
+        projection: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """Lease the oldest pending paper matching the marker's grade/language, if any"""
+        query = {"status": self.pending_status}
+        if grade:
+            query["grade"] = grade
+        if language:
+            query["language"] = language
+
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        paper = await self._collection.find_one_and_update(
+            query,
+            self._claim_update(marker_id, now),
+            sort=[("created_at", 1)],
+            projection=projection or {"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        self._record_claim(started, paper is not None)
+        if paper is not None:
+            await self._notify(self.pending_status, self.in_progress_status, 1)
+        return paper
+
+    async def held(self, marker_id: str, projection: Optional[Dict] = None) -> List[Dict]:
+        """Papers currently leased to a marker, oldest claim first"""
+        return await self._collection.find(
+            {"status": self.in_progress_status, "marking_assigned_to": marker_id},
+            projection or {"_id": 0}
+        ).sort("marking_started_at", 1).to_list(self.batch_size * 2)
+
+    async def fill(
+        self,
+        marker_id: str,
+        grade: Optional[str] = None,
+        language: Optional[str] = None,
+        projection: Optional[Dict] = None
+    ) -> List[Dict]:
+        """Top a marker's held papers up to batch_size; returns everything they hold"""
+        papers = await self.held(marker_id, projection)
+        while len(papers) < self.batch_size:
+            paper = await self.claim_next(marker_id, grade, language, projection)
+            if paper is None:
+                break
+            papers.append(paper)
+        return papers
+
+    async def claim(self, attempt_id: str, marker_id: str) -> bool:
+        """Lease a specific pending paper"""
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        result = await self._collection.update_one(
+            {"id": attempt_id, "status": self.pending_status},
+            self._claim_update(marker_id, now)
+        )
+        self._record_claim(started, result.modified_count == 1)
+        await self._notify(self.pending_status, self.in_progress_status, result.modified_count)
+        return result.modified_count == 1
+
+    async def renew(self, attempt_id: str, marker_id: str) -> Optional[datetime]:
+        """Extend the marker's lease on a paper; None if the lease was lost"""
+        deadline = datetime.now(timezone.utc) + self.lease
+        result = await self._collection.update_one(
+            {"id": attempt_id, "status": self.in_progress_status, "marking_assigned_to": marker_id},
+            {"$set": {"deadline_at": deadline}}
+        )
+        if result.modified_count == 0:
+            return None
+        self.stats["lease_renewals"] += 1
+        return deadline
+
+    async def release(self, attempt_id: str, marker_id: str) -> bool:
+        """Hand a leased paper back to the queue before its lease runs out"""
+        result = await self._collection.update_one(
+            {"id": attempt_id, "status": self.in_progress_status, "marking_assigned_to": marker_id},
+            {
+                "$set": {"status": self.pending_status, "marking_assigned_to": None},
+                "$unset": {"deadline_at": "", "marking_started_at": ""}
+            }
+        )
+        if result.modified_count:
+            self.stats["releases"] += 1
+            await self._notify(self.in_progress_status, self.pending_status, 1)
+        return result.modified_count == 1
+
+    async def release_expired(self, attempts: List[Dict], now: datetime) -> int:
+        """Deadline sweeper stage: return papers with an expired lease to the queue"""
+        result = await self._collection.update_many(
+            {"id": {"$in": [a["id"] for a in attempts]}, "status": self.in_progress_status, "deadline_at": {"$lte": now}},
+            {
+                "$set": {"status": self.pending_status, "marking_assigned_to": None},
+                "$unset": {"deadline_at": "", "marking_started_at": ""},
+                "$inc": {"marking_lease_expirations": 1}
+            }
+        )
+        self.stats["lease_expirations"] += result.modified_count
+        await self._notify(self.in_progress_status, self.pending_status, result.modified_count)
+        if result.modified_count:
+            logger.info(f"Returned {result.modified_count} papers with expired marking leases to the queue")
+        return result.modified_count
+
+    async def queue_depth(self) -> Dict:
+        """Pending papers per grade/language, plus the number out on lease"""
+        pipeline = [
+            {"$match": {"status": {"$in": [self.pending_status, self.in_progress_status]}}},
+            {"$group": {"_id": {"status": "$status", "grade": "$grade", "language": "$language"}, "count": {"$sum": 1}}}
+        ]
+        depth = {"pending": 0, "leased": 0, "pending_by_queue": {}}
+        async for row in self._collection.aggregate(pipeline):
+            key = row["_id"]
+            if key.get("status") == self.pending_status:
+                depth["pending"] += row["count"]
+                queue = f"{key.get('grade') or 'any'}/{key.get('language') or 'any'}"
+                depth["pending_by_queue"][queue] = depth["pending_by_queue"].get(queue, 0) + row["count"]
+            else:
+                depth["leased"] += row["count"]
+        return depth
+
+    def metrics(self) -> Dict:
+        attempts = self.stats["claims"] + self.stats["empty_claims"]
+        return {
+            "lease_minutes": int(self.lease.total_seconds() // 60),
+            "batch_size": self.batch_size,
+            "claims": self.stats["claims"],
+            "empty_claims": self.stats["empty_claims"],
+            "lease_renewals": self.stats["lease_renewals"],
+            "lease_expirations": self.stats["lease_expirations"],
+            "releases": self.stats["releases"],
+            "avg_claim_ms": round(self.stats["total_claim_ms"] / attempts, 2) if attempts else 0.0,
+            "max_claim_ms": self.stats["max_claim_ms"]
+        }
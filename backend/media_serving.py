@@ -0,0 +1,134 @@
+"""
+Media serving helpers for the exam platform
+Signed expiring media URLs, HTTP Range parsing and a file response that uses zero-copy sendfile when the server offers it
+"""
+
+import hashlib
+import hmac
+import logging
+import os
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Signed URL configuration from environment
+MEDIA_URL_TTL_SECONDS = int(os.environ.get("MEDIA_URL_TTL_SECONDS", 6 * 3600))
+# Expiry times are rounded up to this step so a page reload yields the same URL (and a browser cache hit)
+MEDIA_URL_EXPIRY_STEP_SECONDS = int(os.environ.get("MEDIA_URL_EXPIRY_STEP_SECONDS", 3600))
+
+SEND_CHUNK_BYTES = 256 * 1024
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+class RangeNotSatisfiable(Exception):
+    """The Range header does not overlap the file"""
+
+
+class MediaUrlSigner:
+    """HMAC-signed, expiring URLs for /api/media/{key}"""
+
+    def __init__(
+        self,
+        secret: str,
+        ttl_seconds: int = MEDIA_URL_TTL_SECONDS,
+        expiry_step_seconds: int = MEDIA_URL_EXPIRY_STEP_SECONDS,
+        route_prefix: str = "/api/media"
+    ):
+        self.secret = secret.encode()
+        self.ttl = ttl_seconds
+        self.step = max(1, expiry_step_seconds)
+        self.route_prefix = route_prefix
+
+    def _signature(self, key: str, expires: int) -> str:
+        return hmac.new(self.secret, f"{key}:{expires}".encode(), hashlib.sha256).hexdigest()[:32]
+
+    def sign(self, key: str) -> str:
+        expires = (int(time.time()) + self.ttl) // self.step * self.step + self.step
+        return f"{self.route_prefix}/{quote(key)}?expires={expires}&sig={self._signature(key, expires)}"
+
+    def verify(self, key: str, expires: int, signature: str) -> bool:
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self._signature(key, expires), signature or "")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) for a single-range `bytes=` header, or None to send the whole file
+
+    Multi-range requests are answered with the full file, which RFC 9110 allows.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text == "":
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names this ETag (weak comparison, as RFC 9110 requires for it)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+
+class MediaFileResponse(Response):
+    """Sends [start, end] of a file, via zero-copy sendfile when the ASGI server supports it"""
+
+    def __init__(
+        self,
+        path: str,
+        start: int,
+        end: int,
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        media_type: Optional[str] = None
+    ):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.count = end - start + 1
+        self.headers["content-length"] = str(self.count)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        handle = await run_in_threadpool(open, self.path, "rb")
+        try:
+            if ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+                await send({"type": ZEROCOPY_EXTENSION, "file": handle, "offset": self.start, "count": self.count})
+                return
+            await run_in_threadpool(handle.seek, self.start)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await run_in_threadpool(handle.read, min(SEND_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # File shrank underneath us; end the response rather than hang
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            await run_in_threadpool(handle.close)
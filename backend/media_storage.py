@@ -0,0 +1,262 @@
+"""
+Content-addressed media storage for the exam platform
+Stores uploaded blobs under their SHA-256 on the local filesystem or an S3-compatible bucket
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+    S3_AVAILABLE = True
+except ImportError:
+    S3_AVAILABLE = False
+    logging.warning("boto3 not installed - S3 media storage disabled")
+
+logger = logging.getLogger(__name__)
+
+# Storage configuration from environment
+STORAGE_BACKEND = os.environ.get("MEDIA_STORAGE_BACKEND", "local")  # "local" or "s3"
+MEDIA_ROOT = os.environ.get("MEDIA_ROOT", os.path.join(os.path.dirname(__file__), "uploads"))
+# Stored references are "/uploads/<key>" for every backend; clients only ever get signed /api/media URLs
+MEDIA_URL_PREFIX = "/uploads"
+S3_BUCKET = os.environ.get("MEDIA_S3_BUCKET", "")
+S3_ENDPOINT_URL = os.environ.get("MEDIA_S3_ENDPOINT_URL") or None  # e.g. a MinIO server
+# Only used to recognise absolute bucket URLs stored by older versions
+S3_PUBLIC_URL = os.environ.get("MEDIA_S3_PUBLIC_URL", "")
+# Lifetime of the presigned bucket URL /api/media redirects to (the bucket itself stays private)
+S3_PRESIGNED_URL_SECONDS = int(os.environ.get("MEDIA_S3_PRESIGNED_URL_SECONDS", 300))
+
+# Blobs never change once written, so caches may keep them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def blob_key(sha256: str, ext: str) -> str:
+    """Sharded key for a blob, e.g. blobs/ab/cd/abcd....jpg"""
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext.lstrip('.').lower()}"
+
+
+class StorageBackend(ABC):
+    """Where blobs live. Keys are content addresses, so a put of an existing key is a no-op."""
+
+    name = "abstract"
+    # Absolute URL prefixes older versions stored instead of MEDIA_URL_PREFIX references
+    legacy_url_prefixes: Tuple[str, ...] = ()
+
+    @abstractmethod
+    async def put(self, key: str, src_path: str, content_type: Optional[str] = None, keep_source: bool = False) -> bool:
+        """Store the file at src_path under key; returns True if the key already existed"""
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    def url(self, key: str) -> str:
+        """Backend-independent reference stored in documents (signed for clients by the API)"""
+        return f"{MEDIA_URL_PREFIX}/{key}"
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of the blob, for backends that have one"""
+        return None
+
+    def download_url(self, key: str) -> Optional[str]:
+        """Short-lived direct URL, for backends without local files"""
+        return None
+
+
+class LocalStorageBackend(StorageBackend):
+    """Blobs under MEDIA_ROOT with a two-level directory fan-out, served through /api/media"""
+
+    name = "local"
+
+    def __init__(self, root: str = MEDIA_ROOT):
+        self.root = root
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def _put(self, key: str, src_path: str, keep_source: bool) -> bool:
+        target = self.local_path(key)
+        if os.path.exists(target):
+            if not keep_source:
+                os.remove(src_path)
+            return True
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if not keep_source:
+            os.replace(src_path, target)
+            return False
+        try:
+            os.link(src_path, target)
+        except FileExistsError:
+            return True
+        except OSError:
+            # Different filesystem or no hard links: copy, then move into place atomically
+            tmp_path = f"{target}.part-{uuid.uuid4().hex[:8]}"
+            shutil.copyfile(src_path, tmp_path)
+            os.replace(tmp_path, target)
+        return False
+
+    async def put(self, key: str, src_path: str, content_type: Optional[str] = None, keep_source: bool = False) -> bool:
+        return await asyncio.to_thread(self._put, key, src_path, keep_source)
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(os.path.exists, self.local_path(key))
+
+    async def delete(self, key: str):
+        try:
+            await asyncio.to_thread(os.remove, self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+
+
+class S3StorageBackend(StorageBackend):
+    """Blobs in a private S3-compatible bucket (AWS S3, MinIO), read through presigned URLs"""
+
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str = S3_BUCKET,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        public_url: str = S3_PUBLIC_URL,
+        presigned_url_seconds: int = S3_PRESIGNED_URL_SECONDS
+    ):
+        if not S3_AVAILABLE:
+            raise RuntimeError("boto3 is required for the S3 media storage backend")
+        if not bucket:
+            raise RuntimeError("MEDIA_S3_BUCKET must be set for the S3 media storage backend")
+        self.bucket = bucket
+        # boto3 clients are thread-safe; calls run in the default thread pool
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.presigned_url_seconds = presigned_url_seconds
+        if public_url:
+            legacy = public_url.rstrip("/")
+        elif endpoint_url:
+            legacy = f"{endpoint_url.rstrip('/')}/{bucket}"
+        else:
+            legacy = f"https://{bucket}.s3.amazonaws.com"
+        self.legacy_url_prefixes = (f"{legacy}/",)
+
+    def _exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def _put(self, key: str, src_path: str, content_type: Optional[str], keep_source: bool) -> bool:
+        existed = self._exists(key)
+        if not existed:
+            extra = {"CacheControl": IMMUTABLE_CACHE_CONTROL}
+            if content_type:
+                extra["ContentType"] = content_type
+            self.client.upload_file(src_path, self.bucket, key, ExtraArgs=extra)
+        if not keep_source:
+            os.remove(src_path)
+        return existed
+
+    async def put(self, key: str, src_path: str, content_type: Optional[str] = None, keep_source: bool = False) -> bool:
+        return await asyncio.to_thread(self._put, key, src_path, content_type, keep_source)
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(self._exists, key)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=key)
+
+    def download_url(self, key: str) -> str:
+        # Signed locally by boto3, no request to the bucket
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=self.presigned_url_seconds
+        )
+
+
+class MediaStore:
+    """Content-addressed store in front of a StorageBackend
+
+    Uploads are first streamed into a local staging directory and hashed;
+    put_file then moves them to their content address, so identical bytes
+    (e.g. a parent retrying the same photo) are stored once.
+    """
+
+    def __init__(self, backend: StorageBackend, staging_dir: str = os.path.join(MEDIA_ROOT, "staging")):
+        self.backend = backend
+        self.staging_dir = staging_dir
+        os.makedirs(staging_dir, exist_ok=True)
+        self.stats = {"stored": 0, "deduplicated": 0, "bytes_stored": 0, "bytes_deduplicated": 0}
+
+    def staging_path(self, ext: str) -> str:
+        return os.path.join(self.staging_dir, f"{uuid.uuid4().hex}.{ext.lstrip('.').lower()}")
+
+    async def put_file(
+        self,
+        src_path: str,
+        sha256: str,
+        ext: str,
+        content_type: Optional[str] = None,
+        keep_source: bool = False
+    ) -> Dict:
+        """Store a staged file under its content address; removes it unless keep_source"""
+        size = os.path.getsize(src_path)
+        key = blob_key(sha256, ext)
+        deduplicated = await self.backend.put(key, src_path, content_type, keep_source)
+        if deduplicated:
+            self.stats["deduplicated"] += 1
+            self.stats["bytes_deduplicated"] += size
+        else:
+            self.stats["stored"] += 1
+            self.stats["bytes_stored"] += size
+        return {"key": key, "url": self.backend.url(key), "sha256": sha256, "bytes": size, "deduplicated": deduplicated}
+
+    def url(self, key: str) -> str:
+        return self.backend.url(key)
+
+    def key_for(self, stored_url: Optional[str]) -> Optional[str]:
+        """Storage key behind a stored reference, or None for URLs this store does not own"""
+        if not stored_url:
+            return None
+        for prefix in (f"{MEDIA_URL_PREFIX}/",) + self.backend.legacy_url_prefixes:
+            if stored_url.startswith(prefix):
+                return stored_url[len(prefix):]
+        return None
+
+    def download_url(self, key: str) -> Optional[str]:
+        return self.backend.download_url(key)
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self.backend.local_path(key)
+
+    async def discard_staged(self, path: str):
+        try:
+            await asyncio.to_thread(os.remove, path)
+        except FileNotFoundError:
+            pass
+
+    def metrics(self) -> Dict:
+        return {"backend": self.backend.name, **self.stats}
+
+
+def create_media_store() -> MediaStore:
+    if STORAGE_BACKEND == "s3":
+        backend = S3StorageBackend()
+    else:
+        backend = LocalStorageBackend()
+    logger.info(f"Media storage: {backend.name}")
+    return MediaStore(backend)
+
+
+# Shared per-process instance
+media_store = create_media_store()
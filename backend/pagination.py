@@ -0,0 +1,104 @@
+"""
+Keyset pagination for list endpoints
+Pages through a collection in (created_at, id) order with opaque cursors instead of skip/limit caps
+"""
+
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple, Union
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    """The cursor was not produced by encode_cursor"""
+
+
+def _utc(value: Union[datetime, str, None]) -> Optional[datetime]:
+    """Timezone-aware UTC datetime; accepts the ISO strings some older rows still hold"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def encode_cursor(created_at: Union[datetime, str, None], item_id: str) -> str:
+    """Opaque cursor pointing just past the given item"""
+    created = _utc(created_at).isoformat() if created_at is not None else None
+    raw = json.dumps([created, item_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], str]:
+    try:
+        created, item_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(item_id, str):
+            raise TypeError("cursor id must be a string")
+        return (_utc(datetime.fromisoformat(created)) if created is not None else None), item_id
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def keyset_filter(cursor: str, direction: int = -1) -> Dict:
+    """Filter matching the items after the cursor in (created_at, id) order
+
+    Documents without created_at sort before every date, so in descending
+    order they come last and in ascending order first.
+    """
+    created_at, item_id = decode_cursor(cursor)
+    beyond = "$lt" if direction < 0 else "$gt"
+    if created_at is None:
+        if direction < 0:
+            return {"created_at": None, "id": {beyond: item_id}}
+        return {"$or": [{"created_at": None, "id": {beyond: item_id}}, {"created_at": {"$ne": None}}]}
+    return {"$or": [
+        {"created_at": {beyond: created_at}},
+        {"created_at": created_at, "id": {beyond: item_id}}
+    ]}
+
+
+async def keyset_page(
+    collection,
+    query: Dict,
+    projection: Optional[Dict] = None,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    direction: int = -1
+) -> Tuple[List[Dict], Optional[str]]:
+    """One page of `query` in (created_at, id) order (newest first by default) and the cursor for the next
+
+    The projection must keep `created_at` and `id`. Back each query shape
+    with an index ending in (created_at, id) so a page reads `limit + 1`
+    index entries however deep it is.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        after = keyset_filter(cursor, direction)
+        query = {"$and": [query, after]} if query else after
+    items = await collection.find(query, projection or {"_id": 0}).sort(
+        [("created_at", direction), ("id", direction)]
+    ).limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(last.get("created_at"), last["id"])
+    return items, next_cursor
+
+
+async def migrate_string_created_at(collection) -> int:
+    """Convert ISO-string created_at values to BSON dates (idempotent; sweeper job)
+
+    Strings sort after every date in MongoDB's type order, so a string row
+    is never matched by a date cursor and cannot be reached past page one.
+    Unparseable values are left as they are.
+    """
+    result = await collection.update_many(
+        {"created_at": {"$type": "string"}},
+        [{"$set": {"created_at": {"$dateFromString": {"dateString": "$created_at", "onError": "$created_at"}}}}]
+    )
+    return result.modified_count
@@ -0,0 +1,149 @@
+"""
+Password hashing service for the exam platform
+Runs bcrypt hashing/verification on a bounded worker pool so the event loop stays responsive
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+# Worker pool configuration from environment
+HASH_EXECUTOR_KIND = os.environ.get("PASSWORD_HASH_EXECUTOR", "thread")  # "thread" or "process"
+HASH_MAX_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 200))
+HASH_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("PASSWORD_HASH_QUEUE_TIMEOUT", 10))
+
+# Module-level context so process pool workers can build their own copy on import
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return pwd_context.verify(plain_password, hashed_password)
+    except (ValueError, TypeError):
+        # Malformed or missing hash in the user document
+        return False
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full or a job waited too long for a worker"""
+
+
+class PasswordHasher:
+    """Async facade over a bounded bcrypt worker pool
+
+    At most `max_workers` jobs run at once; up to `max_pending` more may wait
+    for a slot. Anything beyond that is rejected with PasswordHasherBusy so a
+    login storm degrades into fast 503s instead of an unbounded queue.
+    """
+
+    def __init__(
+        self,
+        kind: str = HASH_EXECUTOR_KIND,
+        max_workers: int = HASH_MAX_WORKERS,
+        max_pending: int = HASH_MAX_PENDING,
+        queue_timeout: float = HASH_QUEUE_TIMEOUT_SECONDS
+    ):
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._running = 0
+        self.stats = {
+            "completed": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "max_queue_depth": 0,
+            "total_wait_ms": 0.0,
+            "total_run_ms": 0.0
+        }
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                # bcrypt releases the GIL, so threads give real parallelism
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="password-hash"
+                )
+            logger.info(f"Password hashing pool started ({self.kind}, {self.max_workers} workers)")
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+        if self._waiting >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise PasswordHasherBusy("Password hashing queue is full")
+
+        self._waiting += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self._waiting)
+        queued_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            raise PasswordHasherBusy("Timed out waiting for a password hashing worker")
+        finally:
+            self._waiting -= 1
+
+        started_at = time.perf_counter()
+        self.stats["total_wait_ms"] += (started_at - queued_at) * 1000
+        self._running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self._running -= 1
+            self._slots.release()
+            self.stats["completed"] += 1
+            self.stats["total_run_ms"] += (time.perf_counter() - started_at) * 1000
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(_verify_password, plain_password, hashed_password)
+
+    def metrics(self) -> Dict:
+        completed = self.stats["completed"]
+        return {
+            "executor": self.kind,
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "queue_depth": self._waiting,
+            "running": self._running,
+            "completed": completed,
+            "rejected": self.stats["rejected"],
+            "timed_out": self.stats["timed_out"],
+            "max_queue_depth": self.stats["max_queue_depth"],
+            "avg_wait_ms": round(self.stats["total_wait_ms"] / completed, 2) if completed else 0.0,
+            "avg_run_ms": round(self.stats["total_run_ms"] / completed, 2) if completed else 0.0
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Password hashing pool stopped")
+
+
+# Shared per-process instance
+password_hasher = PasswordHasher()
@@ -0,0 +1,178 @@
+"""
+Marker payment ledger for the exam platform
+Relays payment records written atomically with mark submission into the ledger and keeps per-marker rollups
+"""
+
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Ledger configuration from environment
+MARKER_PAYMENT_PER_PAPER = float(os.environ.get("MARKER_PAYMENT_PER_PAPER", 50))
+OUTBOX_RELAY_BATCH_SIZE = 500
+
+EMPTY_SUMMARY = {"papers_marked": 0, "total_pending": 0, "total_paid": 0, "last_payment_at": None}
+
+
+def marker_payment_totals_pipeline(match: Dict) -> list:
+    """Per-marker payment totals with the marker's name and bank details, computed server-side"""
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": "$marker_id",
+            "total_papers": {"$sum": 1},
+            "total_pending": {"$sum": {"$cond": [{"$eq": ["$status", "pending"]}, "$amount", 0]}},
+            "total_paid": {"$sum": {"$cond": [{"$eq": ["$status", "pending"]}, 0, "$amount"]}}
+        }},
+        {"$sort": {"total_pending": -1, "_id": 1}},
+        {"$lookup": {
+            "from": "users",
+            "localField": "_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "full_name": 1, "bank_details": 1}}],
+            "as": "marker"
+        }},
+        {"$project": {
+            "_id": 0,
+            "marker_id": "$_id",
+            "marker_name": {"$ifNull": [{"$first": "$marker.full_name"}, "Unknown"]},
+            "bank_details": {"$ifNull": [{"$first": "$marker.bank_details"}, None]},
+            "total_papers": 1,
+            "total_pending": 1,
+            "total_paid": 1
+        }}
+    ]
+
+
+class MarkerPaymentLedger:
+    """Outbox relay from attempts into `marker_payments`, plus `marker_payment_summaries`
+
+    submit-marks stores the payment row inside the attempt it completes
+    (`payment_outbox`), so the marks and the payment are written by one
+    single-document update and cannot be separated by a crash. The relay
+    upserts outbox rows into the append-only ledger, keyed uniquely by
+    attempt_id so a retried relay or a double submission pays once, and bumps
+    the marker's summary. A periodic rollup recomputes summaries from the
+    ledger, which also absorbs status changes made by admins.
+    """
+
+    def __init__(self):
+        self._db = None
+        self.stats = {"relayed": 0, "duplicates": 0, "rollups": 0, "last_rollup_ms": 0.0}
+
+    def start(self, db):
+        """Bind the database (call from the app startup event)"""
+        self._db = db
+
+    async def ensure_indexes(self):
+        await self._db.marker_payments.create_index([("marker_id", 1), ("created_at", -1), ("id", -1)])
+        await self._db.marker_payments.create_index([("status", 1), ("marker_id", 1)])
+        await self._db.marker_payment_summaries.create_index("marker_id", unique=True)
+        await self._db.attempts.create_index("payment_outbox.id", sparse=True)
+        try:
+            await self._db.marker_payments.create_index("attempt_id", unique=True)
+        except OperationFailure as e:
+            # Duplicate rows from before the outbox; the relay still upserts by attempt_id
+            logger.warning(f"Could not create unique marker_payments.attempt_id index: {e}")
+
+    async def relay(self, attempt_ids: Optional[Iterable[str]] = None) -> int:
+        """Move pending outbox payments into the ledger; safe to run repeatedly"""
+        query = {"payment_outbox": {"$exists": True}}
+        if attempt_ids is not None:
+            query["id"] = {"$in": list(attempt_ids)}
+        pending = await self._db.attempts.find(
+            query, {"_id": 0, "id": 1, "payment_outbox": 1}
+        ).to_list(OUTBOX_RELAY_BATCH_SIZE)
+
+        relayed = 0
+        for attempt in pending:
+            payment = attempt["payment_outbox"]
+            try:
+                result = await self._db.marker_payments.update_one(
+                    {"attempt_id": attempt["id"]},
+                    {"$setOnInsert": payment},
+                    upsert=True
+                )
+                inserted = result.upserted_id is not None
+            except DuplicateKeyError:
+                # Another worker relayed the same outbox row concurrently
+                inserted = False
+            if inserted:
+                summary = await self._db.marker_payment_summaries.update_one(
+                    {"marker_id": payment["marker_id"]},
+                    {
+                        "$inc": {"papers_marked": 1, "total_pending": payment["amount"]},
+                        "$max": {"last_payment_at": payment["created_at"]},
+                        "$set": {"updated_at": datetime.now(timezone.utc)}
+                    }
+                )
+                if summary.matched_count == 0:
+                    # First summary for this marker: build it from their whole ledger
+                    await self.rollup([payment["marker_id"]])
+                relayed += 1
+            else:
+                self.stats["duplicates"] += 1
+            await self._db.attempts.update_one(
+                {"id": attempt["id"], "payment_outbox.id": payment["id"]},
+                {"$unset": {"payment_outbox": ""}}
+            )
+        self.stats["relayed"] += relayed
+        return relayed
+
+    async def rollup(self, marker_ids: Optional[Iterable[str]] = None):
+        """Recompute marker summaries from the ledger (all markers, or just the given ones)"""
+        started = time.perf_counter()
+        match = {} if marker_ids is None else {"marker_id": {"$in": list(marker_ids)}}
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": "$marker_id",
+                "papers_marked": {"$sum": 1},
+                "total_pending": {"$sum": {"$cond": [{"$eq": ["$status", "pending"]}, "$amount", 0]}},
+                "total_paid": {"$sum": {"$cond": [{"$eq": ["$status", "pending"]}, 0, "$amount"]}},
+                "last_payment_at": {"$max": "$created_at"}
+            }},
+            {"$project": {
+                "_id": 0,
+                "marker_id": "$_id",
+                "papers_marked": 1,
+                "total_pending": 1,
+                "total_paid": 1,
+                "last_payment_at": 1,
+                "updated_at": "$$NOW"
+            }},
+            {"$merge": {
+                "into": "marker_payment_summaries",
+                "on": "marker_id",
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }}
+        ]
+        await self._db.marker_payments.aggregate(pipeline).to_list(None)
+        self.stats["rollups"] += 1
+        self.stats["last_rollup_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    async def run_periodic(self):
+        """Sweeper job: relay anything a crash left in an outbox, then refresh every summary"""
+        await self.relay()
+        await self.rollup()
+
+    async def summary(self, marker_id: str) -> Dict:
+        doc = await self._db.marker_payment_summaries.find_one({"marker_id": marker_id}, {"_id": 0})
+        if doc is None:
+            await self.rollup([marker_id])
+            doc = await self._db.marker_payment_summaries.find_one({"marker_id": marker_id}, {"_id": 0})
+        return {**EMPTY_SUMMARY, "marker_id": marker_id, **(doc or {})}
+
+    def metrics(self) -> Dict:
+        return dict(self.stats)
+
+
+# Shared per-process instance
+payment_ledger = MarkerPaymentLedger()
@@ -5,17 +5,35 @@ Automatically sends WhatsApp progress summaries to parents every week
 
 import asyncio
 import logging
+import time
+import uuid
 from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Optional
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 logger = logging.getLogger(__name__)
 
+# Weekly fan-out: students per page, reports in flight, and how long a run's lease outlives its last checkpoint
+REPORT_PAGE_SIZE = 200
+REPORT_CONCURRENCY = 16
+REPORT_LEASE_SECONDS = 600
+REPORT_RUN_TYPE = "weekly_progress_run"
+REPORT_OUTCOMES = ("sent", "inactive", "no_phone", "failed", "already_sent")
+REPORT_CONTACT_FILTER = [
+    {"parent_phone": {"$exists": True, "$ne": None}},
+    {"phone": {"$exists": True, "$ne": None}}
+]
+REPORT_STUDENT_PROJECTION = {"_id": 0, "id": 1, "full_name": 1, "parent_phone": 1, "phone": 1, "parent_name": 1}
+
 # Global scheduler instance
 progress_scheduler: Optional[AsyncIOScheduler] = None
 _db = None
 _notify_func = None
+_lease_owner = str(uuid.uuid4())
 
 
 def init_progress_scheduler(db, notify_progress_func):
@@ -36,6 +54,19 @@ def init_progress_scheduler(db, notify_progress_func):
         replace_existing=True
     )
     
+    # Pick up a run that a crash or restart interrupted: now, and again whenever
+    # its lease may have lapsed (a restart can come before the old lease expires)
+    progress_scheduler.add_job(
+        resume_interrupted_reports,
+        trigger=IntervalTrigger(seconds=REPORT_LEASE_SECONDS),
+        next_run_time=datetime.now(timezone.utc),
+        max_instances=1,
+        coalesce=True,
+        id='resume_progress_report_job',
+        name='Resume interrupted weekly progress reports',
+        replace_existing=True
+    )
+    
     progress_scheduler.start()
     logger.info("Weekly progress report scheduler started - runs every Sunday at 6 PM UTC")
 
@@ -49,41 +80,171 @@ def shutdown_progress_scheduler():
 
 
 async def send_weekly_progress_reports():
-    """Send weekly progress reports to all active students' parents"""
+    """Send weekly progress reports to all active students' parents
+
+    Students are walked in `id` order one page at a time, and each page is
+    fanned out to at most REPORT_CONCURRENCY concurrent reports. The run is a
+    document in notification_logs, leased by one process and checkpointed
+    after every page, so a crashed run resumes after its last finished page
+    (resume_interrupted_reports polls for lapsed leases) instead of starting over.
+    """
     global _db, _notify_func
     
     if _db is None or _notify_func is None:
         logger.warning("Progress report service not properly initialized")
         return
     
+    now = datetime.now(timezone.utc)
     try:
-        logger.info("Starting weekly progress report generation...")
-        
-        # Get all active students with parent contact info
-        students = await _db.users.find({
-            "role": "student",
-            "$or": [
-                {"parent_phone": {"$exists": True, "$ne": None}},
-                {"phone": {"$exists": True, "$ne": None}}
-            ]
-        }).to_list(length=1000)
-        
-        logger.info(f"Found {len(students)} students for progress reports")
-        
-        for student in students:
+        await run_weekly_reports(f"weekly_progress:{now.strftime('%G-W%V')}", now)
+    except Exception as e:
+        logger.error(f"Error in weekly progress reports: {str(e)}")
+
+
+async def resume_interrupted_reports():
+    """Finish any weekly run left behind by a crashed process (at startup, then every REPORT_LEASE_SECONDS)
+
+    Runs still leased by a live process are skipped by claim_report_run.
+    """
+    if _db is None or _notify_func is None:
+        return
+    try:
+        async for run in _db.notification_logs.find(
+            {"type": REPORT_RUN_TYPE, "status": "running"},
+            {"_id": 0, "run_id": 1, "week_end": 1}
+        ):
+            await run_weekly_reports(run["run_id"], datetime.fromisoformat(run["week_end"]))
+    except Exception as e:
+        logger.error(f"Error resuming weekly progress reports: {str(e)}")
+
+
+async def ensure_report_indexes():
+    await _db.notification_logs.create_index(
+        "run_id", unique=True, partialFilterExpression={"type": REPORT_RUN_TYPE}
+    )
+    await _db.notification_logs.create_index([("run_id", 1), ("student_id", 1)])
+    await _db.users.create_index([("role", 1), ("id", 1)])
+    await _db.video_progress.create_index([("user_id", 1), ("last_watched", 1)])
+    await _db.workout_attempts.create_index([("user_id", 1), ("started_at", 1)])
+    await _db.enrollments.create_index([("student_id", 1), ("created_at", 1)])
+    await _db.scheduled_lessons.create_index([("student_id", 1), ("scheduled_time", 1)])
+
+
+async def claim_report_run(run_id: str, week_end: datetime) -> Optional[Dict]:
+    """Take the lease on a run, creating it on first call; None if it is finished or leased elsewhere"""
+    now = datetime.now(timezone.utc)
+    try:
+        return await _db.notification_logs.find_one_and_update(
+            {
+                "type": REPORT_RUN_TYPE,
+                "run_id": run_id,
+                "status": "running",
+                "$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}]
+            },
+            {
+                "$set": {"lease_owner": _lease_owner, "lease_until": now + timedelta(seconds=REPORT_LEASE_SECONDS)},
+                "$setOnInsert": {
+                    "week_start": (week_end - timedelta(days=7)).isoformat(),
+                    "week_end": week_end.isoformat(),
+                    "last_student_id": None,
+                    "stats": {name: 0 for name in REPORT_OUTCOMES},
+                    "pages": 0,
+                    "started_at": now.isoformat()
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            projection={"_id": 0}
+        )
+    except DuplicateKeyError:
+        # The run exists but is completed or still leased by another worker
+        return None
+
+
+async def run_weekly_reports(run_id: str, week_end: datetime):
+    await ensure_report_indexes()
+    run = await claim_report_run(run_id, week_end)
+    if run is None:
+        logger.info(f"Weekly progress run {run_id} is finished or owned by another worker")
+        return
+    
+    week_start = datetime.fromisoformat(run["week_start"])
+    week_end = datetime.fromisoformat(run["week_end"])
+    last_student_id = run.get("last_student_id")
+    stats = dict(run.get("stats") or {})
+    pages = run.get("pages", 0)
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(REPORT_CONCURRENCY)
+    logger.info(f"Weekly progress run {run_id} {'resumed after ' + last_student_id if last_student_id else 'started'}")
+    
+    async def report(student: Dict) -> str:
+        async with semaphore:
             try:
-                await send_student_progress_report(student)
+                return await send_student_progress_report(student, week_start, week_end, run_id)
             except Exception as e:
                 logger.error(f"Error sending progress for student {student.get('id')}: {str(e)}")
+                return "failed"
+    
+    while True:
+        query = {"role": "student", "$or": REPORT_CONTACT_FILTER}
+        if last_student_id is not None:
+            query["id"] = {"$gt": last_student_id}
+        students = await _db.users.find(query, REPORT_STUDENT_PROJECTION).sort("id", 1).to_list(REPORT_PAGE_SIZE)
+        if not students:
+            break
         
-        logger.info("Weekly progress reports completed")
+        # A page interrupted by a crash is redone; skip whoever it already reached
+        already_sent = set(await _db.notification_logs.distinct(
+            "student_id",
+            {"run_id": run_id, "student_id": {"$in": [student["id"] for student in students]}}
+        ))
+        outcomes = await asyncio.gather(*(
+            report(student) for student in students if student["id"] not in already_sent
+        ))
+        page_stats = {name: 0 for name in REPORT_OUTCOMES}
+        page_stats["already_sent"] = len(students) - len(outcomes)
+        for outcome in outcomes:
+            page_stats[outcome] += 1
         
-    except Exception as e:
-        logger.error(f"Error in weekly progress reports: {str(e)}")
+        last_student_id = students[-1]["id"]
+        pages += 1
+        for name, count in page_stats.items():
+            stats[name] = stats.get(name, 0) + count
+        checkpointed = await _db.notification_logs.update_one(
+            {"type": REPORT_RUN_TYPE, "run_id": run_id, "lease_owner": _lease_owner},
+            {"$set": {
+                "last_student_id": last_student_id,
+                "stats": stats,
+                "pages": pages,
+                "lease_until": datetime.now(timezone.utc) + timedelta(seconds=REPORT_LEASE_SECONDS),
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }}
+        )
+        if checkpointed.matched_count == 0:
+            logger.warning(f"Weekly progress run {run_id} lost its lease after page {pages}, stopping")
+            return
+        if len(students) < REPORT_PAGE_SIZE:
+            break
+    
+    elapsed = time.perf_counter() - started
+    await _db.notification_logs.update_one(
+        {"type": REPORT_RUN_TYPE, "run_id": run_id, "lease_owner": _lease_owner},
+        {
+            "$set": {"status": "completed", "finished_at": datetime.now(timezone.utc).isoformat()},
+            "$inc": {"elapsed_seconds": round(elapsed, 1)},
+            "$unset": {"lease_until": ""}
+        }
+    )
+    logger.info(f"Weekly progress run {run_id} completed in {elapsed:.1f}s: {stats}")
 
 
-async def send_student_progress_report(student: Dict):
-    """Generate and send progress report for a single student"""
+async def send_student_progress_report(
+    student: Dict,
+    week_start: Optional[datetime] = None,
+    week_end: Optional[datetime] = None,
+    run_id: Optional[str] = None
+) -> str:
+    """Generate and send progress report for a single student; returns the outcome for the run statistics"""
     global _db, _notify_func
     
     student_id = student.get("id")
@@ -93,19 +254,19 @@ async def send_student_progress_report(student: Dict):
     
     if not parent_phone:
         logger.warning(f"No parent phone for student {student_id}")
-        return
+        return "no_phone"
     
     # Calculate week date range
-    now = datetime.now(timezone.utc)
-    week_start = now - timedelta(days=7)
+    now = week_end or datetime.now(timezone.utc)
+    week_start = week_start or now - timedelta(days=7)
     
     # Get progress data for the past week
     progress_data = await get_student_weekly_progress(student_id, week_start, now)
     
     # Only send if there's some activity
     if progress_data["total_activities"] == 0:
-        logger.info(f"No activity for student {student_id} this week, skipping report")
-        return
+        logger.debug(f"No activity for student {student_id} this week, skipping report")
+        return "inactive"
     
     # Send the progress report
     result = await _notify_func(
@@ -118,38 +279,46 @@ async def send_student_progress_report(student: Dict):
     # Log the notification
     await _db.notification_logs.insert_one({
         "type": "weekly_progress",
+        "run_id": run_id,
         "student_id": student_id,
         "parent_phone": parent_phone,
         "progress_data": progress_data,
         "result": result,
         "week_start": week_start.isoformat(),
         "week_end": now.isoformat(),
-        "sent_at": now.isoformat()
+        "sent_at": datetime.now(timezone.utc).isoformat()
     })
     
     logger.info(f"Progress report sent for student {student_id}")
+    return "sent"
 
 
 async def get_student_weekly_progress(student_id: str, week_start: datetime, week_end: datetime) -> Dict:
     """Get comprehensive progress data for a student's week"""
     global _db
     
-    # Get video watch time
-    video_progress = await _db.video_progress.find({
-        "user_id": student_id,
-        "last_watched": {"$gte": week_start.isoformat(), "$lte": week_end.isoformat()}
-    }).to_list(length=100)
+    # The four activity sources are independent, so query them concurrently
+    window = {"$gte": week_start.isoformat(), "$lte": week_end.isoformat()}
+    video_progress, workout_attempts, enrollments, lessons_attended = await asyncio.gather(
+        _db.video_progress.find(
+            {"user_id": student_id, "last_watched": window},
+            {"_id": 0, "watch_time": 1, "completed": 1}
+        ).to_list(length=100),
+        _db.workout_attempts.find(
+            {"user_id": student_id, "started_at": window},
+            {"_id": 0, "status": 1, "score": 1}
+        ).to_list(length=100),
+        _db.enrollments.find({"student_id": student_id, "created_at": window}, {"_id": 1}).to_list(length=50),
+        _db.scheduled_lessons.find(
+            {"student_id": student_id, "scheduled_time": window, "status": {"$in": ["completed", "attended"]}},
+            {"_id": 1}
+        ).to_list(length=50)
+    )
     
     total_watch_time = sum(v.get("watch_time", 0) for v in video_progress)
     videos_watched = len(video_progress)
     videos_completed = len([v for v in video_progress if v.get("completed", False)])
     
-    # Get workout attempts
-    workout_attempts = await _db.workout_attempts.find({
-        "user_id": student_id,
-        "started_at": {"$gte": week_start.isoformat(), "$lte": week_end.isoformat()}
-    }).to_list(length=100)
-    
     workouts_completed = len([w for w in workout_attempts if w.get("status") == "completed"])
     workouts_started = len(workout_attempts)
     
@@ -157,19 +326,6 @@ async def get_student_weekly_progress(student_id: str, week_start: datetime, wee
     completed_with_score = [w for w in workout_attempts if w.get("score") is not None]
     avg_score = sum(w.get("score", 0) for w in completed_with_score) / len(completed_with_score) if completed_with_score else 0
     
-    # Get courses enrolled/started this week
-    enrollments = await _db.enrollments.find({
-        "student_id": student_id,
-        "created_at": {"$gte": week_start.isoformat(), "$lte": week_end.isoformat()}
-    }).to_list(length=50)
-    
-    # Get scheduled lessons attended
-    lessons_attended = await _db.scheduled_lessons.find({
-        "student_id": student_id,
-        "scheduled_time": {"$gte": week_start.isoformat(), "$lte": week_end.isoformat()},
-        "status": {"$in": ["completed", "attended"]}
-    }).to_list(length=50)
-    
     # Determine skill highlights based on activity
     skill_highlights = []
     if workouts_completed > 0:
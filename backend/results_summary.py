@@ -0,0 +1,134 @@
+"""
+Per-student results summaries for the progress views
+Keeps one compact document per student with their latest completed results, rebuilt by a single aggregation
+"""
+
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+RESULTS_LIMIT = 50
+EXAM_SUMMARY_FIELDS = ("id", "title", "month", "grade")
+
+
+def student_results_pipeline(student_id: str, completed_status: str, limit: int = RESULTS_LIMIT) -> List[Dict]:
+    """A student's latest completed attempts, each joined to a narrow projection of its exam"""
+    return [
+        {"$match": {"student_id": student_id, "status": completed_status}},
+        {"$sort": {"created_at": -1}},
+        {"$limit": limit},
+        {"$lookup": {
+            "from": "exams",
+            "localField": "exam_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, **{field: 1 for field in EXAM_SUMMARY_FIELDS}}}],
+            "as": "exam"
+        }},
+        {"$project": {
+            "_id": 0,
+            "exam": {"$ifNull": [{"$first": "$exam"}, None]},
+            "mcq_score": {"$ifNull": ["$mcq_score", 0]},
+            "written_score": {"$ifNull": ["$written_score", 0]},
+            "total_score": {"$ifNull": ["$total_score", 0]},
+            "completed_at": {"$ifNull": ["$marking_completed_at", None]}
+        }}
+    ]
+
+
+class ResultsSummaries:
+    """Documents in `student_results_summary`, one per student
+
+    Completing or regrading an attempt marks the student's summary stale by
+    bumping its generation; a rebuild only writes back if the generation is
+    unchanged, so a rebuild that read the attempts before a newer change
+    cannot overwrite the fresher state. Readers rebuild stale or missing
+    summaries themselves, so the background refresh is only a warm-up.
+    """
+
+    def __init__(self, completed_status: str):
+        self.completed_status = completed_status
+        self._db = None
+        self.stats = {"hits": 0, "rebuilds": 0, "invalidations": 0, "lost_races": 0, "last_rebuild_ms": 0.0}
+
+    def start(self, db):
+        """Bind the database (call from the app startup event)"""
+        self._db = db
+
+    async def ensure_indexes(self):
+        await self._db.student_results_summary.create_index("student_id", unique=True)
+        await self._db.student_results_summary.create_index("results.exam.id")
+        await self._db.attempts.create_index([("student_id", 1), ("status", 1), ("created_at", -1)])
+
+    async def invalidate(self, student_ids: Iterable[str]):
+        """Mark summaries stale; called after attempts of these students change"""
+        operations = [
+            UpdateOne({"student_id": student_id}, {"$inc": {"generation": 1}, "$set": {"stale": True}}, upsert=True)
+            for student_id in dict.fromkeys(student_ids) if student_id
+        ]
+        if not operations:
+            return
+        await self._db.student_results_summary.bulk_write(operations, ordered=False)
+        self.stats["invalidations"] += len(operations)
+
+    async def invalidate_exam(self, exam_id: str):
+        """Mark stale every summary that shows this exam; called when its summary fields are edited"""
+        result = await self._db.student_results_summary.update_many(
+            {"results.exam.id": exam_id},
+            {"$inc": {"generation": 1}, "$set": {"stale": True}}
+        )
+        self.stats["invalidations"] += result.modified_count
+
+    async def rebuild(self, student_id: str) -> Dict:
+        """Recompute a student's summary with one aggregation and store it unless it went stale meanwhile"""
+        started = time.perf_counter()
+        current = await self._db.student_results_summary.find_one(
+            {"student_id": student_id}, {"_id": 0, "generation": 1}
+        )
+        generation = (current or {}).get("generation", 0)
+        results = await self._db.attempts.aggregate(
+            student_results_pipeline(student_id, self.completed_status)
+        ).to_list(RESULTS_LIMIT)
+        summary = {
+            "student_id": student_id,
+            "results": results,
+            "total_exams": len(results),
+            "updated_at": datetime.now(timezone.utc)
+        }
+        try:
+            await self._db.student_results_summary.update_one(
+                {"student_id": student_id, "generation": generation},
+                {"$set": {**summary, "stale": False}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Invalidated since we read it; that change's reader or refresh rebuilds it
+            self.stats["lost_races"] += 1
+        self.stats["rebuilds"] += 1
+        self.stats["last_rebuild_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return summary
+
+    async def refresh(self, student_id: str):
+        """Best-effort rebuild for run_in_background; readers fall back to rebuilding"""
+        try:
+            await self.rebuild(student_id)
+        except Exception as e:
+            logger.warning(f"Results summary refresh for student {student_id} failed: {e}")
+
+    async def get(self, student_id: str) -> Dict:
+        """The student's summary: one indexed read, or a rebuild if it is missing or stale"""
+        summary = await self._db.student_results_summary.find_one(
+            {"student_id": student_id}, {"_id": 0, "generation": 0}
+        )
+        if summary and not summary.get("stale") and "results" in summary:
+            self.stats["hits"] += 1
+            return summary
+        return await self.rebuild(student_id)
+
+    def metrics(self) -> Dict:
+        return dict(self.stats)
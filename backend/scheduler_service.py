@@ -0,0 +1,236 @@
+"""
+Background deadline sweeper for the exam platform
+Expires timed attempt stages in bulk and runs periodic maintenance jobs on one elected worker
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Sweeper configuration from environment
+SWEEPER_ENABLED = os.environ.get("DEADLINE_SWEEPER_ENABLED", "1") == "1"
+SWEEPER_POLL_SECONDS = float(os.environ.get("DEADLINE_SWEEPER_POLL_SECONDS", 15))
+SWEEPER_LEASE_SECONDS = float(os.environ.get("DEADLINE_SWEEPER_LEASE_SECONDS", 45))
+SWEEPER_HORIZON_SECONDS = float(os.environ.get("DEADLINE_SWEEPER_HORIZON_SECONDS", 300))
+SWEEPER_BATCH_SIZE = int(os.environ.get("DEADLINE_SWEEPER_BATCH_SIZE", 500))
+
+StageHandler = Callable[[List[Dict], datetime], Awaitable[int]]
+
+
+class LeaderLease:
+    """Lease document in `scheduler_leases` electing one worker across all gunicorn processes
+
+    Whoever holds an unexpired lease renews it; anyone may take it over once
+    it expires (e.g. the leader's worker was recycled by max_requests).
+    """
+
+    def __init__(self, collection, name: str, ttl_seconds: float):
+        self.collection = collection
+        self.name = name
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.is_leader = False
+
+    async def acquire(self) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + self.ttl, "renewed_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            leader = doc is not None and doc.get("owner") == self.owner
+        except DuplicateKeyError:
+            # Someone else holds a live lease (the upsert collided with their document)
+            leader = False
+        if leader != self.is_leader:
+            logger.info(f"Lease '{self.name}' {'acquired' if leader else 'lost'} by {self.owner}")
+        self.is_leader = leader
+        return leader
+
+    async def release(self):
+        if self.is_leader:
+            await self.collection.delete_one({"_id": self.name, "owner": self.owner})
+            self.is_leader = False
+
+
+class DeadlineSweeper:
+    """Expires attempts whose indexed `deadline_at` has passed, stage by stage
+
+    Each registered stage maps an attempt status to a handler that receives a
+    batch of expired attempts and moves them on with one bulk write. Upcoming
+    deadlines are kept in a min-heap so the leader wakes up when the next one
+    falls due instead of polling blindly. Periodic maintenance jobs run on the
+    same leader.
+    """
+
+    def __init__(
+        self,
+        poll_seconds: float = SWEEPER_POLL_SECONDS,
+        lease_seconds: float = SWEEPER_LEASE_SECONDS,
+        horizon_seconds: float = SWEEPER_HORIZON_SECONDS,
+        batch_size: int = SWEEPER_BATCH_SIZE,
+        enabled: bool = SWEEPER_ENABLED
+    ):
+        self.enabled = enabled
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.horizon = timedelta(seconds=horizon_seconds)
+        self.batch_size = batch_size
+        self.grace = timedelta(0)
+        self._db = None
+        self._lease: Optional[LeaderLease] = None
+        self._stages: Dict[str, Dict] = {}
+        self._jobs: List[Dict] = []
+        self._heap: List[datetime] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"sweeps": 0, "expired": {}, "job_runs": {}, "errors": 0, "last_sweep_ms": 0.0}
+
+    def register_stage(self, status: str, handler: StageHandler, projection: Optional[Dict] = None):
+        """Handle attempts in `status` whose deadline_at has passed"""
+        self._stages[status] = {"handler": handler, "projection": projection or {"_id": 0}}
+        self.stats["expired"].setdefault(status, 0)
+
+    def add_periodic_job(self, name: str, interval_seconds: float, func: Callable[[], Awaitable]):
+        """Run `func` on the leader every `interval_seconds`"""
+        self._jobs.append({"name": name, "interval": interval_seconds, "func": func, "next_run": 0.0})
+        self.stats["job_runs"].setdefault(name, 0)
+
+    def schedule(self, deadline: datetime):
+        """Tell the sweeper about a new deadline so it can wake up in time"""
+        if not self.enabled or deadline is None or not (self._lease and self._lease.is_leader):
+            return
+        if deadline.tzinfo is None:
+            deadline = deadline.replace(tzinfo=timezone.utc)
+        if datetime.now(timezone.utc) + self.horizon < deadline:
+            return  # Picked up by a later heap refill
+        heapq.heappush(self._heap, deadline)
+        if self._wake is not None and self._heap[0] == deadline:
+            self._wake.set()
+
+    def start(self, db, grace_seconds: float = 0):
+        """Start the sweeper loop (call from the app startup event)"""
+        self._db = db
+        self.grace = timedelta(seconds=grace_seconds)
+        if not self.enabled or self._task is not None:
+            return
+        self._lease = LeaderLease(db.scheduler_leases, "deadline_sweeper", self.lease_seconds)
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Deadline sweeper started ({len(self._stages)} stages, {len(self._jobs)} periodic jobs)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._lease is not None:
+            try:
+                await self._lease.release()
+            except Exception as e:
+                logger.warning(f"Could not release sweeper lease: {e}")
+        logger.info("Deadline sweeper stopped")
+
+    async def sweep(self, now: Optional[datetime] = None) -> int:
+        """Process every expired attempt, one batch per stage at a time"""
+        now = now or datetime.now(timezone.utc)
+        cutoff = now - self.grace
+        started = time.perf_counter()
+        total = 0
+        for status, stage in self._stages.items():
+            while True:
+                batch = await self._db.attempts.find(
+                    {"status": status, "deadline_at": {"$lte": cutoff}},
+                    stage["projection"]
+                ).sort("deadline_at", 1).limit(self.batch_size).to_list(self.batch_size)
+                if not batch:
+                    break
+                processed = await stage["handler"](batch, now)
+                self.stats["expired"][status] += processed
+                total += processed
+                if len(batch) < self.batch_size or processed == 0:
+                    break
+        self.stats["sweeps"] += 1
+        self.stats["last_sweep_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        if total:
+            logger.info(f"Deadline sweep expired {total} attempt stages")
+        return total
+
+    async def _refill_heap(self, now: datetime):
+        upcoming = await self._db.attempts.find(
+            {"status": {"$in": list(self._stages)}, "deadline_at": {"$gt": now - self.grace, "$lte": now + self.horizon}},
+            {"_id": 0, "deadline_at": 1}
+        ).sort("deadline_at", 1).limit(self.batch_size).to_list(self.batch_size)
+        self._heap = []
+        for doc in upcoming:
+            deadline = doc["deadline_at"]
+            heapq.heappush(self._heap, deadline if deadline.tzinfo else deadline.replace(tzinfo=timezone.utc))
+
+    async def _run_due_jobs(self):
+        now = time.monotonic()
+        for job in self._jobs:
+            if now < job["next_run"]:
+                continue
+            job["next_run"] = now + job["interval"]
+            try:
+                await job["func"]()
+                self.stats["job_runs"][job["name"]] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Periodic job {job['name']} failed: {e}")
+
+    def _seconds_until_next_wake(self) -> float:
+        wait = min(self.poll_seconds, self.lease_seconds / 3)
+        now = datetime.now(timezone.utc)
+        if self._heap:
+            wait = min(wait, max(0.0, (self._heap[0] + self.grace - now).total_seconds()))
+        return wait
+
+    async def _run(self):
+        while True:
+            try:
+                if await self._lease.acquire():
+                    now = datetime.now(timezone.utc)
+                    await self.sweep(now)
+                    await self._refill_heap(now)
+                    await self._run_due_jobs()
+                else:
+                    self._heap = []  # Only the leader acts on deadlines
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Deadline sweeper error: {e}")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self._seconds_until_next_wake())
+            except asyncio.TimeoutError:
+                pass
+
+    def metrics(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "is_leader": bool(self._lease and self._lease.is_leader),
+            "owner": self._lease.owner if self._lease else None,
+            "upcoming_deadlines": len(self._heap),
+            "next_deadline": self._heap[0].isoformat() if self._heap else None,
+            **self.stats
+        }
+
+
+# Shared per-process instance
+deadline_sweeper = DeadlineSweeper()
@@ -4,19 +4,19 @@ Backend API - FastAPI + MongoDB
 Version 2.0 - Complete Exam System with Anonymous Marking
 """
 
-from fastapi import FastAPI, HTTPException, Depends, status, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, Depends, status, File, UploadFile, Form, Header, Request, Response, WebSocket, WebSocketDisconnect, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, Field
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta, timezone
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
 import jwt
-from passlib.context import CryptContext
 import uuid
 from enum import Enum
 import logging
@@ -27,6 +27,31 @@ from cachetools import TTLCache
 import shutil
 import csv
 import io
+import asyncio
+import json
+import hashlib
+import mimetypes
+import re
+from email.utils import formatdate
+
+from password_service import password_hasher, PasswordHasherBusy
+from autosave_buffer import answer_buffer
+from exam_sessions import exam_sessions
+from scheduler_service import deadline_sweeper
+from image_pipeline import image_pipeline
+from media_storage import media_store, IMMUTABLE_CACHE_CONTROL
+from marking_queue import MarkingQueue
+from stats_service import PlatformStats
+from batch_members import batch_members
+from results_summary import EXAM_SUMMARY_FIELDS, ResultsSummaries
+from pagination import keyset_page, migrate_string_created_at, InvalidCursor, MAX_PAGE_SIZE
+from student_import import StudentImporter, count_csv_rows, REPORT_FIELDS
+from payment_ledger import payment_ledger, marker_payment_totals_pipeline, MARKER_PAYMENT_PER_PAPER
+from media_serving import MediaUrlSigner, MediaFileResponse, RangeNotSatisfiable, etag_matches, parse_range
+from grading_service import compile_answer_key, question_key, regrade_attempts
+from job_leases import JobLeases, LostLease, WORKER_ID
+from pymongo import UpdateOne, ReturnDocument
+from starlette.requests import ClientDisconnect
 
 # Load environment variables
 load_dotenv()
@@ -46,14 +71,44 @@ client = AsyncIOMotorClient(
 db = client[os.environ.get('DB_NAME_EXAM', 'exam_bureau_db')]
 
 # Caching
-exam_cache = TTLCache(maxsize=1000, ttl=300)
-user_cache = TTLCache(maxsize=5000, ttl=60)
+exam_cache = TTLCache(maxsize=1000, ttl=300)  # exam_id -> full exam document (read-only, carries "version")
+exam_meta_cache = TTLCache(maxsize=1000, ttl=300)  # exam_id -> durations + answer key only
+exam_payload_cache = TTLCache(maxsize=1000, ttl=300)  # exam_id -> (version, student JSON bytes, ETag)
+_exam_loads: Dict[str, asyncio.Future] = {}  # In-flight exam loads, so a cold cache hits Mongo once per exam
+attempt_state_cache = TTLCache(maxsize=20000, ttl=30)  # attempt_id -> owner, MCQ deadline, acked autosave seq
+_background_tasks = set()  # Strong references to fire-and-forget jobs until they finish
+user_cache = TTLCache(maxsize=5000, ttl=60)  # Principal cache: token subject -> slim user record
+auth_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+# Fields get_current_user needs for authorization decisions (no password hash, no bank details)
+USER_PRINCIPAL_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "email": 1,
+    "full_name": 1,
+    "role": 1,
+    "grade": 1,
+    "student_id": 1,
+    "linked_student_id": 1,
+    "linked_student_user_id": 1,
+    "parent_user_id": 1,
+    "preferred_language": 1,
+    "language": 1,
+    "school": 1,
+    "is_active": 1,
+}
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.environ.get('SECRET_KEY', 'exam-bureau-secret-2024')
 ALGORITHM = "HS256"
+
+# Signed media URLs; with MEDIA_ACCEL_REDIRECT_PREFIX set, nginx serves the bytes via X-Accel-Redirect.
+# Only set it when clients reach /api/media through that nginx: answered directly, the
+# X-Accel response has an empty body.
+media_signer = MediaUrlSigner(os.environ.get("MEDIA_URL_SECRET", SECRET_KEY))
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get("MEDIA_ACCEL_REDIRECT_PREFIX", "")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # Logging
 logging.basicConfig(level=logging.INFO)
@@ -69,7 +124,7 @@ def ensure_utc(dt):
         dt = dt.replace(tzinfo=timezone.utc)
     return dt
 
-# Upload directory for paper photos
+# Flat directory of paper photos uploaded before content-addressed storage (served through signed /api/media URLs)
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), 'uploads', 'papers')
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
@@ -93,8 +148,18 @@ app.add_middleware(
     max_age=3600,
 )
 
-# Serve uploaded files
-app.mount("/uploads", StaticFiles(directory=os.path.join(os.path.dirname(__file__), 'uploads')), name="uploads")
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request, exc: PasswordHasherBusy):
+    """Shed load during login storms instead of queueing bcrypt work without bound"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server busy, please retry shortly"},
+        headers={"Retry-After": "2"}
+    )
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request, exc: InvalidCursor):
+    return JSONResponse(status_code=400, content={"detail": "Invalid cursor"})
 
 # ============================================================================
 # ENUMS & CONSTANTS
@@ -130,6 +195,45 @@ class AttemptStatus(str, Enum):
     MARKING_IN_PROGRESS = "marking_in_progress"
     COMPLETED = "completed"
 
+# Admin dashboard figures, materialized in one document (see stats_service)
+platform_stats = PlatformStats({
+    "total_students": ("users", {"role": "student"}),
+    "total_parents": ("users", {"role": "parent"}),
+    "total_markers": ("users", {"role": {"$in": ["marker", "teacher"]}}),
+    "total_exams": ("exams", {"is_active": True}),
+    "total_attempts": ("attempts", {}),
+    "pending_marking": ("attempts", {"status": AttemptStatus.PENDING_MARKING.value}),
+    "completed_exams": ("attempts", {"status": AttemptStatus.COMPLETED.value}),
+    "total_batches": ("batches", {"is_active": True}),
+    "total_teaching_sessions": ("teaching_sessions", {"is_active": True}),
+    "pending_teaching_payments": ("teaching_purchases", {"status": "pending_verification"})
+})
+ROLE_COUNTERS = {"student": "total_students", "parent": "total_parents", "marker": "total_markers", "teacher": "total_markers"}
+ATTEMPT_STATUS_COUNTERS = {
+    AttemptStatus.PENDING_MARKING.value: "pending_marking",
+    AttemptStatus.COMPLETED.value: "completed_exams"
+}
+
+async def record_attempt_transition(from_status: Optional[str], to_status: str, count: int = 1):
+    """Move `count` attempts between the status counters of the admin dashboard"""
+    deltas = {}
+    if from_status in ATTEMPT_STATUS_COUNTERS:
+        deltas[ATTEMPT_STATUS_COUNTERS[from_status]] = -count
+    if to_status in ATTEMPT_STATUS_COUNTERS:
+        counter = ATTEMPT_STATUS_COUNTERS[to_status]
+        deltas[counter] = deltas.get(counter, 0) + count
+    await platform_stats.increment(**deltas)
+
+# Written papers waiting for a marker, handed out under a lease
+marking_queue = MarkingQueue(
+    AttemptStatus.PENDING_MARKING.value,
+    AttemptStatus.MARKING_IN_PROGRESS.value,
+    on_transition=record_attempt_transition
+)
+
+# Latest completed results per student, read by the progress views (see results_summary)
+results_summaries = ResultsSummaries(AttemptStatus.COMPLETED.value)
+
 class Language(str, Enum):
     ENGLISH = "en"
     SINHALA = "si"
@@ -150,6 +254,46 @@ MCQ_CONFIG = {
     "marks_per_question": 1
 }
 
+# Fields a student is allowed to see while sitting an exam (no answer keys)
+STUDENT_EXAM_FIELDS = (
+    "id", "title", "grade", "month", "mcq_total_questions", "mcq_duration_minutes",
+    "written_essay_prompt", "written_short_questions", "written_duration_minutes"
+)
+STUDENT_QUESTION_FIELDS = ("id", "question_number", "question_text", "text", "image_url", "marks")
+STUDENT_OPTION_FIELDS = ("option_id", "id", "text", "image_url")
+
+# Exam session WebSocket: how often the server pushes authoritative remaining time
+EXAM_SESSION_TIME_SYNC_SECONDS = 30
+# Close codes for client frames that break the protocol (RFC 6455: unsupported data / policy violation)
+WS_CLOSE_UNSUPPORTED_DATA = 1003
+WS_CLOSE_POLICY_VIOLATION = 1008
+
+# The expiry sweep waits this long past a deadline so the client's own auto-submit usually wins
+ATTEMPT_EXPIRY_GRACE_SECONDS = 15
+
+# Answers sent with submit-mcq are accepted this long after the MCQ deadline (client clock/network slack)
+MCQ_SUBMIT_GRACE_SECONDS = 30
+
+# The server grades a timed-out MCQ section only after this, so the client's final snapshot and
+# autosaves still buffered on other workers (at most the buffer's max lag) land first
+MCQ_AUTO_SUBMIT_DELAY_SECONDS = max(MCQ_SUBMIT_GRACE_SECONDS, answer_buffer.max_lag) + 2
+MCQ_SUBMIT_RETRIES = 5
+
+# Upload limits (uploads are streamed to disk in chunks, never held in memory whole)
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+MAX_PAPER_PHOTOS = 15
+MAX_PHOTO_BYTES = int(os.environ.get("MAX_PHOTO_BYTES", 15 * 1024 * 1024))
+MAX_PHOTO_REQUEST_BYTES = int(os.environ.get("MAX_PHOTO_REQUEST_BYTES", 120 * 1024 * 1024))
+MAX_AUDIO_BYTES = int(os.environ.get("MAX_AUDIO_BYTES", 300 * 1024 * 1024))
+STREAM_FLUSH_BYTES = 64 * 1024
+EXPORT_CURSOR_BATCH = 1000
+MAX_IMPORT_CSV_BYTES = int(os.environ.get("MAX_IMPORT_CSV_BYTES", 20 * 1024 * 1024))
+# Import reports hold generated passwords, so they are kept only this long
+IMPORT_REPORT_TTL_DAYS = int(os.environ.get("IMPORT_REPORT_TTL_DAYS", 7))
+
+# Resumable upload sessions: created inside the window, then this long to finish the transfer
+UPLOAD_SESSION_TTL_MINUTES = int(os.environ.get("UPLOAD_SESSION_TTL_MINUTES", 30))
+
 # Parent upload window
 PARENT_UPLOAD_WINDOW_MINUTES = 5
 PARENT_UPLOAD_DELAY_MINUTES = 0  # Opens immediately after student finishes
@@ -195,6 +339,13 @@ class MCQAnswer(BaseModel):
     question_id: str
     selected_option: str
 
+class MCQAnswerBatch(BaseModel):
+    answers: Dict[str, str]  # question_id -> selected_option
+    seq: int  # Client sequence number, strictly increasing per attempt
+
+class MCQSubmission(BaseModel):
+    answers: Dict[str, str] = {}  # Optional final snapshot of the client's answers
+
 class WrittenSubmission(BaseModel):
     attempt_id: str
     completed: bool = True
@@ -203,6 +354,15 @@ class ParentPhotoUpload(BaseModel):
     attempt_id: str
     photo_urls: List[str]
 
+class UploadPageSpec(BaseModel):
+    size: int  # Bytes the client will send for this page
+    content_type: str = "image/jpeg"
+    sha256: Optional[str] = None  # Optional client-side checksum, verified on finalize
+
+class UploadSessionCreate(BaseModel):
+    attempt_id: str
+    pages: List[UploadPageSpec]
+
 class BatchCreate(BaseModel):
     name: str
     grade: str
@@ -221,6 +381,10 @@ class TeachingSessionCreate(BaseModel):
     price_lkr: float = 500.0
     available_after_days: int = 7
 
+class AnswerKeyUpdate(BaseModel):
+    answers: Dict[str, str]  # question_id -> corrected option id
+    regrade: bool = True
+
 class MarkerBankDetails(BaseModel):
     bank_name: str
     branch: str
@@ -235,11 +399,13 @@ class MarkerPaymentProcess(BaseModel):
 # HELPER FUNCTIONS
 # ============================================================================
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    """Hash a password on the bounded bcrypt worker pool"""
+    return await password_hasher.hash(password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the bounded bcrypt worker pool"""
+    return await password_hasher.verify(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     to_encode = data.copy()
@@ -247,6 +413,87 @@ def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def upload_extension(upload: UploadFile, default: str) -> str:
+    """Lower-case file extension of an upload, falling back to a default"""
+    name = upload.filename or ""
+    ext = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+    return ext if ext.isalnum() and len(ext) <= 5 else default
+
+def _write_chunk(handle, digest, chunk: bytes):
+    digest.update(chunk)
+    handle.write(chunk)
+
+async def stream_upload_to_file(upload: UploadFile, dest_path: str, max_bytes: int) -> dict:
+    """Copy an upload to disk in fixed-size chunks off the event loop, hashing on the fly.
+    
+    The file is written under a temporary name and moved into place only once
+    complete, so a rejected or interrupted upload never leaves a partial file.
+    """
+    declared = getattr(upload, "size", None)
+    if declared is not None and declared > max_bytes:
+        raise HTTPException(status_code=413, detail=f"{upload.filename} exceeds {max_bytes // (1024 * 1024)}MB limit")
+    
+    digest = hashlib.sha256()
+    received = 0
+    tmp_path = f"{dest_path}.part-{uuid.uuid4().hex[:8]}"
+    handle = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            received += len(chunk)
+            if received > max_bytes:
+                raise HTTPException(status_code=413, detail=f"{upload.filename} exceeds {max_bytes // (1024 * 1024)}MB limit")
+            await run_in_threadpool(_write_chunk, handle, digest, chunk)
+    except BaseException:
+        await run_in_threadpool(handle.close)
+        await run_in_threadpool(os.remove, tmp_path)
+        raise
+    await run_in_threadpool(handle.close)
+    await run_in_threadpool(os.replace, tmp_path, dest_path)
+    return {"bytes": received, "sha256": digest.hexdigest()}
+
+async def stream_csv(fields: List[str], docs):
+    """CSV text for an async iterable of dicts, yielded in ~64KB pieces"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    async for doc in docs:
+        writer.writerow(doc)
+        if buffer.tell() >= STREAM_FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+async def stream_ndjson(docs):
+    """One JSON document per line for an async iterable of dicts, yielded in ~64KB pieces"""
+    lines = []
+    size = 0
+    async for doc in docs:
+        line = json.dumps(doc, default=_json_default) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= STREAM_FLUSH_BYTES:
+            yield "".join(lines)
+            lines, size = [], 0
+    if lines:
+        yield "".join(lines)
+
+def export_response(docs, fmt: str, fields: List[str], filename: str) -> StreamingResponse:
+    """Download of a document stream as CSV or NDJSON"""
+    # Header values must be latin-1; school names often are not
+    filename = re.sub(r"[^A-Za-z0-9._-]+", "_", filename)
+    if fmt == "ndjson":
+        body, media_type, filename = stream_ndjson(docs), "application/x-ndjson", f"{filename}.ndjson"
+    else:
+        body, media_type, filename = stream_csv(fields, docs), "text/csv", f"{filename}.csv"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 def generate_secret_code() -> str:
     """Generate unique secret code for anonymous marking"""
     prefix = "EXM"
@@ -258,20 +505,216 @@ def generate_student_id() -> str:
     """Generate unique student ID"""
     return f"STU-{datetime.now().year}-{uuid.uuid4().hex[:8].upper()}"
 
+def build_exam_meta(exam: dict) -> dict:
+    """Lightweight exam entry: timing and compiled answer key, no question text"""
+    answer_key = compile_answer_key(exam)
+    return {
+        "id": exam["id"],
+        "version": exam.get("version", 0),
+        "status": exam.get("status"),
+        "mcq_duration_minutes": exam.get("mcq_duration_minutes", 60),
+        "written_duration_minutes": exam.get("written_duration_minutes", 45),
+        "total_questions": answer_key.total_questions,
+        "answer_key": answer_key
+    }
+
+def invalidate_exam_cache(exam_id: str):
+    """Drop every cached view of an exam on this worker"""
+    exam_cache.pop(exam_id, None)
+    exam_meta_cache.pop(exam_id, None)
+    exam_payload_cache.pop(exam_id, None)
+
+def build_student_exam_view(exam: dict) -> dict:
+    """Student-safe exam: whitelisted fields only, correct answers stripped"""
+    view = {field: exam[field] for field in STUDENT_EXAM_FIELDS if field in exam}
+    view["mcq_questions"] = [
+        {
+            **{field: q[field] for field in STUDENT_QUESTION_FIELDS if field in q},
+            "options": [
+                {field: opt[field] for field in STUDENT_OPTION_FIELDS if field in opt}
+                for opt in q.get("options", [])
+            ]
+        }
+        for q in exam.get("mcq_questions", [])
+    ]
+    return view
+
+async def _load_exam(exam_id: str) -> Optional[dict]:
+    pending = _exam_loads.get(exam_id)
+    while pending is not None:
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise  # This request was cancelled, not the shared load
+            # The loading request was cancelled; load again (or join whoever did)
+            pending = _exam_loads.get(exam_id)
+    
+    future = asyncio.get_running_loop().create_future()
+    _exam_loads[exam_id] = future
+    try:
+        exam = await db.exams.find_one({"id": exam_id}, {"_id": 0})
+        if exam:
+            exam.setdefault("version", 0)
+            exam_cache[exam_id] = exam
+            exam_meta_cache[exam_id] = build_exam_meta(exam)
+        future.set_result(exam)
+        return exam
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # Mark retrieved; concurrent waiters still re-raise it
+        raise
+    finally:
+        if not future.done():
+            # Cancelled (client went away, shutdown): release the waiters instead of leaving them hanging
+            future.cancel()
+        _exam_loads.pop(exam_id, None)
+
+async def get_cached_exam(exam_id: str, min_version: Optional[int] = None, refresh: bool = False) -> Optional[dict]:
+    """Get an exam document through exam_cache.
+    
+    min_version lets callers that know a newer version exists (e.g. from an
+    attempt) skip an entry another worker has since superseded. The returned
+    document is shared; do not mutate it.
+    """
+    exam = None if refresh else exam_cache.get(exam_id)
+    if exam is not None and (min_version is None or exam.get("version", 0) >= min_version):
+        return exam
+    return await _load_exam(exam_id)
+
+async def get_exam_meta(exam_id: str, min_version: Optional[int] = None) -> Optional[dict]:
+    """Get durations and answer key for an exam without touching question text"""
+    meta = exam_meta_cache.get(exam_id)
+    if meta is not None and (min_version is None or meta["version"] >= min_version):
+        return meta
+    exam = await get_cached_exam(exam_id, min_version=min_version, refresh=True)
+    return exam_meta_cache.get(exam_id) if exam else None
+
+async def get_current_exam_versions(exam_ids: List[str]) -> Dict[str, int]:
+    """Current exam versions straight from the database (one small read), for callers that must not trust exam_cache"""
+    return {
+        exam["id"]: exam.get("version", 0)
+        async for exam in db.exams.find({"id": {"$in": list(set(exam_ids))}}, {"_id": 0, "id": 1, "version": 1})
+    }
+
+async def get_grading_exam_meta(exam_id: str, current_version: Optional[int] = None) -> Optional[dict]:
+    """Exam meta for grading: never an answer key older than the exam's current version
+    
+    exam_cache is invalidated only on the worker that saved an edit, so the
+    version is checked in the database; an answer-key correction made on
+    another worker forces a reload here instead of waiting out the TTL.
+    """
+    if current_version is None:
+        versions = await get_current_exam_versions([exam_id])
+        if exam_id not in versions:
+            return None
+        current_version = versions[exam_id]
+    return await get_exam_meta(exam_id, min_version=current_version)
+
+async def get_student_exam_payload(exam_id: str, min_version: Optional[int] = None, refresh: bool = False):
+    """Pre-encoded student view of an exam as (compact JSON bytes, ETag), built once per version"""
+    exam = await get_cached_exam(exam_id, min_version=min_version, refresh=refresh)
+    if not exam:
+        return None
+    
+    version = exam.get("version", 0)
+    cached = exam_payload_cache.get(exam_id)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+    
+    body = json.dumps(
+        jsonable_encoder(build_student_exam_view(exam)),
+        separators=(",", ":"),
+        ensure_ascii=False
+    ).encode("utf-8")
+    etag = f'"{exam_id}-v{version}-{hashlib.sha256(body).hexdigest()[:16]}"'
+    exam_payload_cache[exam_id] = (version, body, etag)
+    return body, etag
+
+def exam_start_response(attempt: dict, exam_payload: bytes, resume: bool) -> Response:
+    """Splice the pre-encoded exam payload into the start-exam response without re-encoding it"""
+    attempt_json = json.dumps(jsonable_encoder(attempt), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    body = b''.join([
+        b'{"attempt":', attempt_json,
+        b',"exam":', exam_payload,
+        b',"resume":', b'true' if resume else b'false',
+        b'}'
+    ])
+    return Response(content=body, media_type="application/json")
+
+def run_in_background(coro):
+    """Start a job on this worker's loop without awaiting it"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def update_exam_content(exam_id: str, updates: dict):
+    """Apply an edit to an exam, bump its content version and invalidate cached views"""
+    result = await db.exams.update_one(
+        {"id": exam_id},
+        {"$set": updates, "$inc": {"version": 1}}
+    )
+    invalidate_exam_cache(exam_id)
+    if any(field in updates for field in EXAM_SUMMARY_FIELDS):
+        await results_summaries.invalidate_exam(exam_id)
+    return result
+
+def invalidate_user_cache(*user_ids: str):
+    """Drop cached principals after a user document changes.
+    
+    The cache is per worker, so other workers pick the change up when
+    their entry expires (user_cache TTL).
+    """
+    for user_id in user_ids:
+        if user_id and user_cache.pop(user_id, None) is not None:
+            auth_cache_stats["invalidations"] += 1
+
+async def load_user_principal(user_id: str) -> Optional[dict]:
+    """Resolve a token subject to a slim user record, served from user_cache when possible"""
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        auth_cache_stats["hits"] += 1
+        return dict(cached)
+    
+    auth_cache_stats["misses"] += 1
+    user_doc = await db.users.find_one({"id": user_id}, USER_PRINCIPAL_PROJECTION)
+    if user_doc:
+        user_cache[user_id] = user_doc
+        return dict(user_doc)
+    return None
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await resolve_token_user(credentials.credentials)
+
+async def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)) -> Optional[dict]:
+    """The caller for endpoints that also serve anonymous requests; a bad token counts as anonymous"""
+    if credentials is None:
+        return None
+    try:
+        return await resolve_token_user(credentials.credentials)
+    except HTTPException:
+        return None
+
+async def resolve_token_user(token: str) -> dict:
+    """Decode a bearer token and resolve its principal (shared by HTTP and WebSocket auth)"""
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "hashed_password": 0})
+        user_doc = await load_user_principal(user_id)
         if not user_doc:
             raise HTTPException(status_code=401, detail="User not found")
         
+        if not user_doc.get("is_active", True):
+            raise HTTPException(status_code=403, detail="Account inactive")
+        
         return user_doc
+    except HTTPException:
+        raise
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.DecodeError:
@@ -301,13 +744,15 @@ async def register_user(user_data: UserCreate):
         "full_name": user_data.full_name,
         "role": user_data.role.value,
         "grade": user_data.grade,
-        "hashed_password": get_password_hash(user_data.password),
+        "hashed_password": await get_password_hash(user_data.password),
         "linked_student_id": user_data.student_id if user_data.role == UserRole.PARENT else None,
         "created_at": datetime.now(timezone.utc),
         "is_active": True
     }
     
     await db.users.insert_one(new_user)
+    if new_user["role"] in ROLE_COUNTERS:
+        await platform_stats.increment(**{ROLE_COUNTERS[new_user["role"]]: 1})
     new_user.pop("hashed_password")
     new_user.pop("_id", None)
     return new_user
@@ -327,6 +772,10 @@ async def register_student_with_parent(data: StudentRegistration):
     student_id = generate_student_id()
     student_user_id = str(uuid.uuid4())
     parent_user_id = str(uuid.uuid4())
+    student_hash, parent_hash = await asyncio.gather(
+        get_password_hash(data.student_password),
+        get_password_hash(data.parent_password)
+    )
     
     # Create student
     student = {
@@ -337,7 +786,7 @@ async def register_student_with_parent(data: StudentRegistration):
         "role": "student",
         "grade": data.grade,
         "preferred_language": data.language,
-        "hashed_password": get_password_hash(data.student_password),
+        "hashed_password": student_hash,
         "parent_user_id": parent_user_id,
         "created_at": datetime.now(timezone.utc),
         "is_active": True
@@ -351,13 +800,14 @@ async def register_student_with_parent(data: StudentRegistration):
         "role": "parent",
         "linked_student_id": student_id,
         "linked_student_user_id": student_user_id,
-        "hashed_password": get_password_hash(data.parent_password),
+        "hashed_password": parent_hash,
         "created_at": datetime.now(timezone.utc),
         "is_active": True
     }
     
     await db.users.insert_one(student)
     await db.users.insert_one(parent)
+    await platform_stats.increment(total_students=1, total_parents=1)
     
     return {
         "message": "Registration successful",
@@ -371,7 +821,7 @@ async def login(login_data: UserLogin):
     """Login user"""
     user_doc = await db.users.find_one({"email": login_data.email})
     
-    if not user_doc or not verify_password(login_data.password, user_doc["hashed_password"]):
+    if not user_doc or not await verify_password(login_data.password, user_doc.get("hashed_password", "")):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if not user_doc.get("is_active", True):
@@ -451,34 +901,60 @@ async def create_exam(exam_data: ExamCreate, current_user: dict = Depends(get_cu
         "written_short_questions": exam_data.written_short_questions,
         "written_duration_minutes": exam_data.written_duration_minutes or grade_config["duration_minutes"],
         "status": "draft",
+        "version": 1,
         "created_by": current_user["id"],
         "created_at": datetime.now(timezone.utc),
         "is_active": True
     }
     
+    # Reject what the grader cannot encode now, rather than failing every later read of the exam
+    try:
+        compile_answer_key(exam)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    validate_question_ids({question_key(q): None for q in questions})
+    
     await db.exams.insert_one(exam)
+    await platform_stats.increment(total_exams=1)
     exam.pop("_id", None)
+    invalidate_exam_cache(exam["id"])
     return exam
 
 @app.get("/api/exams")
-async def list_exams(grade: Optional[str] = None, status: Optional[str] = None):
-    """List exams"""
+async def list_exams(
+    grade: Optional[str] = None,
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE)
+):
+    """List exams, newest first (pass next_cursor back for the next page)"""
     query = {"is_active": True}
     if grade:
         query["grade"] = grade
     if status:
         query["status"] = status
     
-    exams = await db.exams.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return {"exams": exams}
+    exams, next_cursor = await keyset_page(db.exams, query, {"_id": 0}, cursor, limit)
+    return {"exams": exams, "next_cursor": next_cursor}
 
 @app.get("/api/exams/{exam_id}")
-async def get_exam(exam_id: str):
-    """Get exam details"""
-    exam = await db.exams.find_one({"id": exam_id}, {"_id": 0})
-    if not exam:
+async def get_exam(exam_id: str, request: Request, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Get exam details: the full document for staff, otherwise the student-safe view (supports conditional GET)"""
+    if current_user and current_user["role"] in ["admin", "teacher"]:
+        exam = await get_cached_exam(exam_id, refresh=True)
+        if not exam:
+            raise HTTPException(status_code=404, detail="Exam not found")
+        return JSONResponse(jsonable_encoder(exam), headers={"Cache-Control": "private, no-store", "Vary": "Authorization"})
+    
+    payload = await get_student_exam_payload(exam_id)
+    if not payload:
         raise HTTPException(status_code=404, detail="Exam not found")
-    return exam
+    
+    body, etag = payload
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Authorization"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.put("/api/exams/{exam_id}/publish")
 async def publish_exam(exam_id: str, current_user: dict = Depends(get_current_user)):
@@ -486,16 +962,182 @@ async def publish_exam(exam_id: str, current_user: dict = Depends(get_current_us
     if current_user["role"] not in ["admin", "teacher"]:
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    result = await db.exams.update_one(
-        {"id": exam_id},
-        {"$set": {"status": "published", "published_at": datetime.now(timezone.utc)}}
+    result = await update_exam_content(
+        exam_id,
+        {"status": "published", "published_at": datetime.now(timezone.utc)}
     )
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Exam not found")
     
+    # Build the student payload now so the first exam-morning request doesn't pay for it
+    await get_student_exam_payload(exam_id, refresh=True)
+    
     return {"message": "Exam published successfully"}
 
+@app.put("/api/exams/{exam_id}/answer-key")
+async def update_answer_key(exam_id: str, data: AnswerKeyUpdate, current_user: dict = Depends(get_current_user)):
+    """Correct MCQ answers after the paper; optionally regrade every submitted attempt"""
+    if current_user["role"] not in ["admin", "teacher"]:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    exam = await db.exams.find_one({"id": exam_id}, {"_id": 0, "mcq_questions": 1})
+    if not exam:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    
+    questions = exam.get("mcq_questions", [])
+    known = {question_key(q) for q in questions}
+    unknown = [q_id for q_id in data.answers if q_id not in known]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown question ids: {', '.join(unknown)}")
+    
+    for question in questions:
+        corrected = data.answers.get(question_key(question))
+        if corrected is None:
+            continue
+        question["correct_option_id"] = corrected
+        question.pop("correct_answer", None)
+        for option in question.get("options", []):
+            if "is_correct" in option:
+                option["is_correct"] = (option.get("option_id") or option.get("id")) == corrected
+    
+    await update_exam_content(exam_id, {"mcq_questions": questions, "answer_key_updated_at": datetime.now(timezone.utc)})
+    
+    response = {"message": f"Answer key updated for {len(data.answers)} questions"}
+    if data.regrade:
+        response["regrade_job"] = await start_regrade_job(exam_id, current_user["id"])
+    return response
+
+# ============================================================================
+# MCQ REGRADING (after answer key corrections)
+# ============================================================================
+
+# Attempts whose MCQ section is already graded
+REGRADABLE_STATUSES = [st.value for st in AttemptStatus if st != AttemptStatus.MCQ_IN_PROGRESS]
+
+# After the main pass a regrade re-checks attempts graded from this long before the job started,
+# catching any that a worker graded with the previous key while the correction was being saved
+REGRADE_CATCHUP_SECONDS = 300
+
+# Orphaned jobs (worker recycled mid-run) are resumed at most this many times before failing
+MAX_JOB_RESUMES = 3
+
+regrade_leases = JobLeases("regrade_jobs")
+
+async def start_regrade_job(exam_id: str, requested_by: str) -> dict:
+    """Record a regrade job and run it in the background on this worker"""
+    exam = await get_cached_exam(exam_id, refresh=True)
+    if not exam:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    
+    answer_key = compile_answer_key(exam)
+    job = {
+        "id": str(uuid.uuid4()),
+        "exam_id": exam_id,
+        "exam_version": answer_key.version,
+        "status": "running",
+        "total": await db.attempts.count_documents({"exam_id": exam_id, "status": {"$in": REGRADABLE_STATUSES}}),
+        "processed": 0,
+        "changed": 0,
+        "requested_by": requested_by,
+        "created_at": datetime.now(timezone.utc),
+        **regrade_leases.lease_fields()
+    }
+    await db.regrade_jobs.insert_one(job)
+    job.pop("_id", None)
+    run_in_background(run_regrade_job(job, answer_key))
+    return job
+
+async def run_regrade_job(job: dict, answer_key):
+    """Regrade every graded attempt, then catch up on attempts graded with the old key meanwhile
+    
+    Runs under a lease renewed after every batch; if this worker dies the
+    resume_regrade_jobs sweeper job restarts it (regrading is idempotent).
+    """
+    job_id = job["id"]
+    
+    async def report(progress: dict):
+        await regrade_leases.heartbeat(job_id)
+        await db.regrade_jobs.update_one(
+            {"id": job_id},
+            {"$set": {"processed": progress["processed"], "changed": progress["changed"]}}
+        )
+    
+    try:
+        progress = await regrade_attempts(
+            db, answer_key, REGRADABLE_STATUSES, AttemptStatus.COMPLETED.value, on_progress=report
+        )
+        catchup = await regrade_attempts(
+            db, answer_key, REGRADABLE_STATUSES, AttemptStatus.COMPLETED.value,
+            query={
+                "mcq_completed_at": {"$gte": ensure_utc(job["created_at"]) - timedelta(seconds=REGRADE_CATCHUP_SECONDS)},
+                "mcq_graded_version": {"$ne": answer_key.version}
+            }
+        )
+        await results_summaries.invalidate(progress["changed_student_ids"] + catchup["changed_student_ids"])
+        await db.regrade_jobs.update_one(
+            {"id": job_id, "lease_owner": WORKER_ID},
+            {
+                "$set": {
+                    "status": "completed",
+                    "processed": progress["processed"],
+                    "changed": progress["changed"] + catchup["changed"],
+                    "caught_up": catchup["changed"],
+                    "elapsed_ms": progress["elapsed_ms"] + catchup["elapsed_ms"],
+                    "completed_at": datetime.now(timezone.utc)
+                },
+                "$unset": {"lease_until": ""}
+            }
+        )
+    except LostLease as e:
+        logger.warning(f"Regrade job {job_id} stopped: {e}")
+    except Exception as e:
+        logger.error(f"Regrade job {job_id} failed: {e}")
+        await db.regrade_jobs.update_one(
+            {"id": job_id},
+            {"$set": {"status": "failed", "error": str(e), "completed_at": datetime.now(timezone.utc)}}
+        )
+
+async def resume_regrade_jobs():
+    """Restart regrade jobs whose worker died mid-run (sweeper job)"""
+    for job in await regrade_leases.claim_orphans():
+        exam = await get_cached_exam(job["exam_id"], refresh=True)
+        if job.get("resumes", 0) > MAX_JOB_RESUMES or not exam:
+            error = "Exam no longer exists" if not exam else "Interrupted too many times"
+            await db.regrade_jobs.update_one(
+                {"id": job["id"]},
+                {"$set": {"status": "failed", "error": error, "completed_at": datetime.now(timezone.utc)}}
+            )
+            continue
+        # Resume against the current key; a correction made meanwhile is included
+        answer_key = compile_answer_key(exam)
+        await db.regrade_jobs.update_one(
+            {"id": job["id"]},
+            {"$set": {"exam_version": answer_key.version, "processed": 0, "changed": 0}}
+        )
+        logger.info(f"Resuming regrade job {job['id']} (resume {job['resumes']})")
+        run_in_background(run_regrade_job(job, answer_key))
+
+@app.post("/api/admin/exams/{exam_id}/regrade")
+async def regrade_exam(exam_id: str, current_user: dict = Depends(get_current_user)):
+    """Admin re-scores all submitted MCQ attempts of an exam against its current answer key"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    return await start_regrade_job(exam_id, current_user["id"])
+
+@app.get("/api/admin/regrade-jobs/{job_id}")
+async def get_regrade_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Admin polls regrade progress"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    job = await db.regrade_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Regrade job not found")
+    job["percent"] = round(100 * job["processed"] / job["total"], 1) if job.get("total") else 100.0
+    return job
+
 # ============================================================================
 # STUDENT EXAM FLOW
 # ============================================================================
@@ -506,10 +1148,15 @@ async def start_exam(exam_id: str, current_user: dict = Depends(get_current_user
     if current_user["role"] != "student":
         raise HTTPException(status_code=403, detail="Only students can take exams")
     
-    exam = await db.exams.find_one({"id": exam_id, "status": "published"}, {"_id": 0})
-    if not exam:
+    exam = await get_cached_exam(exam_id)
+    if exam and exam.get("status") != "published":
+        # Another worker may have published it since this entry was cached
+        exam = await get_cached_exam(exam_id, refresh=True)
+    if not exam or exam.get("status") != "published":
         raise HTTPException(status_code=404, detail="Exam not found or not published")
     
+    exam_payload, _ = await get_student_exam_payload(exam_id, min_version=exam.get("version", 0))
+    
     # Check existing attempt
     existing = await db.attempts.find_one({
         "exam_id": exam_id,
@@ -519,24 +1166,25 @@ async def start_exam(exam_id: str, current_user: dict = Depends(get_current_user
     
     if existing:
         existing.pop("_id", None)
-        return {
-            "attempt": existing,
-            "exam": exam,
-            "resume": True
-        }
+        return exam_start_response(existing, exam_payload, resume=True)
     
     # Create new attempt with secret code
     secret_code = generate_secret_code()
+    mcq_started_at = datetime.now(timezone.utc)
     attempt = {
         "id": str(uuid.uuid4()),
         "exam_id": exam_id,
+        "exam_version": exam.get("version", 0),
         "student_id": current_user["id"],
         "student_user_id": current_user.get("student_id", current_user["id"]),
         "secret_code": secret_code,  # Only computer knows mapping
         "grade": current_user.get("grade"),
+        "language": current_user.get("preferred_language") or current_user.get("language") or exam.get("language"),
         "status": AttemptStatus.MCQ_IN_PROGRESS.value,
-        "mcq_started_at": datetime.now(timezone.utc),
+        "mcq_started_at": mcq_started_at,
+        "deadline_at": mcq_started_at + timedelta(minutes=exam.get("mcq_duration_minutes", 60)),
         "mcq_answers": {},
+        "mcq_seq": 0,
         "mcq_score": 0,
         "written_started_at": None,
         "written_completed_at": None,
@@ -550,93 +1198,358 @@ async def start_exam(exam_id: str, current_user: dict = Depends(get_current_user
     }
     
     await db.attempts.insert_one(attempt)
+    await platform_stats.increment(total_attempts=1)
     attempt.pop("_id", None)
-    
-    return {
-        "attempt": attempt,
-        "exam": {
-            "id": exam["id"],
-            "title": exam["title"],
-            "mcq_questions": exam["mcq_questions"],
-            "mcq_duration_minutes": exam["mcq_duration_minutes"]
-        },
-        "resume": False
-    }
+    deadline_sweeper.schedule(attempt["deadline_at"])
+    
+    return exam_start_response(attempt, exam_payload, resume=False)
+
+def validate_question_ids(answers: Dict[str, str]):
+    """Question ids become Mongo field paths, so reject anything that would nest or inject"""
+    for question_id in answers:
+        if not question_id or "." in question_id or question_id.startswith("$"):
+            raise HTTPException(status_code=400, detail=f"Invalid question id: {question_id}")
+
+async def get_mcq_deadline(attempt: dict) -> datetime:
+    """MCQ deadline for an attempt, derived from the exam for attempts that predate deadline_at"""
+    deadline = ensure_utc(attempt.get("deadline_at"))
+    if deadline is None:
+        exam_meta = await get_exam_meta(attempt["exam_id"], min_version=attempt.get("exam_version"))
+        time_limit = exam_meta["mcq_duration_minutes"] if exam_meta else 60
+        deadline = ensure_utc(attempt["mcq_started_at"]) + timedelta(minutes=time_limit)
+    return deadline
+
+AUTOSAVE_ATTEMPT_PROJECTION = {
+    "_id": 0, "status": 1, "exam_id": 1, "exam_version": 1, "mcq_started_at": 1, "deadline_at": 1, "mcq_seq": 1
+}
 
-@app.post("/api/attempts/{attempt_id}/save-mcq")
-async def save_mcq_answer(attempt_id: str, answer: MCQAnswer, current_user: dict = Depends(get_current_user)):
-    """Save MCQ answer (auto-save during exam)"""
-    attempt = await db.attempts.find_one({"id": attempt_id, "student_id": current_user["id"]})
+async def apply_mcq_answers(
+    attempt_id: str,
+    student_id: str,
+    answers: Dict[str, str],
+    seq: Optional[int] = None,
+    _backfilled: bool = False
+) -> dict:
+    """Apply MCQ answers to an in-progress attempt.
+    
+    When seq is given the batch is applied only if it is newer than the
+    attempt's mcq_seq; stale or replayed batches are acknowledged without
+    being written, so client retries are idempotent. With the write-behind
+    buffer enabled the answers are buffered; otherwise they are written with
+    a single conditional update.
+    """
+    validate_question_ids(answers)
+    if answer_buffer.enabled:
+        return await buffer_mcq_answers(attempt_id, student_id, answers, seq)
     
+    now = datetime.now(timezone.utc)
+    query = {
+        "id": attempt_id,
+        "student_id": student_id,
+        "status": AttemptStatus.MCQ_IN_PROGRESS.value,
+        "deadline_at": {"$gt": now}
+    }
+    fields = {f"mcq_answers.{q_id}": option for q_id, option in answers.items()}
+    if seq is not None:
+        query["mcq_seq"] = {"$lt": seq}
+        fields["mcq_seq"] = seq
+    
+    if fields:
+        result = await db.attempts.update_one(query, {"$set": fields})
+        if result.matched_count:
+            return {"acked_seq": seq, "applied": len(answers)}
+    
+    # Nothing matched (or nothing to write): find out why with one read
+    attempt = await db.attempts.find_one({"id": attempt_id, "student_id": student_id}, AUTOSAVE_ATTEMPT_PROJECTION)
     if not attempt:
         raise HTTPException(status_code=404, detail="Attempt not found")
     
     if attempt["status"] != AttemptStatus.MCQ_IN_PROGRESS.value:
         raise HTTPException(status_code=400, detail="MCQ section not active")
     
-    # Check time limit
-    mcq_started = ensure_utc(attempt["mcq_started_at"])
+    deadline = await get_mcq_deadline(attempt)
+    if now > deadline:
+        await reject_expired_mcq_write(attempt_id, student_id, deadline, now)
     
-    exam = await db.exams.find_one({"id": attempt["exam_id"]})
-    time_limit = exam.get("mcq_duration_minutes", 60)
+    if not _backfilled and ("deadline_at" not in attempt or "mcq_seq" not in attempt):
+        # Attempt started before deadlines/sequence numbers were recorded
+        await db.attempts.update_one(
+            {"id": attempt_id},
+            {"$set": {"deadline_at": deadline, "mcq_seq": attempt.get("mcq_seq", 0)}}
+        )
+        return await apply_mcq_answers(attempt_id, student_id, answers, seq, _backfilled=True)
+    
+    # Stale or out-of-order batch: already superseded, acknowledge the server's sequence
+    return {"acked_seq": attempt.get("mcq_seq", 0), "applied": 0, "stale": bool(fields)}
+
+async def buffer_mcq_answers(attempt_id: str, student_id: str, answers: Dict[str, str], seq: Optional[int]) -> dict:
+    """Write-behind autosave: validate against cached attempt state, then buffer"""
+    state = attempt_state_cache.get(attempt_id)
+    if state is None or state["student_id"] != student_id:
+        attempt = await db.attempts.find_one({"id": attempt_id, "student_id": student_id}, AUTOSAVE_ATTEMPT_PROJECTION)
+        if not attempt:
+            raise HTTPException(status_code=404, detail="Attempt not found")
+        if attempt["status"] != AttemptStatus.MCQ_IN_PROGRESS.value:
+            raise HTTPException(status_code=400, detail="MCQ section not active")
+        
+        deadline = await get_mcq_deadline(attempt)
+        if "deadline_at" not in attempt:
+            await db.attempts.update_one({"id": attempt_id}, {"$set": {"deadline_at": deadline}})
+        state = {"student_id": student_id, "deadline_at": deadline, "acked_seq": attempt.get("mcq_seq", 0)}
+        attempt_state_cache[attempt_id] = state
     
-    if datetime.now(timezone.utc) > mcq_started + timedelta(minutes=time_limit):
-        # Auto-submit if time expired
-        await submit_mcq_internal(attempt_id, current_user["id"])
+    now = datetime.now(timezone.utc)
+    if now > state["deadline_at"]:
+        await reject_expired_mcq_write(attempt_id, student_id, state["deadline_at"], now)
+    
+    if seq is not None and seq <= state["acked_seq"]:
+        return {"acked_seq": state["acked_seq"], "applied": 0, "stale": True}
+    
+    # Acknowledged once buffered (written within max_lag, retried if a flush fails). A submission
+    # that overtakes the flush grades the full answer snapshot the client sends with it.
+    answer_buffer.add(attempt_id, answers, seq)
+    if seq is not None:
+        state["acked_seq"] = max(state["acked_seq"], seq)
+    return {"acked_seq": seq, "applied": len(answers), "buffered": True}
+
+async def reject_expired_mcq_write(attempt_id: str, student_id: str, deadline: datetime, now: datetime):
+    """Refuse an autosave after the MCQ deadline, grading the attempt once the submit grace has passed"""
+    if now > deadline + timedelta(seconds=MCQ_AUTO_SUBMIT_DELAY_SECONDS):
+        await submit_mcq_internal(attempt_id, student_id)
         raise HTTPException(status_code=400, detail="Time expired - MCQ auto-submitted")
-    
-    await db.attempts.update_one(
-        {"id": attempt_id},
-        {"$set": {f"mcq_answers.{answer.question_id}": answer.selected_option}}
-    )
-    
+    raise HTTPException(status_code=400, detail="Time expired - submit your answers")
+
+@app.post("/api/attempts/{attempt_id}/save-mcq")
+async def save_mcq_answer(attempt_id: str, answer: MCQAnswer, current_user: dict = Depends(get_current_user)):
+    """Save MCQ answer (auto-save during exam)"""
+    await apply_mcq_answers(attempt_id, current_user["id"], {answer.question_id: answer.selected_option})
     return {"message": "Answer saved"}
 
+@app.post("/api/attempts/{attempt_id}/save-mcq-batch")
+async def save_mcq_answers_batch(attempt_id: str, batch: MCQAnswerBatch, current_user: dict = Depends(get_current_user)):
+    """Save many MCQ answers at once; stale or replayed batches are dropped"""
+    result = await apply_mcq_answers(attempt_id, current_user["id"], batch.answers, seq=batch.seq)
+    return {"message": "Answers saved", **result}
+
 @app.post("/api/attempts/{attempt_id}/submit-mcq")
-async def submit_mcq(attempt_id: str, current_user: dict = Depends(get_current_user)):
+async def submit_mcq(
+    attempt_id: str,
+    final: Optional[MCQSubmission] = None,
+    current_user: dict = Depends(get_current_user)
+):
     """Submit MCQ section and start written section"""
-    return await submit_mcq_internal(attempt_id, current_user["id"])
+    final_answers = final.answers if final else None
+    if final_answers:
+        validate_question_ids(final_answers)
+    return await submit_mcq_internal(attempt_id, current_user["id"], final_answers)
 
-async def submit_mcq_internal(attempt_id: str, student_id: str):
-    """Internal MCQ submission logic"""
-    attempt = await db.attempts.find_one({"id": attempt_id, "student_id": student_id})
-    
-    if not attempt:
-        raise HTTPException(status_code=404, detail="Attempt not found")
-    
-    exam = await db.exams.find_one({"id": attempt["exam_id"]}, {"_id": 0})
-    
-    # Auto-grade MCQ
-    score = 0
-    for question in exam.get("mcq_questions", []):
-        q_id = question.get("id") or str(question.get("question_number", ""))
-        student_answer = attempt["mcq_answers"].get(q_id)
-        correct = question.get("correct_option_id") or question.get("correct_answer")
-        if student_answer == correct:
-            score += 1
-    
-    # Update attempt - move to written section
-    now = datetime.now(timezone.utc)
-    await db.attempts.update_one(
-        {"id": attempt_id},
-        {
-            "$set": {
-                "status": AttemptStatus.WRITTEN_IN_PROGRESS.value,
-                "mcq_completed_at": now,
-                "mcq_score": score,
-                "written_started_at": now
-            }
-        }
-    )
-    
+def grade_mcq_answers(answers: Dict[str, str], exam_meta: dict) -> int:
+    """Count answers matching the exam's compiled answer key"""
+    return exam_meta["answer_key"].score(answers)
+
+def mcq_submission_result(score: int, exam_meta: dict) -> dict:
     return {
         "message": "MCQ submitted successfully",
         "mcq_score": score,
-        "total_mcq": len(exam.get("mcq_questions", [])),
+        "total_mcq": exam_meta["total_questions"],
         "next_section": "written",
-        "written_duration_minutes": exam.get("written_duration_minutes", 45)
+        "written_duration_minutes": exam_meta["written_duration_minutes"]
     }
 
+async def submit_mcq_internal(attempt_id: str, student_id: str, final_answers: Optional[Dict[str, str]] = None):
+    """Internal MCQ submission logic (idempotent: a second submit reports the recorded score)
+    
+    The client's final snapshot (accepted up to MCQ_SUBMIT_GRACE_SECONDS past
+    the deadline) is merged into the stored answers and written in the same
+    update that grades them. That update only matches while mcq_answers is
+    what was graded, so an autosave flushed by another worker in between
+    forces a re-grade instead of being silently left out of the score.
+    """
+    # Buffered autosaves must reach the attempt before it is graded
+    attempt_state_cache.pop(attempt_id, None)
+    await answer_buffer.flush_attempt(attempt_id)
+    
+    for retries_left in reversed(range(MCQ_SUBMIT_RETRIES)):
+        attempt = await db.attempts.find_one({"id": attempt_id, "student_id": student_id})
+        
+        if not attempt:
+            raise HTTPException(status_code=404, detail="Attempt not found")
+        
+        exam_meta = await get_grading_exam_meta(attempt["exam_id"])
+        if not exam_meta:
+            raise HTTPException(status_code=404, detail="Exam not found")
+        
+        if attempt["status"] != AttemptStatus.MCQ_IN_PROGRESS.value:
+            # Already submitted by the student, the session timer or the expiry sweep
+            return mcq_submission_result(attempt.get("mcq_score", 0), exam_meta)
+        
+        now = datetime.now(timezone.utc)
+        stored_answers = attempt.get("mcq_answers")
+        answers = dict(stored_answers or {})
+        fields = {}
+        if final_answers and now <= await get_mcq_deadline(attempt) + timedelta(seconds=MCQ_SUBMIT_GRACE_SECONDS):
+            answers.update(final_answers)
+            fields["mcq_answers"] = answers
+        
+        # Auto-grade MCQ
+        score = grade_mcq_answers(answers, exam_meta)
+        
+        # Update attempt - move to written section
+        written_deadline = now + timedelta(minutes=exam_meta["written_duration_minutes"])
+        # The last try grades whatever was read, so a stream of late flushes cannot stall the submission
+        unchanged = {"mcq_answers": stored_answers} if retries_left else {}
+        result = await db.attempts.update_one(
+            {"id": attempt_id, "status": AttemptStatus.MCQ_IN_PROGRESS.value, **unchanged},
+            {
+                "$set": {
+                    **fields,
+                    "status": AttemptStatus.WRITTEN_IN_PROGRESS.value,
+                    "mcq_completed_at": now,
+                    "mcq_score": score,
+                    "mcq_graded_version": exam_meta["version"],
+                    "written_started_at": now,
+                    "deadline_at": written_deadline
+                }
+            }
+        )
+        if result.modified_count:
+            deadline_sweeper.schedule(written_deadline)
+            break
+        # Answers changed under us, or a concurrent submission won: re-read and go again
+    else:
+        # Lost a race with a concurrent submission; report what it recorded
+        recorded = await db.attempts.find_one({"id": attempt_id}, {"_id": 0, "mcq_score": 1})
+        return mcq_submission_result((recorded or {}).get("mcq_score", score), exam_meta)
+    
+    response = mcq_submission_result(score, exam_meta)
+    await exam_sessions.send(attempt_id, {"type": "submitted", **response})
+    return response
+
+# ============================================================================
+# EXAM SESSION WEBSOCKET (autosave, timer sync, forced submission)
+# ============================================================================
+
+async def _exam_session_timer(websocket: WebSocket, attempt_id: str, student_id: str, deadline: datetime):
+    """Push authoritative remaining time; when it runs out, warn, wait out the submit grace, then auto-submit"""
+    try:
+        while True:
+            remaining = (deadline - datetime.now(timezone.utc)).total_seconds()
+            if remaining <= 0:
+                break
+            await websocket.send_json({"type": "time", "remaining_seconds": remaining})
+            await asyncio.sleep(min(EXAM_SESSION_TIME_SYNC_SECONDS, remaining))
+        
+        # Give the client its grace period to send the final snapshot before grading without it
+        await websocket.send_json({"type": "time_up", "auto_submitted": False, "submit_within_seconds": MCQ_SUBMIT_GRACE_SECONDS})
+        await asyncio.sleep(MCQ_AUTO_SUBMIT_DELAY_SECONDS)
+        result = await submit_mcq_internal(attempt_id, student_id)
+        await websocket.send_json({"type": "time_up", "auto_submitted": True, **result})
+        await websocket.close(code=1000)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # Socket already gone; the expiry sweep or the next request submits instead
+        logger.info(f"Exam session timer stopped for attempt {attempt_id}: {e}")
+
+async def _reject_socket_message(websocket: WebSocket, code: int, detail: str):
+    """Tell the client why its frame broke the protocol, then close the session"""
+    exam_sessions.stats["protocol_errors"] += 1
+    await websocket.send_json({"type": "error", "status": 400, "detail": detail})
+    await websocket.close(code=code)
+
+@app.websocket("/api/ws/attempts/{attempt_id}")
+async def exam_session_socket(websocket: WebSocket, attempt_id: str, token: str = Query("")):
+    """Long-lived MCQ session: answer deltas in, acks / time sync / forced submission out.
+    
+    Client messages:
+      {"type": "answers", "seq": n, "answers": {question_id: option}}
+      {"type": "sync"}
+      {"type": "submit", "answers": {...}}
+    
+    Frames that are not JSON objects close the socket with 1003; unknown
+    types or malformed fields (validated like the HTTP bodies) close it with 1008.
+    """
+    try:
+        user = await resolve_token_user(token)
+    except HTTPException:
+        await websocket.close(code=4401)
+        return
+    
+    attempt = await db.attempts.find_one(
+        {"id": attempt_id, "student_id": user["id"]},
+        AUTOSAVE_ATTEMPT_PROJECTION
+    )
+    if not attempt or attempt["status"] != AttemptStatus.MCQ_IN_PROGRESS.value:
+        await websocket.close(code=4409)
+        return
+    
+    deadline = await get_mcq_deadline(attempt)
+    await websocket.accept()
+    exam_sessions.register(attempt_id, websocket)
+    timer = asyncio.create_task(_exam_session_timer(websocket, attempt_id, user["id"], deadline))
+    
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except (ValueError, KeyError):  # Not JSON, or a binary frame
+                await _reject_socket_message(websocket, WS_CLOSE_UNSUPPORTED_DATA, "Messages must be JSON objects")
+                break
+            exam_sessions.stats["messages_received"] += 1
+            if not isinstance(message, dict):
+                await _reject_socket_message(websocket, WS_CLOSE_UNSUPPORTED_DATA, "Messages must be JSON objects")
+                break
+            kind = message.get("type")
+            
+            try:
+                if kind == "answers":
+                    batch = MCQAnswerBatch.model_validate(message)
+                elif kind == "submit":
+                    submission = MCQSubmission.model_validate(message)
+                elif kind != "sync":
+                    await _reject_socket_message(websocket, WS_CLOSE_POLICY_VIOLATION, f"Unknown message type: {kind}")
+                    break
+            except ValidationError as e:
+                await _reject_socket_message(
+                    websocket, WS_CLOSE_POLICY_VIOLATION, f"Invalid {kind} message: {e.errors(include_url=False)[0]['msg']}"
+                )
+                break
+            
+            if kind == "answers":
+                try:
+                    result = await apply_mcq_answers(attempt_id, user["id"], batch.answers, seq=batch.seq)
+                except HTTPException as e:
+                    await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.detail})
+                    continue
+                await websocket.send_json({"type": "ack", **result})
+            
+            elif kind == "sync":
+                remaining = max(0.0, (deadline - datetime.now(timezone.utc)).total_seconds())
+                await websocket.send_json({"type": "time", "remaining_seconds": remaining})
+            
+            elif kind == "submit":
+                final_answers = submission.answers
+                try:
+                    validate_question_ids(final_answers)
+                except HTTPException as e:
+                    await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.detail})
+                    continue
+                await submit_mcq_internal(attempt_id, user["id"], final_answers)  # Pushes "submitted" to this socket
+                await websocket.close(code=1000)
+                break
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        if not timer.done():  # After time_up the timer closes the socket under the receive loop
+            logger.error(f"Exam session error for attempt {attempt_id}: {e}")
+            try:
+                await websocket.close(code=1011)
+            except Exception:
+                pass  # Already closed
+    finally:
+        timer.cancel()
+        exam_sessions.unregister(attempt_id, websocket)
+
 @app.post("/api/attempts/{attempt_id}/submit-written")
 async def submit_written(attempt_id: str, current_user: dict = Depends(get_current_user)):
     """Student completes written section - opens parent upload window"""
@@ -656,16 +1569,18 @@ async def submit_written(attempt_id: str, current_user: dict = Depends(get_curre
     upload_window_end = upload_window_start + timedelta(minutes=PARENT_UPLOAD_WINDOW_MINUTES)
     
     await db.attempts.update_one(
-        {"id": attempt_id},
+        {"id": attempt_id, "status": AttemptStatus.WRITTEN_IN_PROGRESS.value},
         {
             "$set": {
                 "status": AttemptStatus.WAITING_PARENT_UPLOAD.value,
                 "written_completed_at": now,
                 "parent_upload_window_start": upload_window_start,
-                "parent_upload_window_end": upload_window_end
+                "parent_upload_window_end": upload_window_end,
+                "deadline_at": upload_window_end
             }
         }
     )
+    deadline_sweeper.schedule(upload_window_end)
     
     return {
         "message": "Written paper submitted successfully",
@@ -713,11 +1628,17 @@ async def get_parent_upload_status(student_id: str, current_user: dict = Depends
         }
     
     if now > window_end:
+        if attempt.get("upload_session_id") and attempt.get("deadline_at") and now <= ensure_utc(attempt["deadline_at"]):
+            # A resumable upload started inside the window is still in progress
+            return {
+                "upload_available": True,
+                "attempt_id": attempt["id"],
+                "upload_session_id": attempt["upload_session_id"],
+                "remaining_seconds": (ensure_utc(attempt["deadline_at"]) - now).total_seconds(),
+                "max_photos": MAX_PAPER_PHOTOS
+            }
         # Window expired - close it
-        await db.attempts.update_one(
-            {"id": attempt["id"]},
-            {"$set": {"status": AttemptStatus.PENDING_MARKING.value}}
-        )
+        await close_parent_upload_window(attempt["id"], now)
         return {"upload_available": False, "message": "Upload window expired"}
     
     remaining_seconds = (window_end - now).total_seconds()
@@ -725,8 +1646,9 @@ async def get_parent_upload_status(student_id: str, current_user: dict = Depends
     return {
         "upload_available": True,
         "attempt_id": attempt["id"],
+        "upload_session_id": attempt.get("upload_session_id"),
         "remaining_seconds": remaining_seconds,
-        "max_photos": 15
+        "max_photos": MAX_PAPER_PHOTOS
     }
 
 @app.post("/api/parent/upload-photos")
@@ -752,118 +1674,734 @@ async def upload_paper_photos(
     window_end = ensure_utc(attempt.get("parent_upload_window_end"))
     
     if window_end and now > window_end:
-        await db.attempts.update_one(
-            {"id": attempt_id},
-            {"$set": {"status": AttemptStatus.PENDING_MARKING.value}}
-        )
+        await close_parent_upload_window(attempt_id, now)
         raise HTTPException(status_code=400, detail="Upload window expired")
     
-    # Save photos
-    photo_paths = []
-    secret_code = attempt["secret_code"]
+    if len(photos) > MAX_PAPER_PHOTOS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PAPER_PHOTOS} photos allowed")
     
-    for i, photo in enumerate(photos):
-        if not photo.content_type.startswith("image/"):
-            continue
-        
-        ext = photo.filename.split(".")[-1] if "." in photo.filename else "jpg"
-        filename = f"{secret_code}_page_{i+1}.{ext}"
-        filepath = os.path.join(UPLOAD_DIR, filename)
-        
-        with open(filepath, "wb") as f:
-            content = await photo.read()
-            f.write(content)
-        
-        photo_paths.append(f"/uploads/papers/{filename}")
+    # Stream photos into staging (per-file and per-request size caps), then store by content hash
+    pages = []
+    staged_paths = []
+    bytes_received = 0
     
-    # Update attempt
-    await db.attempts.update_one(
-        {"id": attempt_id},
-        {
-            "$set": {
-                "status": AttemptStatus.PENDING_MARKING.value,
-                "paper_photos": photo_paths,
-                "photos_uploaded_at": now
-            }
-        }
-    )
+    try:
+        for photo in photos:
+            if not (photo.content_type or "").startswith("image/"):
+                continue
+            
+            remaining = MAX_PHOTO_REQUEST_BYTES - bytes_received
+            if remaining <= 0:
+                raise HTTPException(status_code=413, detail="Total upload size limit exceeded")
+            ext = upload_extension(photo, "jpg")
+            staged_path = media_store.staging_path(ext)
+            saved = await stream_upload_to_file(photo, staged_path, min(MAX_PHOTO_BYTES, remaining))
+            bytes_received += saved["bytes"]
+            
+            # Keep the staged copy as the image pipeline's input
+            stored = await media_store.put_file(staged_path, saved["sha256"], ext, photo.content_type, keep_source=True)
+            staged_paths.append(staged_path)
+            pages.append({"url": stored["url"], "bytes": saved["bytes"], "sha256": saved["sha256"], "deduplicated": stored["deduplicated"]})
+    except BaseException:
+        for staged_path in staged_paths:
+            await media_store.discard_staged(staged_path)
+        raise
+    
+    logger.info(f"Attempt {attempt_id}: received {len(pages)} photos, {bytes_received} bytes")
+    
+    if not await attach_paper_photos({"id": attempt_id}, pages, staged_paths, now):
+        raise HTTPException(status_code=400, detail="Upload window not active")
     
     return {
         "message": "Photos uploaded successfully",
-        "photos_count": len(photo_paths)
+        "photos_count": len(pages),
+        "bytes_received": bytes_received,
+        "pages": pages
     }
 
-# ============================================================================
-# MARKER/EXAMINER FLOW (Anonymous Marking)
-# ============================================================================
-
-@app.get("/api/marker/pending-papers")
-async def get_pending_papers(current_user: dict = Depends(get_current_user)):
-    """Marker gets papers to mark (anonymous - no student info)"""
-    if current_user["role"] not in ["marker", "teacher", "admin"]:
-        raise HTTPException(status_code=403, detail="Unauthorized")
+async def close_parent_upload_window(attempt_id: str, now: datetime):
+    """Send an attempt to marking once its upload window is over
     
-    # Get papers pending marking (show only secret code, not student info)
-    papers = await db.attempts.find(
-        {"status": AttemptStatus.PENDING_MARKING.value},
+    An open resumable upload session pushes deadline_at past the window end;
+    such attempts are left alone until the session runs out.
+    """
+    result = await db.attempts.update_one(
         {
-            "_id": 0,
-            "id": 1,
-            "secret_code": 1,
-            "grade": 1,
-            "paper_photos": 1,
-            "exam_id": 1,
-            "created_at": 1
-        }
-    ).sort("created_at", 1).to_list(50)
-    
-    return {"papers": papers}
+            "id": attempt_id,
+            "status": AttemptStatus.WAITING_PARENT_UPLOAD.value,
+            "deadline_at": {"$not": {"$gt": now}}
+        },
+        {"$set": {"status": AttemptStatus.PENDING_MARKING.value}, "$unset": {"deadline_at": ""}}
+    )
+    if result.modified_count:
+        await record_attempt_transition(AttemptStatus.WAITING_PARENT_UPLOAD.value, AttemptStatus.PENDING_MARKING.value)
 
-@app.post("/api/marker/claim-paper/{attempt_id}")
-async def claim_paper(attempt_id: str, current_user: dict = Depends(get_current_user)):
-    """Marker claims a paper for marking"""
-    if current_user["role"] not in ["marker", "teacher", "admin"]:
-        raise HTTPException(status_code=403, detail="Unauthorized")
+async def attach_paper_photos(attempt_filter: dict, pages: List[dict], staged_paths: List[str], now: datetime) -> bool:
+    """Atomically attach stored pages to a waiting attempt and send it to marking
     
+    Starts the image pipeline on success; discards the staged copies otherwise.
+    """
+    upload_id = str(uuid.uuid4())
     result = await db.attempts.update_one(
-        {"id": attempt_id, "status": AttemptStatus.PENDING_MARKING.value},
+        {**attempt_filter, "status": AttemptStatus.WAITING_PARENT_UPLOAD.value},
         {
             "$set": {
-                "status": AttemptStatus.MARKING_IN_PROGRESS.value,
-                "marking_assigned_to": current_user["id"],
-                "marking_started_at": datetime.now(timezone.utc)
-            }
+                "status": AttemptStatus.PENDING_MARKING.value,
+                "paper_photos": [page["url"] for page in pages],
+                "paper_photo_checksums": [page["sha256"] for page in pages],
+                "photo_upload_id": upload_id,
+                "photos_uploaded_at": now
+            },
+            "$unset": {"deadline_at": "", "paper_photo_variants": ""}
         }
     )
-    
     if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Paper not available")
-    
-    return {"message": "Paper claimed successfully"}
+        for staged_path in staged_paths:
+            await media_store.discard_staged(staged_path)
+        return False
+    await record_attempt_transition(AttemptStatus.WAITING_PARENT_UPLOAD.value, AttemptStatus.PENDING_MARKING.value)
+    run_in_background(normalize_paper_photos(attempt_filter["id"], upload_id, staged_paths))
+    return True
+
+PAPER_VARIANT_TYPES = {"marking": ("jpg", "image/jpeg"), "webp": ("webp", "image/webp"), "thumbnail": ("jpg", "image/jpeg")}
+
+async def normalize_paper_photos(attempt_id: str, upload_id: str, staged_paths: List[str]):
+    """Build marking-resolution and thumbnail variants for an upload, then record them on the attempt
+    
+    paper_photos stays a list of original URLs (clients index into it); the
+    variants go into the parallel paper_photo_variants list, one entry per
+    page, None where a page could not be processed.
+    """
+    try:
+        results = await asyncio.gather(*(
+            image_pipeline.process(path, media_store.staging_dir, os.path.basename(path).rsplit(".", 1)[0])
+            for path in staged_paths
+        ))
+        variants = []
+        for result in results:
+            if result is None:
+                variants.append(None)
+                continue
+            page = {
+                "width": result["variants"]["marking"]["width"],
+                "height": result["variants"]["marking"]["height"]
+            }
+            for name, variant in result["variants"].items():
+                ext, content_type = PAPER_VARIANT_TYPES[name]
+                stored = await media_store.put_file(variant["path"], variant["sha256"], ext, content_type)
+                page[name] = stored["url"]
+            variants.append(page)
+        # Skip if the parent re-uploaded in the meantime
+        await db.attempts.update_one(
+            {"id": attempt_id, "photo_upload_id": upload_id},
+            {"$set": {"paper_photo_variants": variants}}
+        )
+    finally:
+        for path in staged_paths:
+            await media_store.discard_staged(path)
+
+# Resumable uploads: create a session inside the window, PUT each page's bytes
+# by offset (in as many requests as the connection allows), query what has
+# arrived, then finalize. Pages are staged as pre-sized sparse files so chunks
+# can land in any order, on any worker sharing the uploads volume.
+
+def merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+    """Merge received [start, end) byte ranges"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def upload_session_view(session: dict) -> dict:
+    pages = []
+    for page in session["pages"]:
+        received = merge_ranges(page.get("ranges", []))
+        received_bytes = sum(end - start for start, end in received)
+        pages.append({
+            "index": page["index"],
+            "size": page["size"],
+            "received": received,
+            "received_bytes": received_bytes,
+            "complete": received_bytes >= page["size"]
+        })
+    status_value = session["status"]
+    if status_value == "open" and datetime.now(timezone.utc) > ensure_utc(session["expires_at"]):
+        status_value = "expired"  # Not swept yet, but no longer accepts bytes
+    return {
+        "id": session["id"],
+        "attempt_id": session["attempt_id"],
+        "status": status_value,
+        "expires_at": session["expires_at"],
+        "pages": pages,
+        "complete": all(page["complete"] for page in pages)
+    }
 
-@app.post("/api/marker/submit-marks/{attempt_id}")
-async def submit_marks(
-    attempt_id: str,
-    marks: Dict[str, Any],
-    current_user: dict = Depends(get_current_user)
-):
-    """Marker submits marks for written paper"""
-    if current_user["role"] not in ["marker", "teacher", "admin"]:
-        raise HTTPException(status_code=403, detail="Unauthorized")
+def _create_sparse_file(path: str, size: int):
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+def _write_at(path: str, offset: int, data: bytes):
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        os.pwrite(fd, data, offset)
+    finally:
+        os.close(fd)
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def get_open_upload_session(session_id: str, parent_id: str) -> dict:
+    session = await db.upload_sessions.find_one({"id": session_id, "parent_id": parent_id}, {"_id": 0})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if session["status"] != "open":
+        raise HTTPException(status_code=409, detail=f"Upload session is {session['status']}")
+    if datetime.now(timezone.utc) > ensure_utc(session["expires_at"]):
+        raise HTTPException(status_code=410, detail="Upload session expired")
+    return session
+
+@app.post("/api/parent/upload-sessions")
+async def create_upload_session(data: UploadSessionCreate, current_user: dict = Depends(get_current_user)):
+    """Start a resumable photo upload; the upload window applies here, not to the transfer
     
-    attempt = await db.attempts.find_one({"id": attempt_id})
+    An attempt has at most one open session: while it lasts, this returns it
+    (so a retry resumes instead of starting over) and clients whose photo
+    selection changed cancel it first. A replacement for a cancelled session
+    may be opened after the window, until the deadline the first one set.
+    """
+    if current_user["role"] != "parent":
+        raise HTTPException(status_code=403, detail="Only parents can upload")
+    if not data.pages or len(data.pages) > MAX_PAPER_PHOTOS:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {MAX_PAPER_PHOTOS} photos allowed")
+    if any(page.size <= 0 or page.size > MAX_PHOTO_BYTES for page in data.pages):
+        raise HTTPException(status_code=413, detail=f"Each photo must be under {MAX_PHOTO_BYTES // (1024 * 1024)}MB")
+    if sum(page.size for page in data.pages) > MAX_PHOTO_REQUEST_BYTES:
+        raise HTTPException(status_code=413, detail="Total upload size limit exceeded")
+    if any(not page.content_type.startswith("image/") for page in data.pages):
+        raise HTTPException(status_code=400, detail="Only images can be uploaded")
     
+    attempt = await db.attempts.find_one(
+        {"id": data.attempt_id},
+        {"_id": 0, "id": 1, "status": 1, "parent_upload_window_end": 1, "upload_session_id": 1, "deadline_at": 1}
+    )
     if not attempt:
         raise HTTPException(status_code=404, detail="Attempt not found")
+    if attempt["status"] != AttemptStatus.WAITING_PARENT_UPLOAD.value:
+        raise HTTPException(status_code=400, detail="Upload window not active")
+    
+    now = datetime.now(timezone.utc)
+    previous_session_id = attempt.get("upload_session_id")
+    if previous_session_id:
+        existing = await db.upload_sessions.find_one(
+            {"id": previous_session_id, "parent_id": current_user["id"], "status": "open", "expires_at": {"$gt": now}},
+            {"_id": 0}
+        )
+        if existing:
+            return upload_session_view(existing)
+    
+    expires_at = now + timedelta(minutes=UPLOAD_SESSION_TTL_MINUTES)
+    window_end = ensure_utc(attempt.get("parent_upload_window_end"))
+    if window_end and now > window_end:
+        held_until = ensure_utc(attempt.get("deadline_at")) if previous_session_id else None
+        if not held_until or now > held_until:
+            await close_parent_upload_window(data.attempt_id, now)
+            raise HTTPException(status_code=400, detail="Upload window expired")
+        # Replacing a session opened inside the window: keep its deadline
+        expires_at = held_until
+    
+    session_id = str(uuid.uuid4())
+    pages = []
+    for i, page in enumerate(data.pages):
+        ext = mimetypes.guess_extension(page.content_type) or ".jpg"
+        staged_path = media_store.staging_path(ext.lstrip(".").replace("jpeg", "jpg"))
+        await run_in_threadpool(_create_sparse_file, staged_path, page.size)
+        pages.append({
+            "index": i,
+            "size": page.size,
+            "content_type": page.content_type,
+            "sha256": page.sha256.lower() if page.sha256 else None,
+            "staged_path": staged_path,
+            "ranges": []
+        })
+    
+    await db.upload_sessions.insert_one({
+        "id": session_id,
+        "attempt_id": data.attempt_id,
+        "parent_id": current_user["id"],
+        "status": "open",
+        "pages": pages,
+        "created_at": now,
+        "expires_at": expires_at
+    })
+    
+    # Hold the window open for the transfer; the sweeper closes it if the session runs out.
+    # Conditional on the session we looked at, so concurrent creates leave one winner.
+    result = await db.attempts.update_one(
+        {
+            "id": data.attempt_id,
+            "status": AttemptStatus.WAITING_PARENT_UPLOAD.value,
+            "upload_session_id": previous_session_id
+        },
+        {"$set": {"upload_session_id": session_id, "deadline_at": expires_at}}
+    )
+    if result.modified_count == 0:
+        await discard_upload_session(session_id, "cancelled")
+        current = await db.attempts.find_one(
+            {"id": data.attempt_id, "status": AttemptStatus.WAITING_PARENT_UPLOAD.value},
+            {"_id": 0, "upload_session_id": 1}
+        )
+        winner = current and await db.upload_sessions.find_one(
+            {"id": current.get("upload_session_id"), "parent_id": current_user["id"], "status": "open"},
+            {"_id": 0}
+        )
+        if not winner:
+            raise HTTPException(status_code=400, detail="Upload window not active")
+        return upload_session_view(winner)
+    
+    session = await db.upload_sessions.find_one({"id": session_id}, {"_id": 0})
+    return upload_session_view(session)
+
+@app.post("/api/parent/upload-sessions/{session_id}/cancel")
+async def cancel_upload_session(session_id: str, current_user: dict = Depends(get_current_user)):
+    """Abandon an open session (e.g. the parent picked other photos) and drop its staged bytes"""
+    if current_user["role"] != "parent":
+        raise HTTPException(status_code=403, detail="Only parents can upload")
     
-    if attempt["marking_assigned_to"] != current_user["id"]:
+    session = await db.upload_sessions.find_one(
+        {"id": session_id, "parent_id": current_user["id"]}, {"_id": 0, "status": 1}
+    )
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if session["status"] != "open":
+        raise HTTPException(status_code=409, detail=f"Upload session is {session['status']}")
+    await discard_upload_session(session_id, "cancelled")
+    return {"message": "Upload session cancelled"}
+
+@app.put("/api/parent/upload-sessions/{session_id}/pages/{page_index}")
+async def upload_session_chunk(
+    session_id: str,
+    page_index: int,
+    request: Request,
+    offset: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user)
+):
+    """Write raw bytes of one page starting at `offset`; whatever arrives before a disconnect is kept"""
+    if current_user["role"] != "parent":
+        raise HTTPException(status_code=403, detail="Only parents can upload")
+    
+    session = await get_open_upload_session(session_id, current_user["id"])
+    if page_index < 0 or page_index >= len(session["pages"]):
+        raise HTTPException(status_code=404, detail="Page not found")
+    page = session["pages"][page_index]
+    if offset >= page["size"]:
+        raise HTTPException(status_code=416, detail="Offset beyond end of page")
+    
+    position = offset
+    buffer = bytearray()
+    try:
+        async for chunk in request.stream():
+            if position + len(buffer) + len(chunk) > page["size"]:
+                raise HTTPException(status_code=413, detail="Chunk runs past the declared page size")
+            buffer.extend(chunk)
+            if len(buffer) >= UPLOAD_CHUNK_BYTES:
+                await run_in_threadpool(_write_at, page["staged_path"], position, bytes(buffer))
+                position += len(buffer)
+                buffer.clear()
+    except ClientDisconnect:
+        pass  # Keep what arrived; the client resumes from the received ranges
+    finally:
+        # Buffered bytes were all checked against the page size already
+        if buffer:
+            await run_in_threadpool(_write_at, page["staged_path"], position, bytes(buffer))
+            position += len(buffer)
+        if position > offset:
+            await db.upload_sessions.update_one(
+                {"id": session_id},
+                {"$push": {f"pages.{page_index}.ranges": [offset, position]}}
+            )
+    
+    received = merge_ranges(page.get("ranges", []) + [[offset, position]])
+    return {
+        "page": page_index,
+        "offset": offset,
+        "bytes_written": position - offset,
+        "received": received,
+        "complete": sum(end - start for start, end in received) >= page["size"]
+    }
+
+@app.get("/api/parent/upload-sessions/{session_id}")
+async def get_upload_session(session_id: str, current_user: dict = Depends(get_current_user)):
+    """Received byte ranges per page, so a client can resume where it left off"""
+    if current_user["role"] != "parent":
+        raise HTTPException(status_code=403, detail="Only parents can upload")
+    
+    session = await db.upload_sessions.find_one({"id": session_id, "parent_id": current_user["id"]}, {"_id": 0})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return upload_session_view(session)
+
+@app.post("/api/parent/upload-sessions/{session_id}/finalize")
+async def finalize_upload_session(session_id: str, current_user: dict = Depends(get_current_user)):
+    """Verify every page arrived, store them and attach them to the attempt in one update"""
+    if current_user["role"] != "parent":
+        raise HTTPException(status_code=403, detail="Only parents can upload")
+    
+    await get_open_upload_session(session_id, current_user["id"])
+    # Claim the session so concurrent finalize calls cannot both attach it
+    session = await db.upload_sessions.find_one_and_update(
+        {"id": session_id, "status": "open"},
+        {"$set": {"status": "finalizing"}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not session:
+        raise HTTPException(status_code=409, detail="Upload session is already being finalized")
+    
+    async def reopen(status_code: int, detail):
+        await db.upload_sessions.update_one({"id": session_id, "status": "finalizing"}, {"$set": {"status": "open"}})
+        raise HTTPException(status_code=status_code, detail=detail)
+    
+    view = upload_session_view(session)
+    missing = [page["index"] for page in view["pages"] if not page["complete"]]
+    if missing:
+        await reopen(409, {"message": "Upload incomplete", "missing_pages": missing})
+    
+    pages = []
+    for page in session["pages"]:
+        sha256 = await run_in_threadpool(_sha256_file, page["staged_path"])
+        if page["sha256"] and page["sha256"] != sha256:
+            # Reset the page so the client re-sends it
+            await db.upload_sessions.update_one({"id": session_id}, {"$set": {f"pages.{page['index']}.ranges": []}})
+            await reopen(422, {"message": "Checksum mismatch", "page": page["index"]})
+        ext = page["staged_path"].rsplit(".", 1)[-1]
+        stored = await media_store.put_file(page["staged_path"], sha256, ext, page["content_type"], keep_source=True)
+        pages.append({"url": stored["url"], "bytes": page["size"], "sha256": sha256, "deduplicated": stored["deduplicated"]})
+    
+    now = datetime.now(timezone.utc)
+    attached = await attach_paper_photos(
+        {"id": session["attempt_id"], "upload_session_id": session_id},
+        pages,
+        [page["staged_path"] for page in session["pages"]],
+        now
+    )
+    await db.upload_sessions.update_one(
+        {"id": session_id},
+        {"$set": {"status": "finalized" if attached else "rejected", "finalized_at": now}}
+    )
+    if not attached:
+        raise HTTPException(status_code=400, detail="Upload window not active")
+    
+    logger.info(f"Attempt {session['attempt_id']}: upload session {session_id} finalized with {len(pages)} photos")
+    return {
+        "message": "Photos uploaded successfully",
+        "photos_count": len(pages),
+        "bytes_received": sum(page["bytes"] for page in pages),
+        "pages": pages
+    }
+
+async def discard_upload_session(session_id: str, status_value: str):
+    session = await db.upload_sessions.find_one_and_update(
+        {"id": session_id, "status": {"$in": ["open", "finalizing"]}},
+        {"$set": {"status": status_value}},
+        projection={"_id": 0, "pages.staged_path": 1}
+    )
+    if session:
+        for page in session.get("pages", []):
+            await media_store.discard_staged(page["staged_path"])
+
+async def expire_upload_sessions():
+    """Drop staged bytes of upload sessions that ran out before finalize"""
+    now = datetime.now(timezone.utc)
+    expired = await db.upload_sessions.find(
+        {"status": "open", "expires_at": {"$lt": now}},
+        {"_id": 0, "id": 1}
+    ).to_list(500)
+    for session in expired:
+        await discard_upload_session(session["id"], "expired")
+    if expired:
+        logger.info(f"Expired {len(expired)} upload sessions")
+
+def marker_photo_view(attempt: dict) -> dict:
+    """Signed photo URLs for markers: marking-resolution images and thumbnails where available"""
+    originals = attempt.get("paper_photos") or []
+    variants = attempt.get("paper_photo_variants") or []
+    photos, thumbnails = [], []
+    for i, original in enumerate(originals):
+        variant = variants[i] if i < len(variants) else None
+        photos.append(media_url(variant["marking"] if variant else original))
+        thumbnails.append(media_url(variant["thumbnail"] if variant else original))
+    return {"paper_photos": photos, "thumbnails": thumbnails, "original_photos": [media_url(url) for url in originals]}
+
+# ============================================================================
+# MEDIA SERVING
+# ============================================================================
+
+def media_url(stored_url: Optional[str]) -> Optional[str]:
+    """Signed, expiring /api/media URL for a stored file, whatever the backend (other URLs pass through)"""
+    key = media_store.key_for(stored_url)
+    return media_signer.sign(key) if key else stored_url
+
+@app.api_route("/api/media/{key:path}", methods=["GET", "HEAD"])
+async def serve_media(
+    key: str,
+    request: Request,
+    expires: int = Query(...),
+    sig: str = Query(...)
+):
+    """Serve a stored file through a signed URL, with strong ETags and Range support"""
+    if not media_signer.verify(key, expires, sig):
+        raise HTTPException(status_code=403, detail="Invalid or expired media link")
+    if ".." in key.split("/") or key.startswith("staging/"):
+        raise HTTPException(status_code=404, detail="Not found")
+    
+    path = media_store.local_path(key)
+    if path is None:
+        # Private bucket: hand out a presigned URL that outlives only this request
+        return Response(status_code=307, headers={"Location": media_store.download_url(key), "Cache-Control": "private, no-store"})
+    try:
+        stat = await run_in_threadpool(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not found")
+    
+    if key.startswith("blobs/"):
+        # Content-addressed: the name is the sha256, so the bytes can never change
+        etag = f'"{os.path.basename(key).split(".")[0]}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL.replace("public", "private")
+    else:
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        cache_control = "private, max-age=3600"
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True)
+    }
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    if MEDIA_ACCEL_REDIRECT_PREFIX:
+        # Hand the transfer (including Range requests) to nginx
+        return Response(headers={**headers, "X-Accel-Redirect": MEDIA_ACCEL_REDIRECT_PREFIX + key}, media_type=media_type)
+    
+    size = stat.st_size
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    
+    if byte_range is None:
+        if size == 0:
+            return Response(headers=headers, media_type=media_type)
+        return MediaFileResponse(path, 0, size - 1, headers=headers, media_type=media_type)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return MediaFileResponse(path, start, end, status_code=206, headers=headers, media_type=media_type)
+
+# ============================================================================
+# MARKER/EXAMINER FLOW (Anonymous Marking)
+# ============================================================================
+
+# Fields a marker may see (anonymous - no student info)
+MARKER_PAPER_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "secret_code": 1,
+    "grade": 1,
+    "language": 1,
+    "paper_photos": 1,
+    "paper_photo_variants": 1,
+    "exam_id": 1,
+    "created_at": 1,
+    "deadline_at": 1
+}
+
+def marker_paper_view(paper: dict, leased: bool = False) -> dict:
+    paper.update(marker_photo_view(paper))
+    paper.pop("paper_photo_variants", None)
+    lease_expires_at = paper.pop("deadline_at", None)
+    if leased:
+        paper["lease_expires_at"] = lease_expires_at
+    return paper
+
+@app.get("/api/marker/pending-papers")
+async def get_pending_papers(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_current_user)
+):
+    """Marker gets papers to mark, oldest first (anonymous - no student info)"""
+    if current_user["role"] not in ["marker", "teacher", "admin"]:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    # Get papers pending marking (show only secret code, not student info)
+    papers, next_cursor = await keyset_page(
+        db.attempts,
+        {"status": AttemptStatus.PENDING_MARKING.value},
+        MARKER_PAPER_PROJECTION,
+        cursor,
+        limit,
+        direction=1
+    )
+    
+    return {"papers": [marker_paper_view(paper) for paper in papers], "next_cursor": next_cursor}
+
+@app.post("/api/marker/claim-next")
+async def claim_next_paper(
+    grade: Optional[str] = None,
+    language: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Lease the oldest pending paper for the marker's grade/language in one atomic step"""
+    if current_user["role"] not in ["marker", "teacher", "admin"]:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    held = await db.attempts.count_documents({
+        "status": AttemptStatus.MARKING_IN_PROGRESS.value,
+        "marking_assigned_to": current_user["id"]
+    })
+    if held >= marking_queue.batch_size:
+        raise HTTPException(status_code=409, detail=f"You already hold {held} papers - mark or release them first")
+    
+    paper = await marking_queue.claim_next(current_user["id"], grade, language, MARKER_PAPER_PROJECTION)
+    if not paper:
+        return {"paper": None, "message": "No papers pending"}
+    return {"paper": marker_paper_view(paper, leased=True)}
+
+@app.post("/api/marker/claim-batch")
+async def claim_paper_batch(
+    grade: Optional[str] = None,
+    language: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Hold up to MARKER_BATCH_SIZE leased papers, with photo and thumbnail URLs ready for prefetching"""
+    if current_user["role"] not in ["marker", "teacher", "admin"]:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    papers = await marking_queue.fill(current_user["id"], grade, language, MARKER_PAPER_PROJECTION)
+    return {
+        "papers": [marker_paper_view(paper, leased=True) for paper in papers],
+        "batch_size": marking_queue.batch_size
+    }
+
+@app.post("/api/marker/claim-paper/{attempt_id}")
+async def claim_paper(attempt_id: str, current_user: dict = Depends(get_current_user)):
+    """Marker claims a paper for marking"""
+    if current_user["role"] not in ["marker", "teacher", "admin"]:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    if not await marking_queue.claim(attempt_id, current_user["id"]):
+        raise HTTPException(status_code=400, detail="Paper not available")
+    
+    return {"message": "Paper claimed successfully"}
+
+@app.post("/api/marker/papers/{attempt_id}/renew-lease")
+async def renew_marking_lease(attempt_id: str, current_user: dict = Depends(get_current_user)):
+    """Keep a paper that is taking longer than the lease to mark"""
+    if current_user["role"] not in ["marker", "teacher", "admin"]:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    lease_expires_at = await marking_queue.renew(attempt_id, current_user["id"])
+    if lease_expires_at is None:
+        raise HTTPException(status_code=409, detail="Lease expired - paper returned to the queue")
+    return {"lease_expires_at": lease_expires_at}
+
+@app.post("/api/marker/papers/{attempt_id}/release")
+async def release_marking_lease(attempt_id: str, current_user: dict = Depends(get_current_user)):
+    """Hand a held paper back to the queue without marking it"""
+    if current_user["role"] not in ["marker", "teacher", "admin"]:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    if not await marking_queue.release(attempt_id, current_user["id"]):
+        raise HTTPException(status_code=409, detail="You do not hold this paper")
+    return {"message": "Paper returned to the queue"}
+
+async def next_marker_papers(marker_id: str, grade: Optional[str], language: Optional[str], prefetch: bool = False) -> dict:
+    """The marker's next held paper (lease renewed) and the rest of their batch
+    
+    Only with prefetch (batch markers) is the batch topped back up to
+    MARKER_BATCH_SIZE; otherwise nothing new is leased on the marker's behalf.
+    """
+    if prefetch:
+        papers = await marking_queue.fill(marker_id, grade, language, MARKER_PAPER_PROJECTION)
+    else:
+        papers = await marking_queue.held(marker_id, MARKER_PAPER_PROJECTION)
+    if not papers:
+        return {"next_paper": None, "upcoming_papers": []}
+    lease_expires_at = await marking_queue.renew(papers[0]["id"], marker_id)
+    if lease_expires_at:
+        papers[0]["deadline_at"] = lease_expires_at
+    views = [marker_paper_view(paper, leased=True) for paper in papers]
+    return {"next_paper": views[0], "upcoming_papers": views[1:]}
+
+def marks_response(attempt: dict) -> dict:
+    return {
+        "message": "Marks submitted successfully",
+        "written_score": attempt.get("written_score", 0),
+        "total_score": attempt.get("total_score", 0)
+    }
+
+@app.post("/api/marker/submit-marks/{attempt_id}")
+async def submit_marks(
+    attempt_id: str,
+    marks: Dict[str, Any],
+    grade: Optional[str] = None,
+    language: Optional[str] = None,
+    prefetch: bool = False,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Marker submits marks for written paper
+    
+    The marks, the status change and the payment (as an outbox entry) are one
+    single-document update, so they cannot be split by a crash. Repeating a
+    submission (double-click, client retry) returns the recorded result
+    instead of paying twice. With prefetch the marker's batch is topped up.
+    """
+    if current_user["role"] not in ["marker", "teacher", "admin"]:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    projection = {
+        "_id": 0, "id": 1, "student_id": 1, "status": 1, "marking_assigned_to": 1, "mcq_score": 1,
+        "written_score": 1, "total_score": 1, "marking_submission_key": 1
+    }
+    attempt = await db.attempts.find_one({"id": attempt_id}, projection)
+    
+    if not attempt:
+        raise HTTPException(status_code=404, detail="Attempt not found")
+    
+    if attempt.get("marking_assigned_to") != current_user["id"]:
         raise HTTPException(status_code=403, detail="Paper not assigned to you")
     
+    if attempt["status"] != AttemptStatus.MARKING_IN_PROGRESS.value:
+        return await replay_marks_submission(attempt, idempotency_key)
+    
     written_score = marks.get("essay_marks", 0) + sum(marks.get("short_answer_marks", []))
     total_score = attempt.get("mcq_score", 0) + written_score
+    now = datetime.now(timezone.utc)
+    payment = {
+        "id": str(uuid.uuid4()),
+        "marker_id": current_user["id"],
+        "attempt_id": attempt_id,
+        "paper_type": "written",
+        "amount": MARKER_PAYMENT_PER_PAPER,
+        "status": "pending",
+        "created_at": now
+    }
     
-    await db.attempts.update_one(
-        {"id": attempt_id},
+    result = await db.attempts.update_one(
+        {"id": attempt_id, "status": AttemptStatus.MARKING_IN_PROGRESS.value, "marking_assigned_to": current_user["id"]},
         {
             "$set": {
                 "status": AttemptStatus.COMPLETED.value,
@@ -872,47 +2410,68 @@ async def submit_marks(
                 "short_answer_marks": marks.get("short_answer_marks", []),
                 "marker_comments": marks.get("comments", ""),
                 "total_score": total_score,
-                "marking_completed_at": datetime.now(timezone.utc)
-            }
+                "marking_completed_at": now,
+                "marking_submission_key": idempotency_key or payment["id"],
+                "payment_outbox": payment
+            },
+            "$unset": {"deadline_at": ""}
         }
     )
+    if result.modified_count == 0:
+        # A concurrent submission (or the lease reaper) got there first
+        attempt = await db.attempts.find_one({"id": attempt_id}, projection)
+        if not attempt or attempt.get("marking_assigned_to") != current_user["id"]:
+            raise HTTPException(status_code=409, detail="Lease expired - paper returned to the queue")
+        return await replay_marks_submission(attempt, idempotency_key)
     
-    # Record marker payment
-    await db.marker_payments.insert_one({
-        "id": str(uuid.uuid4()),
-        "marker_id": current_user["id"],
-        "attempt_id": attempt_id,
-        "paper_type": "written",
-        "amount": 50,  # Amount per paper - configurable
-        "status": "pending",
-        "created_at": datetime.now(timezone.utc)
-    })
+    await record_attempt_transition(AttemptStatus.MARKING_IN_PROGRESS.value, AttemptStatus.COMPLETED.value)
+    await results_summaries.invalidate([attempt.get("student_id")])
+    run_in_background(results_summaries.refresh(attempt.get("student_id")))
+    
+    # Best effort; the sweeper relays anything left behind
+    try:
+        await payment_ledger.relay([attempt_id])
+    except Exception as e:
+        logger.warning(f"Payment relay for attempt {attempt_id} deferred: {e}")
     
     return {
-        "message": "Marks submitted successfully",
-        "written_score": written_score,
-        "total_score": total_score
+        **marks_response({"written_score": written_score, "total_score": total_score}),
+        **await next_marker_papers(current_user["id"], grade, language, prefetch)
+    }
+
+async def replay_marks_submission(attempt: dict, idempotency_key: Optional[str]) -> dict:
+    """Answer a repeated submit-marks with the result that was recorded (never leases new papers)"""
+    if attempt["status"] != AttemptStatus.COMPLETED.value:
+        raise HTTPException(status_code=400, detail="Paper is not being marked")
+    if idempotency_key and attempt.get("marking_submission_key") not in (None, idempotency_key):
+        raise HTTPException(status_code=409, detail="Marks were already submitted for this paper")
+    return {
+        **marks_response(attempt),
+        "replayed": True,
+        **await next_marker_papers(attempt["marking_assigned_to"], None, None)
     }
 
 @app.get("/api/marker/my-payments")
-async def get_marker_payments(current_user: dict = Depends(get_current_user)):
-    """Marker views their payment history"""
+async def get_marker_payments(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user)
+):
+    """Marker views their payment history, newest first"""
     if current_user["role"] not in ["marker", "teacher"]:
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    payments = await db.marker_payments.find(
-        {"marker_id": current_user["id"]},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
-    
-    total_pending = sum(p["amount"] for p in payments if p["status"] == "pending")
-    total_paid = sum(p["amount"] for p in payments if p["status"] == "paid")
+    (payments, next_cursor), summary = await asyncio.gather(
+        keyset_page(db.marker_payments, {"marker_id": current_user["id"]}, {"_id": 0}, cursor, limit),
+        payment_ledger.summary(current_user["id"])
+    )
     
     return {
         "payments": payments,
-        "total_pending": total_pending,
-        "total_paid": total_paid,
-        "papers_marked": len(payments)
+        "next_cursor": next_cursor,
+        "total_pending": summary["total_pending"],
+        "total_paid": summary["total_paid"],
+        "papers_marked": summary["papers_marked"]
     }
 
 @app.put("/api/marker/bank-details")
@@ -933,6 +2492,7 @@ async def update_marker_bank_details(details: MarkerBankDetails, current_user: d
             }
         }}
     )
+    invalidate_user_cache(current_user["id"])
     
     return {"message": "Bank details updated"}
 
@@ -947,7 +2507,7 @@ async def get_marker_bank_details(current_user: dict = Depends(get_current_user)
 
 @app.get("/api/admin/marker-payments")
 async def admin_get_all_marker_payments(status_filter: Optional[str] = None, current_user: dict = Depends(get_current_user)):
-    """Admin views all marker payments"""
+    """Admin views payment totals per marker (payments themselves: /api/admin/marker-payments/{marker_id})"""
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     
@@ -955,31 +2515,28 @@ async def admin_get_all_marker_payments(status_filter: Optional[str] = None, cur
     if status_filter:
         query["status"] = status_filter
     
-    payments = await db.marker_payments.find(query, {"_id": 0}).sort("created_at", -1).to_list(500)
-    
-    # Group by marker
-    marker_summary = {}
-    for p in payments:
-        mid = p["marker_id"]
-        if mid not in marker_summary:
-            marker = await db.users.find_one({"id": mid}, {"_id": 0, "hashed_password": 0})
-            marker_summary[mid] = {
-                "marker_id": mid,
-                "marker_name": marker.get("full_name", "Unknown") if marker else "Unknown",
-                "bank_details": marker.get("bank_details") if marker else None,
-                "total_papers": 0,
-                "total_pending": 0,
-                "total_paid": 0,
-                "payments": []
-            }
-        marker_summary[mid]["total_papers"] += 1
-        if p["status"] == "pending":
-            marker_summary[mid]["total_pending"] += p["amount"]
-        else:
-            marker_summary[mid]["total_paid"] += p["amount"]
-        marker_summary[mid]["payments"].append(p)
+    markers = await db.marker_payments.aggregate(marker_payment_totals_pipeline(query)).to_list(None)
+    
+    return {"markers": markers, "total_payments": sum(m["total_papers"] for m in markers)}
+
+@app.get("/api/admin/marker-payments/{marker_id}")
+async def admin_get_marker_payment_list(
+    marker_id: str,
+    status_filter: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_current_user)
+):
+    """One marker's payments, newest first, with keyset pagination"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    query = {"marker_id": marker_id}
+    if status_filter:
+        query["status"] = status_filter
     
-    return {"markers": list(marker_summary.values()), "total_payments": len(payments)}
+    payments, next_cursor = await keyset_page(db.marker_payments, query, {"_id": 0}, cursor, limit)
+    return {"payments": payments, "next_cursor": next_cursor}
 
 @app.post("/api/admin/process-marker-payments")
 async def process_marker_payments(data: MarkerPaymentProcess, current_user: dict = Depends(get_current_user)):
@@ -996,6 +2553,8 @@ async def process_marker_payments(data: MarkerPaymentProcess, current_user: dict
             "reference_number": data.reference_number
         }}
     )
+    if result.modified_count:
+        await payment_ledger.rollup(await db.marker_payments.distinct("marker_id", {"id": {"$in": data.payment_ids}}))
     
     return {"message": f"{result.modified_count} payments marked as paid"}
 
@@ -1014,6 +2573,8 @@ async def pay_all_marker_pending(marker_id: str, data: Dict[str, str], current_u
             "reference_number": data.get("reference_number", "")
         }}
     )
+    if result.modified_count:
+        await payment_ledger.rollup([marker_id])
     
     return {"message": f"{result.modified_count} payments processed for marker"}
 
@@ -1021,190 +2582,241 @@ async def pay_all_marker_pending(marker_id: str, data: Dict[str, str], current_u
 # BULK CSV STUDENT IMPORT
 # ============================================================================
 
+import_leases = JobLeases("student_import_jobs")
+
 @app.post("/api/admin/import-students-csv")
 async def import_students_csv(
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user)
 ):
-    """Admin bulk imports students from CSV file"""
+    """Admin bulk imports students from CSV file, as a background job (poll /api/admin/import-jobs/{id})"""
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     
-    content = await file.read()
-    text = content.decode('utf-8-sig')
-    reader = csv.DictReader(io.StringIO(text))
+    staged_path = media_store.staging_path("csv")
+    await stream_upload_to_file(file, staged_path, MAX_IMPORT_CSV_BYTES)
     
-    results = {"created": 0, "skipped": 0, "errors": [], "details": []}
+    job = {
+        "id": str(uuid.uuid4()),
+        "filename": file.filename,
+        "status": "running",
+        "total": None,
+        "processed": 0,
+        "created": 0,
+        "skipped": 0,
+        "failed": 0,
+        "requested_by": current_user["id"],
+        "created_at": datetime.now(timezone.utc),
+        "staged_path": staged_path,
+        **import_leases.lease_fields()
+    }
+    await db.student_import_jobs.insert_one(job)
+    job.pop("_id", None)
+    job.pop("staged_path")
+    run_in_background(run_student_import_job(job["id"], staged_path, current_user["id"]))
+    return job
+
+async def run_student_import_job(job_id: str, staged_path: str, requested_by: str):
+    """Import the staged CSV under a lease renewed after every chunk
+    
+    If this worker dies the fail_orphaned_imports sweeper job marks the job
+    failed; the report keeps the rows imported so far.
+    """
+    async def report(outcome: dict):
+        await import_leases.heartbeat(job_id)
+        await db.student_import_jobs.update_one(
+            {"id": job_id},
+            {"$inc": {key: outcome[key] for key in ("processed", "created", "skipped", "failed")}}
+        )
+        await platform_stats.increment(
+            total_students=outcome["students_created"],
+            total_parents=outcome["parents_created"],
+            total_batches=outcome["batches_created"]
+        )
+        invalidate_user_cache(*outcome["linked_parent_ids"])
     
-    for i, row in enumerate(reader, 1):
-        try:
-            student_name = row.get('student_name', '').strip()
-            student_email = row.get('student_email', '').strip()
-            parent_name = row.get('parent_name', '').strip()
-            parent_email = row.get('parent_email', '').strip()
-            grade = row.get('grade', 'grade_5').strip()
-            language = row.get('language', 'si').strip()
-            school = row.get('school', '').strip()
-            teacher_incharge = row.get('teacher_incharge', '').strip()
-            
-            if not student_name or not student_email:
-                results["errors"].append(f"Row {i}: Missing student name or email")
-                results["skipped"] += 1
-                continue
-            
-            # Check if student already exists
-            existing = await db.users.find_one({"email": student_email})
-            if existing:
-                results["errors"].append(f"Row {i}: {student_email} already exists")
-                results["skipped"] += 1
-                continue
-            
-            # Normalize grade format
-            if not grade.startswith('grade_'):
-                grade = f"grade_{grade}"
-            
-            # Generate default password
-            default_password = f"exam{random.randint(1000, 9999)}"
-            
-            # Create student
-            student_id = generate_student_id()
-            student_user = {
-                "id": str(uuid.uuid4()),
-                "student_id": student_id,
-                "email": student_email,
-                "hashed_password": get_password_hash(default_password),
-                "full_name": student_name,
-                "role": "student",
-                "grade": grade,
-                "language": language,
-                "school": school,
-                "teacher_incharge": teacher_incharge,
-                "created_at": datetime.now(timezone.utc),
-                "is_active": True
+    try:
+        total = await run_in_threadpool(count_csv_rows, staged_path)
+        await db.student_import_jobs.update_one({"id": job_id}, {"$set": {"total": total}})
+        importer = StudentImporter(db, job_id, requested_by, get_password_hash, generate_student_id)
+        totals = await importer.run(staged_path, on_chunk=report)
+        await db.student_import_jobs.update_one(
+            {"id": job_id, "lease_owner": WORKER_ID},
+            {
+                "$set": {"status": "completed", "elapsed_ms": totals["elapsed_ms"], "completed_at": datetime.now(timezone.utc)},
+                "$unset": {"lease_until": ""}
             }
-            await db.users.insert_one(student_user)
-            
-            detail = {
-                "row": i,
-                "student_name": student_name,
-                "student_email": student_email,
-                "student_password": default_password,
-                "student_id": student_id
+        )
+    except LostLease as e:
+        logger.warning(f"Student import job {job_id} stopped: {e}")
+    except Exception as e:
+        logger.error(f"Student import job {job_id} failed: {e}")
+        error = "File is not UTF-8 encoded CSV" if isinstance(e, UnicodeDecodeError) else str(e)
+        await db.student_import_jobs.update_one(
+            {"id": job_id, "lease_owner": WORKER_ID},
+            {
+                "$set": {"status": "failed", "error": error, "completed_at": datetime.now(timezone.utc)},
+                "$unset": {"lease_until": ""}
             }
-            
-            # Create parent if email provided
-            if parent_email:
-                existing_parent = await db.users.find_one({"email": parent_email})
-                if existing_parent:
-                    # Link existing parent to this student
-                    await db.users.update_one(
-                        {"email": parent_email},
-                        {"$set": {"linked_student_user_id": student_user["id"]}}
-                    )
-                    detail["parent_status"] = "linked_existing"
-                else:
-                    parent_password = f"parent{random.randint(1000, 9999)}"
-                    parent_user = {
-                        "id": str(uuid.uuid4()),
-                        "email": parent_email,
-                        "hashed_password": get_password_hash(parent_password),
-                        "full_name": parent_name or f"Parent of {student_name}",
-                        "role": "parent",
-                        "grade": grade,
-                        "language": language,
-                        "linked_student_user_id": student_user["id"],
-                        "school": school,
-                        "created_at": datetime.now(timezone.utc),
-                        "is_active": True
-                    }
-                    await db.users.insert_one(parent_user)
-                    detail["parent_email"] = parent_email
-                    detail["parent_password"] = parent_password
-                    detail["parent_status"] = "created"
-            
-            # Add to batch if school provided
-            if school:
-                batch = await db.batches.find_one({"name": school, "grade": grade, "is_active": True})
-                if not batch:
-                    batch = {
-                        "id": str(uuid.uuid4()),
-                        "name": school,
-                        "grade": grade,
-                        "description": f"Auto-created from CSV import",
-                        "language": language,
-                        "student_ids": [],
-                        "teacher_incharge": teacher_incharge,
-                        "created_by": current_user["id"],
-                        "created_at": datetime.now(timezone.utc),
-                        "is_active": True
-                    }
-                    await db.batches.insert_one(batch)
-                
-                await db.batches.update_one(
-                    {"name": school, "grade": grade, "is_active": True},
-                    {"$addToSet": {"student_ids": student_user["id"]}}
-                )
-                detail["batch"] = school
-            
+        )
+    finally:
+        await media_store.discard_staged(staged_path)
+
+async def fail_orphaned_imports():
+    """Fail import jobs whose worker died mid-run (sweeper job)
+    
+    Imports are not resumed: rows already imported would be reported as
+    existing on a second pass and lose their generated passwords.
+    """
+    for job in await import_leases.claim_orphans():
+        await db.student_import_jobs.update_one(
+            {"id": job["id"]},
+            {
+                "$set": {
+                    "status": "failed",
+                    "error": "Import interrupted by a server restart; the report lists the rows imported before it stopped",
+                    "completed_at": datetime.now(timezone.utc)
+                },
+                "$unset": {"lease_until": ""}
+            }
+        )
+        if job.get("staged_path"):
+            await media_store.discard_staged(job["staged_path"])
+
+@app.get("/api/admin/import-jobs/{job_id}")
+async def get_student_import_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Admin polls import progress"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    job = await db.student_import_jobs.find_one({"id": job_id}, {"_id": 0, "staged_path": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    job["percent"] = round(100 * job["processed"] / job["total"], 1) if job.get("total") else (
+        100.0 if job["status"] == "completed" else 0.0
+    )
+    return job
+
+@app.get("/api/admin/import-jobs/{job_id}/report")
+async def get_student_import_report(
+    job_id: str,
+    format: str = Query("csv", pattern="^(csv|json)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Per-row import results, including generated credentials (CSV download, or JSON for the dashboard)"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    job = await db.student_import_jobs.find_one({"id": job_id}, {"_id": 0, "filename": 1})
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    
+    rows = db.student_import_rows.find({"job_id": job_id}, {"_id": 0, "job_id": 0, "created_at": 0}).sort("row", 1)
+    if format == "csv":
+        return export_response(rows, "csv", REPORT_FIELDS, f"import-report-{job_id[:8]}")
+    
+    results = {"created": 0, "skipped": 0, "errors": [], "details": []}
+    async for row in rows:
+        if row["status"] == "created":
             results["created"] += 1
-            results["details"].append(detail)
-            
-        except Exception as e:
-            results["errors"].append(f"Row {i}: {str(e)}")
+            results["details"].append({k: v for k, v in row.items() if v is not None and k not in ("status", "error")})
+        else:
             results["skipped"] += 1
-    
+            results["errors"].append(f"Row {row['row']}: {row['error']}")
     return results
 
+USER_EXPORT_FIELDS = [
+    "id", "student_id", "email", "full_name", "role", "grade", "language",
+    "school", "teacher_incharge", "is_active", "created_at"
+]
+
+async def user_export_filter(role: Optional[str], batch_name: Optional[str], grade: Optional[str] = None):
+    """Query for an export, plus the batch id when it is limited to a batch"""
+    query = {}
+    if role:
+        query["role"] = role
+    if grade:
+        query["grade"] = grade
+    batch_id = None
+    if batch_name:
+        batch = await db.batches.find_one({"name": batch_name, "is_active": True}, {"_id": 0, "id": 1})
+        if not batch:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        batch_id = batch["id"]
+    return query, batch_id
+
+async def iter_export_users(query: dict, batch_id: Optional[str] = None):
+    """Users matching the query, read through a cursor so memory stays flat however many there are"""
+    projection = {"_id": 0, "hashed_password": 0}
+    if batch_id is None:
+        async for user in db.users.find(query, projection).sort("_id", 1).batch_size(EXPORT_CURSOR_BATCH):
+            yield user
+        return
+    async for ids in batch_members.iter_student_ids(batch_id, EXPORT_CURSOR_BATCH):
+        async for user in db.users.find({**query, "id": {"$in": ids}}, projection):
+            yield user
+
 @app.get("/api/admin/export-credentials")
-async def export_student_credentials(batch_name: Optional[str] = None, current_user: dict = Depends(get_current_user)):
-    """Admin exports student credentials (for distribution)"""
+async def export_student_credentials(
+    batch_name: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|csv|ndjson)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Admin exports student credentials (for distribution); csv/ndjson stream every student"""
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     
-    query = {"role": "student", "is_active": True}
-    if batch_name:
-        batch = await db.batches.find_one({"name": batch_name, "is_active": True})
-        if batch:
-            query["id"] = {"$in": batch.get("student_ids", [])}
+    query, batch_id = await user_export_filter("student", batch_name)
+    query["is_active"] = True
+    if format != "json":
+        filename = f"credentials-{batch_name or 'all'}"
+        return export_response(iter_export_users(query, batch_id), format, USER_EXPORT_FIELDS, filename)
     
-    students = await db.users.find(query, {"_id": 0, "hashed_password": 0}).to_list(1000)
+    students = []
+    async for student in iter_export_users(query, batch_id):
+        students.append(student)
+        if len(students) >= 1000:
+            break
     
     return {"students": students, "count": len(students)}
 
+@app.get("/api/admin/users/export")
+async def export_users(
+    role: Optional[str] = None,
+    batch_name: Optional[str] = None,
+    grade: Optional[str] = None,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Admin downloads users as CSV or NDJSON, streamed from a cursor with no row limit"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    query, batch_id = await user_export_filter(role, batch_name, grade)
+    filename = "-".join(["users", *(part for part in (role, grade, batch_name) if part)])
+    return export_response(iter_export_users(query, batch_id), format, USER_EXPORT_FIELDS, filename)
+
 # ============================================================================
 # RESULTS & PROGRESS (No student identity revealed to markers)
 # ============================================================================
 
 @app.get("/api/students/{student_id}/progress")
 async def get_student_progress(student_id: str, current_user: dict = Depends(get_current_user)):
-    """Get student progress - only student/parent/admin can see"""
+    """Get student progress - only student/parent/admin can see
+    
+    Served from the student's results summary, rebuilt by one aggregation when stale.
+    """
     # Authorization check
     if current_user["role"] == "student" and current_user["id"] != student_id:
         raise HTTPException(status_code=403, detail="Access denied")
     if current_user["role"] == "parent" and current_user.get("linked_student_user_id") != student_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    attempts = await db.attempts.find(
-        {"student_id": student_id, "status": AttemptStatus.COMPLETED.value},
-        {"_id": 0, "secret_code": 0}  # Hide secret code
-    ).sort("created_at", -1).to_list(50)
-    
-    # Get exam details for each attempt
-    results = []
-    for attempt in attempts:
-        exam = await db.exams.find_one({"id": attempt["exam_id"]}, {"_id": 0, "mcq_questions": 0})
-        results.append({
-            "exam": exam,
-            "mcq_score": attempt.get("mcq_score", 0),
-            "written_score": attempt.get("written_score", 0),
-            "total_score": attempt.get("total_score", 0),
-            "completed_at": attempt.get("marking_completed_at")
-        })
-    
+    summary = await results_summaries.get(student_id)
     return {
         "student_id": student_id,
-        "results": results,
-        "total_exams": len(results)
+        "results": summary["results"],
+        "total_exams": summary["total_exams"]
     }
 
 # ============================================================================
@@ -1213,37 +2825,20 @@ async def get_student_progress(student_id: str, current_user: dict = Depends(get
 
 @app.get("/api/admin/statistics")
 async def get_admin_statistics(current_user: dict = Depends(get_current_user)):
-    """Admin dashboard statistics"""
+    """Admin dashboard statistics, read from the materialized counters document"""
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     
-    total_students = await db.users.count_documents({"role": "student"})
-    total_parents = await db.users.count_documents({"role": "parent"})
-    total_markers = await db.users.count_documents({"role": {"$in": ["marker", "teacher"]}})
-    total_exams = await db.exams.count_documents({"is_active": True})
-    total_attempts = await db.attempts.count_documents({})
-    pending_marking = await db.attempts.count_documents({"status": AttemptStatus.PENDING_MARKING.value})
-    completed = await db.attempts.count_documents({"status": AttemptStatus.COMPLETED.value})
-    total_batches = await db.batches.count_documents({"is_active": True})
-    total_teaching_sessions = await db.teaching_sessions.count_documents({"is_active": True})
-    pending_teaching_payments = await db.teaching_purchases.count_documents({"status": "pending_verification"})
-    
-    return {
-        "total_students": total_students,
-        "total_parents": total_parents,
-        "total_markers": total_markers,
-        "total_exams": total_exams,
-        "total_attempts": total_attempts,
-        "pending_marking": pending_marking,
-        "completed_exams": completed,
-        "total_batches": total_batches,
-        "total_teaching_sessions": total_teaching_sessions,
-        "pending_teaching_payments": pending_teaching_payments
-    }
+    return await platform_stats.snapshot()
 
 @app.get("/api/admin/users")
-async def list_users(role: Optional[str] = None, current_user: dict = Depends(get_current_user)):
-    """List all users (Admin only)"""
+async def list_users(
+    role: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user)
+):
+    """List users, newest first (Admin only; /api/admin/users/export streams them all)"""
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     
@@ -1251,8 +2846,51 @@ async def list_users(role: Optional[str] = None, current_user: dict = Depends(ge
     if role:
         query["role"] = role
     
-    users = await db.users.find(query, {"_id": 0, "hashed_password": 0}).to_list(1000)
-    return {"users": users}
+    users, next_cursor = await keyset_page(db.users, query, {"_id": 0, "hashed_password": 0}, cursor, limit)
+    return {"users": users, "next_cursor": next_cursor}
+
+@app.put("/api/admin/users/{user_id}/status")
+async def set_user_active_status(user_id: str, data: Dict[str, bool], current_user: dict = Depends(get_current_user)):
+    """Activate or deactivate a user account (Admin only)"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    is_active = data.get("is_active", True)
+    result = await db.users.update_one({"id": user_id}, {"$set": {"is_active": is_active}})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="User not found")
+    invalidate_user_cache(user_id)
+    
+    return {"message": "User activated" if is_active else "User deactivated"}
+
+@app.get("/api/admin/metrics")
+async def get_runtime_metrics(current_user: dict = Depends(get_current_user)):
+    """In-process runtime metrics for this worker (Admin only)"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    lookups = auth_cache_stats["hits"] + auth_cache_stats["misses"]
+    return {
+        "pid": os.getpid(),
+        "auth_cache": {
+            **auth_cache_stats,
+            "size": len(user_cache),
+            "hit_ratio": round(auth_cache_stats["hits"] / lookups, 4) if lookups else 0.0
+        },
+        "password_hashing": password_hasher.metrics(),
+        "mcq_autosave": answer_buffer.metrics(),
+        "exam_sessions": exam_sessions.metrics(),
+        "image_pipeline": image_pipeline.metrics(),
+        "media_storage": media_store.metrics(),
+        "deadline_sweeper": deadline_sweeper.metrics(),
+        "payment_ledger": payment_ledger.metrics(),
+        "batch_members": batch_members.metrics(),
+        "results_summaries": results_summaries.metrics(),
+        "regrade_jobs": regrade_leases.metrics(),
+        "student_import_jobs": import_leases.metrics(),
+        "platform_stats": platform_stats.metrics(),
+        "marking_queue": {**marking_queue.metrics(), **await marking_queue.queue_depth()}
+    }
 
 # ============================================================================
 # BATCH / CLASS MANAGEMENT
@@ -1271,19 +2909,25 @@ async def create_batch(batch_data: BatchCreate, current_user: dict = Depends(get
         "description": batch_data.description,
         "language": batch_data.language,
         "teacher_incharge": batch_data.teacher_incharge,
-        "student_ids": [],
+        "member_count": 0,
         "created_by": current_user["id"],
         "created_at": datetime.now(timezone.utc),
         "is_active": True
     }
     
     await db.batches.insert_one(batch)
+    await platform_stats.increment(total_batches=1)
     batch.pop("_id", None)
     return batch
 
 @app.get("/api/batches")
-async def list_batches(grade: Optional[str] = None, current_user: dict = Depends(get_current_user)):
-    """List all batches"""
+async def list_batches(
+    grade: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user)
+):
+    """List batches, newest first"""
     if current_user["role"] not in ["admin", "teacher"]:
         raise HTTPException(status_code=403, detail="Unauthorized")
     
@@ -1291,13 +2935,12 @@ async def list_batches(grade: Optional[str] = None, current_user: dict = Depends
     if grade:
         query["grade"] = grade
     
-    batches = await db.batches.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
+    batches, next_cursor = await keyset_page(db.batches, query, {"_id": 0, "student_ids": 0}, cursor, limit)
     
-    # Add student count for each batch
     for batch in batches:
-        batch["student_count"] = len(batch.get("student_ids", []))
+        batch["student_count"] = batch.get("member_count", 0)
     
-    return {"batches": batches}
+    return {"batches": batches, "next_cursor": next_cursor}
 
 @app.post("/api/batches/{batch_id}/students")
 async def add_students_to_batch(batch_id: str, data: BatchStudentAdd, current_user: dict = Depends(get_current_user)):
@@ -1305,15 +2948,11 @@ async def add_students_to_batch(batch_id: str, data: BatchStudentAdd, current_us
     if current_user["role"] not in ["admin", "teacher"]:
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    result = await db.batches.update_one(
-        {"id": batch_id},
-        {"$addToSet": {"student_ids": {"$each": data.student_ids}}}
-    )
-    
-    if result.modified_count == 0:
+    if not await db.batches.find_one({"id": batch_id}, {"_id": 0, "id": 1}):
         raise HTTPException(status_code=404, detail="Batch not found")
     
-    return {"message": f"Added {len(data.student_ids)} students to batch"}
+    added = await batch_members.add(batch_id, data.student_ids)
+    return {"message": f"Added {added} students to batch", "added": added}
 
 @app.delete("/api/batches/{batch_id}/students/{student_id}")
 async def remove_student_from_batch(batch_id: str, student_id: str, current_user: dict = Depends(get_current_user)):
@@ -1321,32 +2960,38 @@ async def remove_student_from_batch(batch_id: str, student_id: str, current_user
     if current_user["role"] not in ["admin", "teacher"]:
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    await db.batches.update_one(
-        {"id": batch_id},
-        {"$pull": {"student_ids": student_id}}
-    )
-    
+    await batch_members.remove(batch_id, student_id)
     return {"message": "Student removed from batch"}
 
 @app.get("/api/batches/{batch_id}")
-async def get_batch_details(batch_id: str, current_user: dict = Depends(get_current_user)):
-    """Get batch details with student list"""
+async def get_batch_details(
+    batch_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get batch details with one page of its students (most recently added first)"""
     if current_user["role"] not in ["admin", "teacher"]:
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    batch = await db.batches.find_one({"id": batch_id}, {"_id": 0})
+    batch = await db.batches.find_one({"id": batch_id}, {"_id": 0, "student_ids": 0})
     if not batch:
         raise HTTPException(status_code=404, detail="Batch not found")
     
-    # Get student details
-    students = []
-    for sid in batch.get("student_ids", []):
-        student = await db.users.find_one({"id": sid}, {"_id": 0, "hashed_password": 0})
-        if student:
-            students.append(student)
+    members, next_cursor = await keyset_page(
+        db.batch_members, {"batch_id": batch_id}, {"_id": 0, "id": 1, "student_id": 1, "created_at": 1}, cursor, limit
+    )
+    users = {
+        user["id"]: user
+        async for user in db.users.find(
+            {"id": {"$in": [m["student_id"] for m in members]}},
+            {"_id": 0, "hashed_password": 0}
+        )
+    }
     
-    batch["students"] = students
-    batch["student_count"] = len(students)
+    batch["students"] = [users[m["student_id"]] for m in members if m["student_id"] in users]
+    batch["student_count"] = batch.get("member_count", 0)
+    batch["next_cursor"] = next_cursor
     return batch
 
 @app.delete("/api/batches/{batch_id}")
@@ -1355,7 +3000,8 @@ async def delete_batch(batch_id: str, current_user: dict = Depends(get_current_u
     if current_user["role"] not in ["admin"]:
         raise HTTPException(status_code=403, detail="Admin only")
     
-    await db.batches.update_one({"id": batch_id}, {"$set": {"is_active": False}})
+    result = await db.batches.update_one({"id": batch_id, "is_active": True}, {"$set": {"is_active": False}})
+    await platform_stats.increment(total_batches=-result.modified_count)
     return {"message": "Batch deleted"}
 
 # ============================================================================
@@ -1368,7 +3014,7 @@ async def create_teaching_session(data: TeachingSessionCreate, current_user: dic
     if current_user["role"] not in ["admin", "teacher"]:
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    exam = await db.exams.find_one({"id": data.exam_id}, {"_id": 0})
+    exam = await get_cached_exam(data.exam_id)
     if not exam:
         raise HTTPException(status_code=404, detail="Exam not found")
     
@@ -1391,6 +3037,7 @@ async def create_teaching_session(data: TeachingSessionCreate, current_user: dic
     }
     
     await db.teaching_sessions.insert_one(session)
+    await platform_stats.increment(total_teaching_sessions=1)
     session.pop("_id", None)
     return session
 
@@ -1409,37 +3056,35 @@ async def upload_teaching_audio(
         raise HTTPException(status_code=404, detail="Session not found")
     
     # Save audio file
-    audio_dir = os.path.join(os.path.dirname(__file__), 'uploads', 'teaching')
-    os.makedirs(audio_dir, exist_ok=True)
-    
-    ext = audio.filename.split(".")[-1] if "." in audio.filename else "mp3"
-    filename = f"teaching_{session_id}.{ext}"
-    filepath = os.path.join(audio_dir, filename)
-    
-    with open(filepath, "wb") as f:
-        content = await audio.read()
-        f.write(content)
-    
-    audio_url = f"/uploads/teaching/{filename}"
+    ext = upload_extension(audio, "mp3")
+    staged_path = media_store.staging_path(ext)
+    saved = await stream_upload_to_file(audio, staged_path, MAX_AUDIO_BYTES)
+    stored = await media_store.put_file(staged_path, saved["sha256"], ext, audio.content_type)
+    audio_url = stored["url"]
     
     await db.teaching_sessions.update_one(
         {"id": session_id},
         {"$set": {"audio_url": audio_url, "status": "active"}}
     )
     
-    return {"message": "Audio uploaded", "audio_url": audio_url}
+    return {"message": "Audio uploaded", "audio_url": media_url(audio_url)}
 
 @app.get("/api/teaching/sessions")
-async def list_teaching_sessions(exam_id: Optional[str] = None, language: Optional[str] = None):
-    """List teaching sessions"""
+async def list_teaching_sessions(
+    exam_id: Optional[str] = None,
+    language: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE)
+):
+    """List teaching sessions, newest first"""
     query = {"is_active": True}
     if exam_id:
         query["exam_id"] = exam_id
     if language:
         query["language"] = language
     
-    sessions = await db.teaching_sessions.find(query, {"_id": 0}).sort("created_at", -1).to_list(50)
-    return {"sessions": sessions}
+    sessions, next_cursor = await keyset_page(db.teaching_sessions, query, {"_id": 0}, cursor, limit)
+    return {"sessions": sessions, "next_cursor": next_cursor}
 
 @app.post("/api/teaching/purchase")
 async def purchase_teaching_session(
@@ -1475,6 +3120,7 @@ async def purchase_teaching_session(
     }
     
     await db.teaching_purchases.insert_one(purchase)
+    await platform_stats.increment(pending_teaching_payments=1)
     purchase.pop("_id", None)
     return purchase
 
@@ -1492,6 +3138,9 @@ async def get_my_teaching_sessions(current_user: dict = Depends(get_current_user
         {"_id": 0}
     ).to_list(50)
     
+    for session in sessions:
+        session["audio_url"] = media_url(session.get("audio_url"))
+    
     return {"sessions": sessions, "purchases": purchases}
 
 @app.put("/api/teaching/purchases/{purchase_id}/verify")
@@ -1500,33 +3149,165 @@ async def verify_teaching_purchase(purchase_id: str, current_user: dict = Depend
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     
-    result = await db.teaching_purchases.update_one(
+    previous = await db.teaching_purchases.find_one_and_update(
         {"id": purchase_id},
-        {"$set": {"status": "verified", "verified_at": datetime.now(timezone.utc), "verified_by": current_user["id"]}}
+        {"$set": {"status": "verified", "verified_at": datetime.now(timezone.utc), "verified_by": current_user["id"]}},
+        projection={"_id": 0, "status": 1},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.modified_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Purchase not found")
+    if previous.get("status") == "pending_verification":
+        await platform_stats.increment(pending_teaching_payments=-1)
     
     return {"message": "Purchase verified"}
 
 @app.get("/api/teaching/purchases/pending")
-async def get_pending_teaching_purchases(current_user: dict = Depends(get_current_user)):
-    """Admin gets pending teaching purchases for verification"""
+async def get_pending_teaching_purchases(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user)
+):
+    """Admin gets pending teaching purchases for verification, newest first"""
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     
-    purchases = await db.teaching_purchases.find(
-        {"status": "pending_verification"},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
+    purchases, next_cursor = await keyset_page(
+        db.teaching_purchases, {"status": "pending_verification"}, {"_id": 0}, cursor, limit
+    )
     
-    # Add user details
+    # Add user details (one query for the whole page)
+    user_ids = list({purchase["user_id"] for purchase in purchases})
+    users = {
+        user["id"]: user
+        async for user in db.users.find({"id": {"$in": user_ids}}, {"_id": 0, "hashed_password": 0})
+    }
     for purchase in purchases:
-        user = await db.users.find_one({"id": purchase["user_id"]}, {"_id": 0, "hashed_password": 0})
-        purchase["user"] = user
+        purchase["user"] = users.get(purchase["user_id"])
     
-    return {"purchases": purchases}
+    return {"purchases": purchases, "next_cursor": next_cursor}
+
+# ============================================================================
+# DEADLINE SWEEPS (abandoned and timed-out attempts)
+# ============================================================================
+
+async def expire_mcq_attempts(attempts: List[dict], now: datetime) -> int:
+    """Auto-submit MCQ sections whose time ran out: grade and open the written section"""
+    attempt_ids = [a["id"] for a in attempts]
+    # Answers buffered on this worker must land before grading
+    await answer_buffer.flush(attempt_ids)
+    for attempt_id in attempt_ids:
+        attempt_state_cache.pop(attempt_id, None)
+    
+    attempts = await db.attempts.find(
+        {"id": {"$in": attempt_ids}, "status": AttemptStatus.MCQ_IN_PROGRESS.value},
+        {"_id": 0, "id": 1, "exam_id": 1, "exam_version": 1, "mcq_answers": 1}
+    ).to_list(len(attempt_ids))
+    
+    operations = []
+    results = {}
+    versions = await get_current_exam_versions([attempt["exam_id"] for attempt in attempts])
+    for attempt in attempts:
+        if attempt["exam_id"] not in versions:
+            continue
+        exam_meta = await get_grading_exam_meta(attempt["exam_id"], versions[attempt["exam_id"]])
+        if not exam_meta:
+            continue
+        score = grade_mcq_answers(attempt.get("mcq_answers", {}), exam_meta)
+        results[attempt["id"]] = mcq_submission_result(score, exam_meta)
+        operations.append(UpdateOne(
+            {"id": attempt["id"], "status": AttemptStatus.MCQ_IN_PROGRESS.value},
+            {"$set": {
+                "status": AttemptStatus.WRITTEN_IN_PROGRESS.value,
+                "mcq_completed_at": now,
+                "mcq_score": score,
+                "mcq_graded_version": exam_meta["version"],
+                "mcq_auto_submitted": True,
+                "written_started_at": now,
+                "deadline_at": now + timedelta(minutes=exam_meta["written_duration_minutes"])
+            }}
+        ))
+    if not operations:
+        return 0
+    
+    result = await db.attempts.bulk_write(operations, ordered=False)
+    for attempt_id, response in results.items():
+        await exam_sessions.send(attempt_id, {"type": "time_up", "auto_submitted": True, **response})
+    return result.modified_count
+
+async def expire_written_attempts(attempts: List[dict], now: datetime) -> int:
+    """Close written sections whose time ran out and open the parent upload window"""
+    upload_window_start = now + timedelta(minutes=PARENT_UPLOAD_DELAY_MINUTES)
+    upload_window_end = upload_window_start + timedelta(minutes=PARENT_UPLOAD_WINDOW_MINUTES)
+    result = await db.attempts.update_many(
+        {"id": {"$in": [a["id"] for a in attempts]}, "status": AttemptStatus.WRITTEN_IN_PROGRESS.value},
+        {"$set": {
+            "status": AttemptStatus.WAITING_PARENT_UPLOAD.value,
+            "written_completed_at": now,
+            "written_auto_submitted": True,
+            "parent_upload_window_start": upload_window_start,
+            "parent_upload_window_end": upload_window_end,
+            "deadline_at": upload_window_end
+        }}
+    )
+    return result.modified_count
+
+async def expire_parent_upload_windows(attempts: List[dict], now: datetime) -> int:
+    """Send attempts whose parent upload window closed to the marking queue"""
+    result = await db.attempts.update_many(
+        {"id": {"$in": [a["id"] for a in attempts]}, "status": AttemptStatus.WAITING_PARENT_UPLOAD.value},
+        {"$set": {"status": AttemptStatus.PENDING_MARKING.value}, "$unset": {"deadline_at": ""}}
+    )
+    await record_attempt_transition(
+        AttemptStatus.WAITING_PARENT_UPLOAD.value, AttemptStatus.PENDING_MARKING.value, result.modified_count
+    )
+    return result.modified_count
+
+async def backfill_attempt_deadlines():
+    """Give attempts that predate deadline_at one, so the sweep can expire them"""
+    missing = {"deadline_at": {"$exists": False}}
+    exam_ids = await db.attempts.distinct(
+        "exam_id",
+        {"status": {"$in": [AttemptStatus.MCQ_IN_PROGRESS.value, AttemptStatus.WRITTEN_IN_PROGRESS.value]}, **missing}
+    )
+    for exam_id in exam_ids:
+        exam_meta = await get_exam_meta(exam_id)
+        if not exam_meta:
+            continue
+        for status_value, started_field, minutes in (
+            (AttemptStatus.MCQ_IN_PROGRESS.value, "$mcq_started_at", exam_meta["mcq_duration_minutes"]),
+            (AttemptStatus.WRITTEN_IN_PROGRESS.value, "$written_started_at", exam_meta["written_duration_minutes"])
+        ):
+            await db.attempts.update_many(
+                {"exam_id": exam_id, "status": status_value, **missing},
+                [{"$set": {"deadline_at": {"$add": [started_field, minutes * 60 * 1000]}}}]
+            )
+    await db.attempts.update_many(
+        {"status": AttemptStatus.WAITING_PARENT_UPLOAD.value, **missing},
+        [{"$set": {"deadline_at": "$parent_upload_window_end"}}]
+    )
+    # Papers claimed before marking leases existed
+    await db.attempts.update_many(
+        {"status": AttemptStatus.MARKING_IN_PROGRESS.value, **missing},
+        [{"$set": {"deadline_at": {"$add": [
+            {"$ifNull": ["$marking_started_at", "$$NOW"]},
+            int(marking_queue.lease.total_seconds() * 1000)
+        ]}}}]
+    )
+
+# Collections listed through keyset_page, which needs created_at stored as a date
+KEYSET_COLLECTIONS = (
+    "users", "exams", "attempts", "marker_payments", "batches",
+    "batch_members", "teaching_sessions", "teaching_purchases"
+)
+
+async def migrate_created_at_dates():
+    """Convert created_at values written as ISO strings (older seed scripts) to dates"""
+    for name in KEYSET_COLLECTIONS:
+        converted = await migrate_string_created_at(db[name])
+        if converted:
+            logger.info(f"Converted {converted} string created_at values in {name}")
 
 # ============================================================================
 # API ROOT
@@ -1554,17 +3335,65 @@ async def root():
 @app.on_event("startup")
 async def startup_event():
     """Create indexes and seed sample data"""
+    answer_buffer.start(db.attempts, {"status": AttemptStatus.MCQ_IN_PROGRESS.value})
+    marking_queue.start(db.attempts)
+    payment_ledger.start(db)
+    platform_stats.start(db)
+    batch_members.start(db)
+    results_summaries.start(db)
+    regrade_leases.start(db)
+    import_leases.start(db)
+    
+    deadline_sweeper.register_stage(AttemptStatus.MCQ_IN_PROGRESS.value, expire_mcq_attempts, {"_id": 0, "id": 1})
+    deadline_sweeper.register_stage(AttemptStatus.WRITTEN_IN_PROGRESS.value, expire_written_attempts, {"_id": 0, "id": 1})
+    deadline_sweeper.register_stage(AttemptStatus.WAITING_PARENT_UPLOAD.value, expire_parent_upload_windows, {"_id": 0, "id": 1})
+    deadline_sweeper.register_stage(AttemptStatus.MARKING_IN_PROGRESS.value, marking_queue.release_expired, {"_id": 0, "id": 1})
+    deadline_sweeper.add_periodic_job("backfill_attempt_deadlines", 3600, backfill_attempt_deadlines)
+    deadline_sweeper.add_periodic_job("expire_upload_sessions", 300, expire_upload_sessions)
+    deadline_sweeper.add_periodic_job("marker_payment_rollup", 600, payment_ledger.run_periodic)
+    deadline_sweeper.add_periodic_job("reconcile_platform_stats", 900, platform_stats.reconcile)
+    deadline_sweeper.add_periodic_job("migrate_batch_members", 3600, batch_members.migrate_embedded)
+    deadline_sweeper.add_periodic_job("migrate_created_at_dates", 3600, migrate_created_at_dates)
+    deadline_sweeper.add_periodic_job("resume_regrade_jobs", regrade_leases.ttl.total_seconds() / 2, resume_regrade_jobs)
+    deadline_sweeper.add_periodic_job("fail_orphaned_imports", import_leases.ttl.total_seconds() / 2, fail_orphaned_imports)
+    deadline_sweeper.start(db, grace_seconds=max(ATTEMPT_EXPIRY_GRACE_SECONDS, MCQ_AUTO_SUBMIT_DELAY_SECONDS))
+    
     try:
         await db.users.create_index("email", unique=True)
         await db.users.create_index("student_id")
+        await db.users.create_index([("created_at", -1), ("id", -1)])
+        await db.users.create_index([("role", 1), ("created_at", -1), ("id", -1)])
+        await db.users.create_index("id", unique=True)
+        await db.exams.create_index("id", unique=True)
         await db.exams.create_index([("grade", 1), ("month", 1)])
+        await db.exams.create_index([("is_active", 1), ("created_at", -1), ("id", -1)])
+        await db.exams.create_index([("is_active", 1), ("status", 1), ("created_at", -1), ("id", -1)])
+        await db.attempts.create_index("id", unique=True)
         await db.attempts.create_index([("student_id", 1), ("exam_id", 1)])
         await db.attempts.create_index("secret_code", unique=True)
         await db.attempts.create_index("status")
+        await db.attempts.create_index([("status", 1), ("deadline_at", 1)])
+        await db.attempts.create_index([("exam_id", 1), ("status", 1)])
+        await db.attempts.create_index([("status", 1), ("created_at", 1), ("id", 1)])
+        await db.attempts.create_index([("marking_assigned_to", 1), ("status", 1)])
+        await db.upload_sessions.create_index("id", unique=True)
+        await db.upload_sessions.create_index([("status", 1), ("expires_at", 1)])
+        await db.student_import_jobs.create_index("id", unique=True)
+        await db.student_import_rows.create_index([("job_id", 1), ("row", 1)])
+        await db.student_import_rows.create_index("created_at", expireAfterSeconds=IMPORT_REPORT_TTL_DAYS * 86400)
         await db.marker_payments.create_index("marker_id")
+        await payment_ledger.ensure_indexes()
         await db.batches.create_index([("grade", 1), ("is_active", 1)])
+        await db.batches.create_index([("is_active", 1), ("created_at", -1), ("id", -1)])
+        await db.batches.create_index([("name", 1), ("grade", 1), ("is_active", 1)])
+        await batch_members.ensure_indexes()
+        await results_summaries.ensure_indexes()
+        await regrade_leases.ensure_indexes()
+        await import_leases.ensure_indexes()
         await db.teaching_sessions.create_index([("exam_id", 1), ("language", 1)])
+        await db.teaching_sessions.create_index([("is_active", 1), ("created_at", -1), ("id", -1)])
         await db.teaching_purchases.create_index([("user_id", 1), ("session_id", 1)])
+        await db.teaching_purchases.create_index([("status", 1), ("created_at", -1), ("id", -1)])
         logger.info("Database indexes created")
         
         # Seed sample admin
@@ -1575,7 +3404,7 @@ async def startup_event():
                 "email": "admin@exam.lk",
                 "full_name": "System Admin",
                 "role": "admin",
-                "hashed_password": get_password_hash("admin123"),
+                "hashed_password": await get_password_hash("admin123"),
                 "created_at": datetime.now(timezone.utc),
                 "is_active": True
             })
@@ -1589,7 +3418,7 @@ async def startup_event():
                 "email": "marker@exam.lk",
                 "full_name": "Paper Marker",
                 "role": "marker",
-                "hashed_password": get_password_hash("marker123"),
+                "hashed_password": await get_password_hash("marker123"),
                 "created_at": datetime.now(timezone.utc),
                 "is_active": True
             })
@@ -1633,6 +3462,7 @@ async def startup_event():
                 ],
                 "written_duration_minutes": 45,
                 "status": "published",
+                "version": 1,
                 "created_at": datetime.now(timezone.utc),
                 "is_active": True
             })
@@ -1641,6 +3471,14 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Startup error: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush buffered writes and release worker pools"""
+    await deadline_sweeper.stop()
+    await answer_buffer.stop()
+    password_hasher.shutdown()
+    image_pipeline.shutdown()
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get('PORT', 8001))
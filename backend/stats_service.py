@@ -0,0 +1,99 @@
+"""
+Platform statistics for the admin dashboard
+Keeps materialized counters in one document, bumped on write paths and reconciled against the real collections
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATS_DOCUMENT_ID = "admin_dashboard"
+
+
+class PlatformStats:
+    """Counters in `platform_stats`, one field per dashboard figure
+
+    `counters` maps each field to the (collection, filter) whose count it
+    mirrors. Write paths apply deltas with a single `$inc`; a periodic
+    reconcile recounts every field concurrently and overwrites the document,
+    which repairs drift from writes that bypass the hooks (seed scripts,
+    manual edits, a crash between a write and its increment).
+    """
+
+    def __init__(self, counters: Dict[str, Tuple[str, Dict]], doc_id: str = STATS_DOCUMENT_ID):
+        self.counters = counters
+        self.doc_id = doc_id
+        self._db = None
+        self.stats = {
+            "increments": 0,
+            "increment_failures": 0,
+            "reconciles": 0,
+            "last_reconcile_ms": 0.0,
+            "last_drift": 0
+        }
+
+    def start(self, db):
+        """Bind the database (call from the app startup event)"""
+        self._db = db
+
+    async def increment(self, **deltas: int):
+        """Apply counter deltas; never raises, the next reconcile fixes a missed update"""
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        unknown = set(deltas) - set(self.counters)
+        if unknown:
+            raise ValueError(f"Unknown statistics counters: {', '.join(sorted(unknown))}")
+        try:
+            # No upsert: a partial document would hide the missing counters until the next reconcile
+            await self._db.platform_stats.update_one(
+                {"_id": self.doc_id},
+                {"$inc": deltas, "$set": {"updated_at": datetime.now(timezone.utc)}}
+            )
+            self.stats["increments"] += 1
+        except Exception as e:
+            self.stats["increment_failures"] += 1
+            logger.warning(f"Statistics increment {deltas} failed: {e}")
+
+    async def count_all(self) -> Dict[str, int]:
+        """Count every counter from its source collection, all queries in flight at once"""
+        names = list(self.counters)
+        counts = await asyncio.gather(*(
+            self._db[collection].count_documents(query)
+            for collection, query in (self.counters[name] for name in names)
+        ))
+        return dict(zip(names, counts))
+
+    async def reconcile(self) -> Dict:
+        """Recount everything and replace the materialized document (sweeper job)"""
+        started = time.perf_counter()
+        previous = await self._db.platform_stats.find_one({"_id": self.doc_id}) or {}
+        counts = await self.count_all()
+        now = datetime.now(timezone.utc)
+        # Increments landing between the counts and this write are overwritten; the next run recounts them
+        await self._db.platform_stats.update_one(
+            {"_id": self.doc_id},
+            {"$set": {**counts, "updated_at": now, "reconciled_at": now}},
+            upsert=True
+        )
+        drift = sum(abs(counts[name] - previous.get(name, 0)) for name in counts) if previous else 0
+        if drift:
+            logger.info(f"Statistics reconcile corrected a drift of {drift}")
+        self.stats["reconciles"] += 1
+        self.stats["last_drift"] = drift
+        self.stats["last_reconcile_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return {**counts, "reconciled_at": now}
+
+    async def snapshot(self) -> Dict:
+        """The dashboard figures: one document read, or a concurrent recount if it does not exist yet"""
+        doc = await self._db.platform_stats.find_one({"_id": self.doc_id}, {"_id": 0})
+        if doc is None:
+            doc = await self.reconcile()
+        return {**{name: doc.get(name, 0) for name in self.counters}, "as_of": doc.get("updated_at") or doc.get("reconciled_at")}
+
+    def metrics(self) -> Dict:
+        return dict(self.stats)
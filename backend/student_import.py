@@ -0,0 +1,358 @@
+"""
+Bulk student import for the exam platform
+Streams a school's CSV list in chunks and creates students, parents and batch memberships with batched writes
+"""
+
+import asyncio
+import csv
+import itertools
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from batch_members import batch_members
+
+logger = logging.getLogger(__name__)
+
+# Import configuration from environment
+IMPORT_CHUNK_ROWS = int(os.environ.get("STUDENT_IMPORT_CHUNK_ROWS", 250))
+# Hashes an import may have queued at once; keeps room in the shared bcrypt queue for logins
+IMPORT_HASH_CONCURRENCY = int(os.environ.get("STUDENT_IMPORT_HASH_CONCURRENCY", 8))
+
+# Column order of the downloadable per-row report
+REPORT_FIELDS = [
+    "row", "status", "student_name", "student_email", "student_id", "student_password",
+    "parent_email", "parent_password", "parent_status", "batch", "error"
+]
+
+HashFunc = Callable[[str], Awaitable[str]]
+ChunkCallback = Callable[[Dict], Awaitable]
+
+
+def _read_chunk(reader, size: int) -> List[Dict]:
+    return list(itertools.islice(reader, size))
+
+
+def count_csv_rows(path: str) -> int:
+    """Data rows in a CSV file (quoted newlines included), for progress reporting"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return sum(1 for _ in csv.DictReader(f))
+
+
+def normalize_row(raw: Dict) -> Tuple[Dict, Optional[str]]:
+    """Clean one CSV row; returns (entry, error), error being None for a usable row"""
+    def field(name: str, default: str = "") -> str:
+        return (raw.get(name) or default).strip()
+
+    entry = {
+        "student_name": field("student_name"),
+        "student_email": field("student_email"),
+        "parent_name": field("parent_name"),
+        "parent_email": field("parent_email"),
+        "grade": field("grade", "grade_5"),
+        "language": field("language", "si"),
+        "school": field("school"),
+        "teacher_incharge": field("teacher_incharge")
+    }
+    if not entry["student_name"] or not entry["student_email"]:
+        return entry, "Missing student name or email"
+    if not entry["grade"].startswith("grade_"):
+        entry["grade"] = f"grade_{entry['grade']}"
+    return entry, None
+
+
+def _failed_indexes(error: BulkWriteError) -> Dict[int, str]:
+    return {e["index"]: e.get("errmsg", "write failed") for e in error.details.get("writeErrors", [])}
+
+
+class StudentImporter:
+    """One import run: reads the CSV in chunks of `chunk_rows` and writes each chunk in bulk
+
+    Per chunk there is one `$in` lookup for every email it mentions, one batch
+    lookup for schools not seen earlier in the file, and unordered
+    insert_many/bulk_write calls for users, parent links and batch
+    memberships (one bulk upsert per school). Passwords are hashed
+    concurrently on the shared bcrypt pool, at most `hash_concurrency` at a
+    time. Every input row ends up as one report row in `student_import_rows`;
+    rows for created accounts are saved as soon as the account exists, so a
+    later failure in the chunk cannot lose the generated passwords.
+    """
+
+    def __init__(
+        self,
+        db,
+        job_id: str,
+        created_by: str,
+        hash_password: HashFunc,
+        new_student_id: Callable[[], str],
+        chunk_rows: int = IMPORT_CHUNK_ROWS,
+        hash_concurrency: int = IMPORT_HASH_CONCURRENCY
+    ):
+        self.db = db
+        self.job_id = job_id
+        self.created_by = created_by
+        self.hash_password = hash_password
+        self.new_student_id = new_student_id
+        self.chunk_rows = max(1, chunk_rows)
+        self._hash_slots = asyncio.Semaphore(max(1, hash_concurrency))
+        # Carried across chunks: a parent or school may appear again further down the file
+        self._seen_students = set()
+        self._parent_ids: Dict[str, str] = {}
+        self._batch_ids: Dict[Tuple[str, str], str] = {}
+
+    async def _hash(self, password: str) -> str:
+        async with self._hash_slots:
+            return await self.hash_password(password)
+
+    async def run(self, path: str, on_chunk: Optional[ChunkCallback] = None) -> Dict:
+        """Import the whole file; `on_chunk` receives each chunk's outcome"""
+        started = time.perf_counter()
+        totals = {"processed": 0, "created": 0, "skipped": 0, "failed": 0}
+        loop = asyncio.get_running_loop()
+        handle = await loop.run_in_executor(None, lambda: open(path, newline="", encoding="utf-8-sig"))
+        try:
+            reader = csv.DictReader(handle)
+            first_row = 1
+            while True:
+                raw_rows = await loop.run_in_executor(None, _read_chunk, reader, self.chunk_rows)
+                if not raw_rows:
+                    break
+                outcome = await self._import_chunk(list(enumerate(raw_rows, first_row)))
+                first_row += len(raw_rows)
+                for key in totals:
+                    totals[key] += outcome[key]
+                if on_chunk is not None:
+                    await on_chunk(outcome)
+        finally:
+            await loop.run_in_executor(None, handle.close)
+        totals["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(f"Student import {self.job_id}: {totals}")
+        return totals
+
+    async def _import_chunk(self, rows: List[Tuple[int, Dict]]) -> Dict:
+        now = datetime.now(timezone.utc)
+        report = {}
+        entries = []
+        for row_number, raw in rows:
+            entry, error = normalize_row(raw)
+            if error is None and entry["student_email"] in self._seen_students:
+                error = f"{entry['student_email']} appears earlier in the file"
+            if error:
+                report[row_number] = {"status": "skipped", "error": error, **entry}
+                continue
+            self._seen_students.add(entry["student_email"])
+            entry["row"] = row_number
+            entries.append(entry)
+
+        # One round trip for every email the chunk mentions
+        emails = {e["student_email"] for e in entries} | {e["parent_email"] for e in entries if e["parent_email"]}
+        existing = {}
+        if emails:
+            async for user in self.db.users.find({"email": {"$in": list(emails)}}, {"_id": 0, "id": 1, "email": 1}):
+                existing[user["email"]] = user["id"]
+
+        new_entries = []
+        for entry in entries:
+            if entry["student_email"] in existing:
+                report[entry["row"]] = {"status": "skipped", "error": f"{entry['student_email']} already exists", **entry}
+            else:
+                new_entries.append(entry)
+        for email, user_id in existing.items():
+            self._parent_ids.setdefault(email, user_id)
+
+        # Passwords: one per student plus one per parent this chunk creates
+        new_parent_emails = []
+        for entry in new_entries:
+            parent_email = entry["parent_email"]
+            if parent_email and parent_email not in self._parent_ids and parent_email not in new_parent_emails:
+                new_parent_emails.append(parent_email)
+        student_passwords = [f"exam{random.randint(1000, 9999)}" for _ in new_entries]
+        parent_passwords = {email: f"parent{random.randint(1000, 9999)}" for email in new_parent_emails}
+        hashes = await asyncio.gather(
+            *(self._hash(p) for p in student_passwords),
+            *(self._hash(p) for p in parent_passwords.values())
+        )
+        student_hashes = hashes[:len(new_entries)]
+        parent_hashes = dict(zip(parent_passwords, hashes[len(new_entries):]))
+
+        students = []
+        for entry, password, hashed in zip(new_entries, student_passwords, student_hashes):
+            entry["student_password"] = password
+            students.append({
+                "id": str(uuid.uuid4()),
+                "student_id": self.new_student_id(),
+                "email": entry["student_email"],
+                "hashed_password": hashed,
+                "full_name": entry["student_name"],
+                "role": "student",
+                "grade": entry["grade"],
+                "language": entry["language"],
+                "school": entry["school"],
+                "teacher_incharge": entry["teacher_incharge"],
+                "created_at": now,
+                "is_active": True
+            })
+        failed = {}
+        if students:
+            try:
+                await self.db.users.insert_many(students, ordered=False)
+            except BulkWriteError as e:
+                # e.g. the same email registered through the app since the precheck
+                failed = _failed_indexes(e)
+
+        created = []
+        for index, (entry, student) in enumerate(zip(new_entries, students)):
+            if index in failed:
+                report[entry["row"]] = {"status": "failed", "error": failed[index], **entry}
+            else:
+                entry["student"] = student
+                entry["status"] = "created"
+                entry["student_id"] = student["student_id"]
+                report[entry["row"]] = entry
+                created.append(entry)
+        await self._save_report(report, [entry["row"] for entry in created], now)
+
+        parents_created = await self._create_parents(created, parent_passwords, parent_hashes, now)
+        await self._save_report(report, [entry["row"] for entry in created if entry.get("parent_password")], now)
+        linked_parent_ids = await self._link_existing_parents(created)
+        batches_created = await self._add_to_batches(created, now)
+
+        rows_out = await self._save_report(report, [row_number for row_number, _ in rows], now)
+
+        statuses = [r["status"] for r in rows_out]
+        return {
+            "processed": len(rows_out),
+            "created": statuses.count("created"),
+            "skipped": statuses.count("skipped"),
+            "failed": statuses.count("failed"),
+            "students_created": len(created),
+            "parents_created": parents_created,
+            "batches_created": batches_created,
+            "linked_parent_ids": linked_parent_ids
+        }
+
+    async def _save_report(self, report: Dict[int, Dict], row_numbers: List[int], now: datetime) -> List[Dict]:
+        """Upsert the report rows for these input rows (saved again as the chunk progresses)"""
+        rows_out = []
+        for row_number in row_numbers:
+            result = report[row_number]
+            rows_out.append({
+                "job_id": self.job_id,
+                "created_at": now,
+                **{field: result.get(field) for field in REPORT_FIELDS},
+                "row": row_number
+            })
+        if rows_out:
+            await self.db.student_import_rows.bulk_write(
+                [UpdateOne({"job_id": self.job_id, "row": row["row"]}, {"$set": row}, upsert=True) for row in rows_out],
+                ordered=False
+            )
+        return rows_out
+
+    async def _create_parents(self, created: List[Dict], passwords: Dict, hashes: Dict, now: datetime) -> int:
+        """Insert parents new to this import; later rows with the same parent email link instead"""
+        parents = {}
+        for entry in created:
+            email = entry["parent_email"]
+            if not email or email in self._parent_ids or email in parents or email not in passwords:
+                continue
+            parents[email] = {
+                "id": str(uuid.uuid4()),
+                "email": email,
+                "hashed_password": hashes[email],
+                "full_name": entry["parent_name"] or f"Parent of {entry['student_name']}",
+                "role": "parent",
+                "grade": entry["grade"],
+                "language": entry["language"],
+                "linked_student_user_id": entry["student"]["id"],
+                "school": entry["school"],
+                "created_at": now,
+                "is_active": True
+            }
+            entry["parent_status"] = "created"
+            entry["parent_password"] = passwords[email]
+        if not parents:
+            return 0
+
+        docs = list(parents.values())
+        failed = {}
+        try:
+            await self.db.users.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            failed = _failed_indexes(e)
+        failed_emails = {docs[index]["email"] for index in failed}
+        for entry in created:
+            if entry["parent_email"] in failed_emails and entry.get("parent_status") == "created":
+                entry["parent_status"] = "failed"
+                entry.pop("parent_password", None)
+        for doc in docs:
+            if doc["email"] not in failed_emails:
+                self._parent_ids[doc["email"]] = doc["id"]
+        return len(docs) - len(failed)
+
+    async def _link_existing_parents(self, created: List[Dict]) -> List[str]:
+        """Point already-registered parents at their newly imported child (the last one in file order)"""
+        links = {}
+        for entry in created:
+            email = entry["parent_email"]
+            if email and entry.get("parent_status") is None and email in self._parent_ids:
+                links[email] = entry["student"]["id"]
+                entry["parent_status"] = "linked_existing"
+        if not links:
+            return []
+        await self.db.users.bulk_write(
+            [UpdateOne({"email": email}, {"$set": {"linked_student_user_id": student_id}}) for email, student_id in links.items()],
+            ordered=False
+        )
+        return [self._parent_ids[email] for email in links]
+
+    async def _add_to_batches(self, created: List[Dict], now: datetime) -> int:
+        """Add students to their school's active batch for the grade, creating missing batches"""
+        members: Dict[Tuple[str, str], List[str]] = {}
+        for entry in created:
+            if entry["school"]:
+                members.setdefault((entry["school"], entry["grade"]), []).append(entry["student"]["id"])
+                entry["batch"] = entry["school"]
+        if not members:
+            return 0
+
+        unknown = [key for key in members if key not in self._batch_ids]
+        if unknown:
+            async for batch in self.db.batches.find(
+                {"is_active": True, "$or": [{"name": name, "grade": grade} for name, grade in unknown]},
+                {"_id": 0, "id": 1, "name": 1, "grade": 1}
+            ):
+                self._batch_ids.setdefault((batch["name"], batch["grade"]), batch["id"])
+
+        new_batches = []
+        for key in members:
+            if key in self._batch_ids:
+                continue
+            first = next(e for e in created if (e["school"], e["grade"]) == key)
+            batch = {
+                "id": str(uuid.uuid4()),
+                "name": key[0],
+                "grade": key[1],
+                "description": "Auto-created from CSV import",
+                "language": first["language"],
+                "member_count": 0,
+                "teacher_incharge": first["teacher_incharge"],
+                "created_by": self.created_by,
+                "created_at": now,
+                "is_active": True
+            }
+            new_batches.append(batch)
+            self._batch_ids[key] = batch["id"]
+        if new_batches:
+            await self.db.batches.insert_many(new_batches, ordered=False)
+
+        for key, student_ids in members.items():
+            await batch_members.add(self._batch_ids[key], student_ids)
+        return len(new_batches)
@@ -0,0 +1,86 @@
+"""
+Autosave Buffer Tests - write-behind flush failures are retried without
+losing or reordering buffered answers
+"""
+import asyncio
+import os
+import sys
+
+from pymongo import UpdateOne
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from autosave_buffer import AnswerWriteBuffer  # noqa: E402
+
+WRITE_FILTER = {"status": "mcq_in_progress"}
+
+
+class BulkWriteResult:
+    def __init__(self, matched_count):
+        self.matched_count = matched_count
+
+
+class FlakyAttempts:
+    """Attempts collection whose first `failures` bulk writes raise"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.written = []
+
+    async def bulk_write(self, operations, ordered=True):
+        await asyncio.sleep(0)  # A round trip: other requests run meanwhile
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("primary stepped down")
+        self.written.append(operations)
+        return BulkWriteResult(len(operations))
+
+
+def expected_update(attempt_id, answers, seq):
+    entry = {"answers": {q_id: (option, seq) for q_id, option in answers.items()}, "seq": seq}
+    return UpdateOne({"id": attempt_id, **WRITE_FILTER}, AnswerWriteBuffer._update_pipeline(entry))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestFlushFailure:
+    """A failed bulk_write puts the batch back for the next flush"""
+
+    def test_failed_flush_is_retried(self):
+        """Answers acknowledged before a failed flush are written by the next one"""
+        async def scenario():
+            attempts = FlakyAttempts(failures=1)
+            buffer = AnswerWriteBuffer(enabled=False)
+            buffer.start(attempts, WRITE_FILTER)
+            buffer.add("attempt-1", {"q1": "A"}, seq=1)
+
+            await buffer.flush()
+            assert attempts.written == []
+            assert buffer.has_pending("attempt-1")
+            assert buffer.metrics()["flush_errors"] == 1
+
+            await buffer.flush()
+            assert attempts.written == [[expected_update("attempt-1", {"q1": "A"}, 1)]]
+            assert not buffer.has_pending("attempt-1")
+        run(scenario())
+
+    def test_newer_answers_win_over_requeued_batch(self):
+        """Answers buffered while a flush was failing are not overwritten by the requeued batch"""
+        async def scenario():
+            attempts = FlakyAttempts(failures=1)
+            buffer = AnswerWriteBuffer(enabled=False)
+            buffer.start(attempts, WRITE_FILTER)
+            buffer.add("attempt-1", {"q1": "A", "q2": "C"}, seq=1)
+
+            flushing = asyncio.create_task(buffer.flush())
+            await asyncio.sleep(0)  # The flush has taken the batch and is waiting on the write
+            buffer.add("attempt-1", {"q1": "B"}, seq=2)
+            await flushing
+
+            await buffer.flush()
+            entry = {"answers": {"q1": ("B", 2), "q2": ("C", 1)}, "seq": 2}
+            assert attempts.written == [[
+                UpdateOne({"id": "attempt-1", **WRITE_FILTER}, AnswerWriteBuffer._update_pipeline(entry))
+            ]]
+        run(scenario())
@@ -0,0 +1,472 @@
+"""
+Exam Delivery Tests - cached principals, student-safe exam payloads,
+conditional GETs, resumable uploads and runtime metrics
+"""
+import pytest
+import requests
+import os
+import json
+import time
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# Test credentials
+CREDENTIALS = {
+    'admin': {'email': 'admin@exam.lk', 'password': 'admin123'},
+    'student': {'email': 'student@test.lk', 'password': 'pass123'},
+    'parent': {'email': 'parent@test.lk', 'password': 'pass123'},
+    'marker': {'email': 'marker@exam.lk', 'password': 'marker123'},
+}
+
+
+def login(role):
+    response = requests.post(f"{BASE_URL}/api/login", json=CREDENTIALS[role])
+    return response.json()['access_token']
+
+
+@pytest.fixture
+def admin_token():
+    """Get admin authentication token"""
+    return login('admin')
+
+
+@pytest.fixture
+def published_exam_id():
+    """Any published exam"""
+    response = requests.get(f"{BASE_URL}/api/exams", params={'status': 'published'})
+    exams = response.json()['exams']
+    if not exams:
+        pytest.skip("No published exam available")
+    return exams[0]['id']
+
+
+class TestStudentExamPayload:
+    """GET /api/exams/{exam_id} returns a pre-encoded, student-safe view"""
+
+    def test_exam_view_hides_answer_keys(self, published_exam_id):
+        """Correct answers are never sent to clients"""
+        response = requests.get(f"{BASE_URL}/api/exams/{published_exam_id}")
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data['mcq_questions']) > 0
+        for question in data['mcq_questions']:
+            assert 'correct_option_id' not in question
+            assert 'correct_answer' not in question
+            for option in question.get('options', []):
+                assert 'is_correct' not in option
+        print(f"✅ Student exam view OK - {len(data['mcq_questions'])} questions, no answer keys")
+
+    def test_conditional_get_returns_304(self, published_exam_id):
+        """Repeating the request with the ETag yields 304 Not Modified"""
+        first = requests.get(f"{BASE_URL}/api/exams/{published_exam_id}")
+        etag = first.headers.get('ETag')
+        assert etag
+
+        second = requests.get(
+            f"{BASE_URL}/api/exams/{published_exam_id}",
+            headers={'If-None-Match': etag}
+        )
+        assert second.status_code == 304
+        assert second.headers.get('ETag') == etag
+        print(f"✅ Conditional GET OK - ETag {etag}")
+
+    def test_etag_prefix_does_not_match(self, published_exam_id):
+        """If-None-Match entries are compared whole, not as substrings"""
+        etag = requests.get(f"{BASE_URL}/api/exams/{published_exam_id}").headers['ETag']
+        response = requests.get(
+            f"{BASE_URL}/api/exams/{published_exam_id}",
+            headers={'If-None-Match': f'"x", {etag[:-2]}"'}
+        )
+        assert response.status_code == 200
+        print("✅ Partial ETag correctly ignored")
+
+    def test_staff_receive_full_exam(self, admin_token, published_exam_id):
+        """Admins get the stored document, answer keys included"""
+        response = requests.get(
+            f"{BASE_URL}/api/exams/{published_exam_id}",
+            headers={'Authorization': f'Bearer {admin_token}'}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert any('correct_option_id' in q or 'correct_answer' in q for q in data['mcq_questions'])
+        print("✅ Staff exam view OK - answer keys included")
+
+
+class TestBatchedAutosave:
+    """POST /api/attempts/{attempt_id}/save-mcq-batch"""
+
+    @pytest.fixture
+    def active_attempt(self, published_exam_id):
+        """Student attempt with the MCQ section open"""
+        token = login('student')
+        response = requests.post(
+            f"{BASE_URL}/api/exams/{published_exam_id}/start",
+            headers={'Authorization': f'Bearer {token}'}
+        )
+        data = response.json()
+        if data['attempt']['status'] != 'mcq_in_progress':
+            pytest.skip("Student has no attempt in the MCQ section")
+        return token, data['attempt'], data['exam']
+
+    def test_batch_applies_and_drops_replays(self, active_attempt):
+        """A batch is acknowledged once; replaying its sequence number is a no-op"""
+        token, attempt, exam = active_attempt
+        headers = {'Authorization': f'Bearer {token}'}
+        question_ids = [q['id'] for q in exam['mcq_questions'][:3]]
+        seq = attempt.get('mcq_seq', 0) + 1
+
+        response = requests.post(
+            f"{BASE_URL}/api/attempts/{attempt['id']}/save-mcq-batch",
+            headers=headers,
+            json={'answers': {q_id: 'A' for q_id in question_ids}, 'seq': seq}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data['acked_seq'] == seq
+        assert data['applied'] == len(question_ids)
+
+        replay = requests.post(
+            f"{BASE_URL}/api/attempts/{attempt['id']}/save-mcq-batch",
+            headers=headers,
+            json={'answers': {question_ids[0]: 'B'}, 'seq': seq}
+        )
+        assert replay.status_code == 200
+        assert replay.json()['applied'] == 0
+        assert replay.json()['acked_seq'] >= seq
+        print(f"✅ Batched autosave OK - acked seq {seq}, replay dropped")
+
+    def test_older_batch_never_overwrites_newer(self, active_attempt, published_exam_id):
+        """An out-of-order batch (e.g. flushed late by another worker) leaves the newer answer in place"""
+        token, attempt, exam = active_attempt
+        headers = {'Authorization': f'Bearer {token}'}
+        question_id = exam['mcq_questions'][0]['id']
+        seq = attempt.get('mcq_seq', 0) + 10
+
+        newer = requests.post(
+            f"{BASE_URL}/api/attempts/{attempt['id']}/save-mcq-batch",
+            headers=headers,
+            json={'answers': {question_id: 'B'}, 'seq': seq + 1}
+        )
+        assert newer.status_code == 200
+        older = requests.post(
+            f"{BASE_URL}/api/attempts/{attempt['id']}/save-mcq-batch",
+            headers=headers,
+            json={'answers': {question_id: 'A'}, 'seq': seq}
+        )
+        assert older.status_code == 200
+
+        # Acks mean buffered; the write-behind flush lands within its max lag
+        for _ in range(20):
+            resumed = requests.post(f"{BASE_URL}/api/exams/{published_exam_id}/start", headers=headers).json()
+            if resumed['attempt'].get('mcq_answers', {}).get(question_id) == 'B':
+                break
+            time.sleep(0.5)
+        assert resumed['attempt']['mcq_answers'][question_id] == 'B'
+
+
+class TestResumableUpload:
+    """Resumable parent upload sessions"""
+
+    def test_session_requires_parent(self):
+        """Only parents can open upload sessions"""
+        response = requests.post(
+            f"{BASE_URL}/api/parent/upload-sessions",
+            headers={'Authorization': f'Bearer {login("student")}'},
+            json={'attempt_id': 'any', 'pages': [{'size': 1024}]}
+        )
+        assert response.status_code == 403
+        print("✅ Upload sessions correctly restricted to parents")
+
+    def test_session_for_unknown_attempt(self):
+        """Opening a session for a missing attempt is a 404"""
+        response = requests.post(
+            f"{BASE_URL}/api/parent/upload-sessions",
+            headers={'Authorization': f'Bearer {login("parent")}'},
+            json={'attempt_id': 'does-not-exist', 'pages': [{'size': 1024}]}
+        )
+        assert response.status_code == 404
+        print("✅ Unknown attempt rejected")
+
+    def test_oversized_page_rejected(self):
+        """Declared page sizes are checked against the per-photo cap up front"""
+        response = requests.post(
+            f"{BASE_URL}/api/parent/upload-sessions",
+            headers={'Authorization': f'Bearer {login("parent")}'},
+            json={'attempt_id': 'does-not-exist', 'pages': [{'size': 1024 ** 3}]}
+        )
+        assert response.status_code == 413
+        print("✅ Oversized page rejected")
+
+    def test_cancel_unknown_session(self):
+        """Cancelling a session the parent does not own is a 404"""
+        response = requests.post(
+            f"{BASE_URL}/api/parent/upload-sessions/does-not-exist/cancel",
+            headers={'Authorization': f'Bearer {login("parent")}'}
+        )
+        assert response.status_code == 404
+        print("✅ Unknown upload session cancel rejected")
+
+
+class TestMediaServing:
+    """Signed /api/media URLs"""
+
+    def test_bad_signature_rejected(self):
+        """Media is only served through a valid signature"""
+        response = requests.get(
+            f"{BASE_URL}/api/media/blobs/00/00/0000.jpg",
+            params={'expires': 4102444800, 'sig': 'forged'}
+        )
+        assert response.status_code == 403
+        print("✅ Forged media link rejected")
+
+
+class TestAnswerKeyEncoding:
+    """Exams whose option ids are unique across the whole paper"""
+
+    def test_uuid_option_ids_are_served(self, admin_token):
+        """Hundreds of distinct option ids no longer break reading the exam"""
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        questions = []
+        for number in range(1, 61):
+            options = [{'option_id': str(uuid.uuid4()), 'text': f'Option {n}'} for n in range(4)]
+            questions.append({
+                'id': f'q{number}',
+                'question_number': number,
+                'question_text': f'Question {number}',
+                'options': options,
+                'correct_option_id': options[1]['option_id']
+            })
+        created = requests.post(
+            f"{BASE_URL}/api/exams/create",
+            headers=headers,
+            json={'title': f"TEST_Uuid_Options_{uuid.uuid4().hex[:6]}", 'grade': 'grade_5', 'month': '2026-01', 'mcq_questions': questions}
+        )
+        assert created.status_code == 200
+        response = requests.get(f"{BASE_URL}/api/exams/{created.json()['id']}")
+        assert response.status_code == 200
+        assert len(response.json()['mcq_questions']) == 60
+
+
+class TestMarkingQueue:
+    """POST /api/marker/claim-next"""
+
+    def test_claim_next_returns_leased_paper_or_none(self):
+        """A claim hands out one paper with a lease, or reports an empty queue"""
+        headers = {'Authorization': f'Bearer {login("marker")}'}
+        response = requests.post(f"{BASE_URL}/api/marker/claim-next", headers=headers)
+        assert response.status_code == 200
+        paper = response.json()['paper']
+        if paper is None:
+            print("✅ Claim-next OK - queue empty")
+            return
+        assert paper['lease_expires_at']
+        assert 'student_id' not in paper
+
+        renew = requests.post(f"{BASE_URL}/api/marker/papers/{paper['id']}/renew-lease", headers=headers)
+        assert renew.status_code == 200
+        print(f"✅ Claim-next OK - leased {paper['secret_code']}")
+
+        release = requests.post(f"{BASE_URL}/api/marker/papers/{paper['id']}/release", headers=headers)
+        assert release.status_code == 200
+        again = requests.post(f"{BASE_URL}/api/marker/papers/{paper['id']}/release", headers=headers)
+        assert again.status_code == 409
+        print("✅ Release OK - paper back in the queue")
+
+    def test_claim_next_requires_marker(self):
+        """Students cannot claim papers"""
+        response = requests.post(
+            f"{BASE_URL}/api/marker/claim-next",
+            headers={'Authorization': f'Bearer {login("student")}'}
+        )
+        assert response.status_code == 403
+        print("✅ Claim-next correctly restricted to markers")
+
+
+class TestMarkerPaymentTotals:
+    """GET /api/admin/marker-payments"""
+
+    def test_totals_and_paginated_payments(self, admin_token):
+        """Totals come back per marker; each marker's payments page with a cursor"""
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        response = requests.get(f"{BASE_URL}/api/admin/marker-payments", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data['total_payments'] == sum(m['total_papers'] for m in data['markers'])
+        if not data['markers']:
+            print("✅ Marker payments OK - no payments yet")
+            return
+
+        marker = data['markers'][0]
+        assert 'payments' not in marker
+        page = requests.get(
+            f"{BASE_URL}/api/admin/marker-payments/{marker['marker_id']}",
+            headers=headers,
+            params={'limit': 1}
+        )
+        assert page.status_code == 200
+        assert len(page.json()['payments']) == 1
+        assert (page.json()['next_cursor'] is not None) == (marker['total_papers'] > 1)
+        print(f"✅ Marker payments OK - {len(data['markers'])} markers")
+
+
+class TestStreamingExport:
+    """GET /api/admin/users/export"""
+
+    def test_export_streams_every_student(self, admin_token):
+        """CSV and NDJSON exports agree and are not capped"""
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        csv_response = requests.get(
+            f"{BASE_URL}/api/admin/users/export",
+            headers=headers,
+            params={'role': 'student'}
+        )
+        assert csv_response.status_code == 200
+        assert csv_response.headers['content-type'].startswith('text/csv')
+        csv_lines = csv_response.text.strip().splitlines()
+        assert csv_lines[0].startswith('id,student_id,email')
+        assert 'hashed_password' not in csv_response.text
+
+        ndjson_response = requests.get(
+            f"{BASE_URL}/api/admin/users/export",
+            headers=headers,
+            params={'role': 'student', 'format': 'ndjson'}
+        )
+        assert ndjson_response.status_code == 200
+        students = [json.loads(line) for line in ndjson_response.text.splitlines() if line]
+        assert all(s['role'] == 'student' for s in students)
+        print(f"✅ Streaming export OK - {len(students)} students")
+
+    def test_export_unknown_batch_is_404(self, admin_token):
+        """An unknown batch does not fall back to exporting everyone"""
+        response = requests.get(
+            f"{BASE_URL}/api/admin/export-credentials",
+            headers={'Authorization': f'Bearer {admin_token}'},
+            params={'batch_name': f'no-such-batch-{uuid.uuid4().hex[:6]}', 'format': 'csv'}
+        )
+        assert response.status_code == 404
+        print("✅ Unknown batch export rejected")
+
+
+class TestKeysetPagination:
+    """next_cursor on list endpoints"""
+
+    def test_users_page_through_cursor(self, admin_token):
+        """Consecutive pages do not overlap"""
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        first = requests.get(f"{BASE_URL}/api/admin/users", headers=headers, params={'limit': 2})
+        assert first.status_code == 200
+        data = first.json()
+        assert len(data['users']) <= 2
+        if not data['next_cursor']:
+            print("✅ Pagination OK - single page")
+            return
+
+        second = requests.get(
+            f"{BASE_URL}/api/admin/users",
+            headers=headers,
+            params={'limit': 2, 'cursor': data['next_cursor']}
+        )
+        assert second.status_code == 200
+        first_ids = {u['id'] for u in data['users']}
+        assert not first_ids & {u['id'] for u in second.json()['users']}
+        print("✅ Pagination OK - pages are disjoint")
+
+    def test_invalid_cursor_rejected(self):
+        """A tampered cursor is a 400, not a server error"""
+        response = requests.get(f"{BASE_URL}/api/exams", params={'cursor': 'not-a-cursor'})
+        assert response.status_code == 400
+        print("✅ Invalid cursor rejected")
+
+
+class TestBatchMembers:
+    """Batch membership in batch_members"""
+
+    def test_add_is_idempotent_and_counted(self, admin_token):
+        """Re-adding a member changes nothing; details page through members"""
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        batch = requests.post(
+            f"{BASE_URL}/api/batches/create",
+            headers=headers,
+            json={'name': f"TEST_Members_{uuid.uuid4().hex[:6]}", 'grade': 'grade_5', 'language': 'en'}
+        ).json()
+        students = requests.get(
+            f"{BASE_URL}/api/admin/users",
+            headers=headers,
+            params={'role': 'student', 'limit': 2}
+        ).json()['users']
+        if not students:
+            pytest.skip("No students to add")
+        student_ids = [s['id'] for s in students]
+
+        first = requests.post(f"{BASE_URL}/api/batches/{batch['id']}/students", headers=headers, json={'student_ids': student_ids})
+        assert first.status_code == 200
+        assert first.json()['added'] == len(student_ids)
+        again = requests.post(f"{BASE_URL}/api/batches/{batch['id']}/students", headers=headers, json={'student_ids': student_ids})
+        assert again.json()['added'] == 0
+
+        details = requests.get(f"{BASE_URL}/api/batches/{batch['id']}", headers=headers, params={'limit': 1}).json()
+        assert details['student_count'] == len(student_ids)
+        assert len(details['students']) == 1
+        assert 'student_ids' not in details
+        assert (details['next_cursor'] is not None) == (len(student_ids) > 1)
+        print(f"✅ Batch members OK - {details['student_count']} members")
+
+
+class TestStudentProgress:
+    """Progress served from the per-student results summary"""
+
+    def test_progress_has_narrow_exam_summary(self):
+        """Results carry only the exam fields the progress views show"""
+        session = requests.post(f"{BASE_URL}/api/login", json=CREDENTIALS['student']).json()
+        headers = {'Authorization': f"Bearer {session['access_token']}"}
+        me = session['user']
+        response = requests.get(f"{BASE_URL}/api/students/{me['id']}/progress", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data['total_exams'] == len(data['results'])
+        for result in data['results']:
+            if result['exam']:
+                assert set(result['exam']) <= {'id', 'title', 'month', 'grade'}
+        # Second read is served from the stored summary
+        again = requests.get(f"{BASE_URL}/api/students/{me['id']}/progress", headers=headers).json()
+        assert again['results'] == data['results']
+        print(f"✅ Progress OK - {data['total_exams']} results")
+
+    def test_progress_of_other_student_forbidden(self):
+        """Students only see their own progress"""
+        response = requests.get(
+            f"{BASE_URL}/api/students/{uuid.uuid4()}/progress",
+            headers={'Authorization': f'Bearer {login("student")}'}
+        )
+        assert response.status_code == 403
+
+
+class TestRuntimeMetrics:
+    """Per-worker runtime metrics"""
+
+    def test_metrics_expose_auth_cache(self, admin_token):
+        """Admin sees principal cache counters"""
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        # Second authenticated call should be a cache hit on the same worker
+        requests.get(f"{BASE_URL}/api/admin/metrics", headers=headers)
+        response = requests.get(f"{BASE_URL}/api/admin/metrics", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert 'hits' in data['auth_cache']
+        assert 'misses' in data['auth_cache']
+        assert 'queue_depth' in data['password_hashing']
+        print(f"✅ Metrics OK - auth cache {data['auth_cache']}")
+
+    def test_metrics_admin_only(self):
+        """Students cannot read runtime metrics"""
+        response = requests.get(
+            f"{BASE_URL}/api/admin/metrics",
+            headers={'Authorization': f'Bearer {login("student")}'}
+        )
+        assert response.status_code == 403
+        print("✅ Metrics correctly restricted to admin")
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v', '--tb=short'])
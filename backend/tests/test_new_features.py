@@ -7,6 +7,7 @@ import requests
 import os
 import uuid
 import io
+import time
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
 
@@ -227,6 +228,22 @@ class TestAdminMarkerPayments:
         print("Admin pay-marker endpoint verified")
 
 
+def wait_for_import(job, headers, timeout=60):
+    """Poll a background import job until it finishes, then return its JSON report"""
+    deadline = time.time() + timeout
+    while job['status'] == 'running' and time.time() < deadline:
+        time.sleep(0.5)
+        job = requests.get(f"{BASE_URL}/api/admin/import-jobs/{job['id']}", headers=headers).json()
+    assert job['status'] == 'completed', job
+    response = requests.get(
+        f"{BASE_URL}/api/admin/import-jobs/{job['id']}/report",
+        headers=headers,
+        params={'format': 'json'}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
 class TestCSVStudentImport:
     """Test bulk CSV student import"""
     
@@ -247,16 +264,18 @@ class TestCSVStudentImport:
             'file': ('students.csv', csv_content, 'text/csv')
         }
         
+        headers = {'Authorization': f'Bearer {admin_token}'}
         response = requests.post(
             f"{BASE_URL}/api/admin/import-students-csv",
             files=files,
-            headers={'Authorization': f'Bearer {admin_token}'}
+            headers=headers
         )
         
         assert response.status_code == 200
-        data = response.json()
+        assert response.json()['status'] == 'running'
+        data = wait_for_import(response.json(), headers)
         
-        # Verify response structure
+        # Verify report structure
         assert 'created' in data
         assert 'skipped' in data
         assert 'errors' in data
@@ -282,14 +301,15 @@ class TestCSVStudentImport:
             'file': ('students.csv', csv_content, 'text/csv')
         }
         
+        headers = {'Authorization': f'Bearer {admin_token}'}
         response = requests.post(
             f"{BASE_URL}/api/admin/import-students-csv",
             files=files,
-            headers={'Authorization': f'Bearer {admin_token}'}
+            headers=headers
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = wait_for_import(response.json(), headers)
         
         # Should have skipped or errored for existing email
         assert data['skipped'] > 0 or len(data['errors']) > 0
@@ -307,6 +327,28 @@ class TestCSVStudentImport:
         
         assert response.status_code in [401, 403]
         print("CSV import auth requirement verified")
+    
+    def test_csv_import_report_download(self, admin_token):
+        """The per-row report downloads as CSV with one line per input row"""
+        unique_id = uuid.uuid4().hex[:6]
+        csv_content = "student_name,student_email\n"
+        csv_content += f"TEST_Report_{unique_id},test_report_{unique_id}@test.com\n"
+        csv_content += ",missing_name@test.com\n"
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        job = requests.post(
+            f"{BASE_URL}/api/admin/import-students-csv",
+            files={'file': ('students.csv', csv_content, 'text/csv')},
+            headers=headers
+        ).json()
+        wait_for_import(job, headers)
+        
+        response = requests.get(f"{BASE_URL}/api/admin/import-jobs/{job['id']}/report", headers=headers)
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/csv')
+        lines = response.text.strip().splitlines()
+        assert lines[0].startswith('row,status')
+        assert len(lines) == 3
+        print("CSV import report download verified")
 
 
 class TestAdminUsersWithSchool:
@@ -5,11 +5,15 @@ import axios from 'axios';
 import { Users, UserPlus, LogOut, Search, X, BookOpen, Layers, BarChart3, GraduationCap, Music, CheckCircle, Clock, AlertCircle, Download, Upload, DollarSign, FileSpreadsheet, CreditCard, Building2 } from 'lucide-react';
 import LanguageSwitcher from '../components/LanguageSwitcher';
 
+// Stop polling an import whose progress has not moved for this long
+const IMPORT_STALL_TIMEOUT_MS = 5 * 60 * 1000;
+
 const AdminDashboard = () => {
   const { t } = useTranslation();
   const { user, token, logout } = useAuth();
   const [activeTab, setActiveTab] = useState('overview');
   const [users, setUsers] = useState([]);
+  const [usersCursor, setUsersCursor] = useState(null);
   const [batches, setBatches] = useState([]);
   const [stats, setStats] = useState(null);
   const [markerPayments, setMarkerPayments] = useState(null);
@@ -23,6 +27,7 @@ const AdminDashboard = () => {
   const [showCsvImport, setShowCsvImport] = useState(false);
   const [csvResults, setCsvResults] = useState(null);
   const [csvUploading, setCsvUploading] = useState(false);
+  const [csvJob, setCsvJob] = useState(null);
 
   const [newUser, setNewUser] = useState({ email: '', password: '', full_name: '', role: 'student', grade: 'grade_5' });
   const [newBatch, setNewBatch] = useState({ name: '', grade: 'grade_5', description: '', language: 'si', teacher_incharge: '' });
@@ -39,12 +44,21 @@ const AdminDashboard = () => {
         axios.get(`${API}/admin/statistics`, { headers })
       ]);
       setUsers(usersRes.data.users || []);
+      setUsersCursor(usersRes.data.next_cursor || null);
       setBatches(batchesRes.data.batches || []);
       setStats(statsRes.data);
     } catch (err) { console.error('Failed to load data:', err); }
     finally { setLoading(false); }
   };
 
+  const loadMoreUsers = async () => {
+    try {
+      const res = await axios.get(`${API}/admin/users`, { headers, params: { cursor: usersCursor } });
+      setUsers(prev => [...prev, ...(res.data.users || [])]);
+      setUsersCursor(res.data.next_cursor || null);
+    } catch (err) { console.error('Failed to load users:', err); }
+  };
+
   const loadMarkerPayments = async () => {
     try {
       const res = await axios.get(`${API}/admin/marker-payments`, { headers });
@@ -79,16 +93,50 @@ const AdminDashboard = () => {
     if (!file) return;
     setCsvUploading(true);
     setCsvResults(null);
+    setCsvJob(null);
     try {
       const formData = new FormData();
       formData.append('file', file);
       const res = await axios.post(`${API}/admin/import-students-csv`, formData, { headers: { ...headers, 'Content-Type': 'multipart/form-data' } });
-      setCsvResults(res.data);
+      let job = res.data;
+      setCsvJob(job);
+      // The import runs in the background; poll until it finishes or stops making progress
+      let lastProcessed = job.processed;
+      let lastProgressAt = Date.now();
+      while (job.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, 1500));
+        job = (await axios.get(`${API}/admin/import-jobs/${job.id}`, { headers })).data;
+        setCsvJob(job);
+        if (job.processed !== lastProcessed) {
+          lastProcessed = job.processed;
+          lastProgressAt = Date.now();
+        } else if (Date.now() - lastProgressAt > IMPORT_STALL_TIMEOUT_MS) {
+          break;
+        }
+      }
+      // Rows imported before a failure still have their passwords in the report
+      const report = await axios.get(`${API}/admin/import-jobs/${job.id}/report`, { headers, params: { format: 'json' } });
+      setCsvResults(report.data);
       loadData();
+      if (job.status === 'failed') throw new Error(job.error || 'Import failed');
+      if (job.status === 'running') throw new Error('The import stopped making progress. The report lists the rows imported so far.');
     } catch (error) { alert('CSV Import Error: ' + (error.response?.data?.detail || error.message)); }
     finally { setCsvUploading(false); if (csvInputRef.current) csvInputRef.current.value = ''; }
   };
 
+  const downloadCsvReport = async () => {
+    if (!csvJob) return;
+    try {
+      const res = await axios.get(`${API}/admin/import-jobs/${csvJob.id}/report`, { headers, responseType: 'blob' });
+      const url = URL.createObjectURL(res.data);
+      const link = document.createElement('a');
+      link.href = url;
+      link.download = `import-report-${csvJob.id.slice(0, 8)}.csv`;
+      link.click();
+      URL.revokeObjectURL(url);
+    } catch (error) { alert('Report download failed: ' + (error.response?.data?.detail || error.message)); }
+  };
+
   const handlePayMarker = async (markerId, markerName) => {
     const ref = prompt(`Enter bank transfer reference for ${markerName}:`);
     if (!ref) return;
@@ -262,6 +310,11 @@ const AdminDashboard = () => {
                     </tbody>
                   </table>
                 </div>
+                {usersCursor && (
+                  <button onClick={loadMoreUsers} className="mt-3 w-full py-2 bg-gray-100 hover:bg-gray-200 rounded-lg text-sm font-semibold text-gray-700" data-testid="load-more-users-btn">
+                    Load more users
+                  </button>
+                )}
               </div>
             )}
 
@@ -477,7 +530,10 @@ const AdminDashboard = () => {
               <div className="border-2 border-dashed border-[#D1D5DB] rounded-xl p-8 text-center">
                 <input type="file" accept=".csv" ref={csvInputRef} onChange={handleCsvUpload} className="hidden" id="csv-file" data-testid="csv-file-input" />
                 {csvUploading ? (
-                  <div className="animate-spin rounded-full h-10 w-10 border-4 border-[#F59E0B] border-t-transparent mx-auto"></div>
+                  <>
+                    <div className="animate-spin rounded-full h-10 w-10 border-4 border-[#F59E0B] border-t-transparent mx-auto"></div>
+                    {csvJob && <p className="text-xs text-gray-500 mt-3">Importing... {csvJob.processed}{csvJob.total ? ` / ${csvJob.total}` : ''} rows</p>}
+                  </>
                 ) : (
                   <>
                     <Upload className="w-12 h-12 text-gray-400 mx-auto mb-3" />
@@ -506,6 +562,10 @@ const AdminDashboard = () => {
                     </div>
                   </div>
 
+                  <button onClick={downloadCsvReport} className="w-full py-2 bg-gray-100 hover:bg-gray-200 rounded-lg text-sm font-semibold text-gray-700 flex items-center justify-center gap-2" data-testid="csv-report-btn">
+                    <Download className="w-4 h-4" /> Download full report (CSV)
+                  </button>
+
                   {csvResults.details?.length > 0 && (
                     <div className="bg-gray-50 rounded-lg p-3 border border-gray-200 max-h-60 overflow-y-auto">
                       <h4 className="font-semibold text-gray-800 mb-2 text-sm">Created Accounts (save these credentials!):</h4>
@@ -148,7 +148,7 @@ const ExamInterface = () => {
     try {
       const response = await axios.post(
         `${API}/attempts/${attempt.id}/submit-mcq`,
-        {},
+        { answers: mcqAnswers },
         { headers: { Authorization: `Bearer ${token}` } }
       );
       
@@ -12,6 +12,8 @@ const MarkerDashboard = () => {
   const [view, setView] = useState('pending'); // pending, marking, payments
   const [pendingPapers, setPendingPapers] = useState([]);
   const [currentPaper, setCurrentPaper] = useState(null);
+  const [upcomingPapers, setUpcomingPapers] = useState([]);
+  const [batchMode, setBatchMode] = useState(false); // claimed via claim-batch: keep the batch topped up
   const [payments, setPayments] = useState({ payments: [], total_pending: 0, total_paid: 0 });
   const [loading, setLoading] = useState(true);
   const [submitting, setSubmitting] = useState(false);
@@ -90,6 +92,7 @@ const MarkerDashboard = () => {
       
       const paper = pendingPapers.find(p => p.id === attemptId);
       setCurrentPaper(paper);
+      setBatchMode(false);
       setView('marking');
       setPendingPapers(prev => prev.filter(p => p.id !== attemptId));
       
@@ -104,6 +107,49 @@ const MarkerDashboard = () => {
     }
   };
 
+  // Warm the browser cache with the pages of papers the marker holds next
+  const prefetchPaperImages = (papers) => {
+    papers.forEach(paper => {
+      (paper.paper_photos || []).forEach(photo => {
+        const img = new Image();
+        img.src = `${process.env.REACT_APP_BACKEND_URL}${photo}`;
+      });
+    });
+  };
+
+  const startMarking = (paper, upcoming) => {
+    setCurrentPaper(paper);
+    setUpcomingPapers(upcoming);
+    prefetchPaperImages(upcoming);
+    setView('marking');
+    setMarks({
+      essay_marks: 0,
+      short_answer_marks: Array(15).fill(0),
+      comments: ''
+    });
+  };
+
+  // Hold a small batch of the oldest pending papers (server leases them atomically)
+  const handleClaimNext = async () => {
+    try {
+      setError('');
+      const response = await axios.post(`${API}/marker/claim-batch`, {}, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      const papers = response.data.papers || [];
+      if (papers.length === 0) {
+        setSuccess('No papers pending right now');
+        return;
+      }
+      const heldIds = papers.map(p => p.id);
+      setPendingPapers(prev => prev.filter(p => !heldIds.includes(p.id)));
+      setBatchMode(true);
+      startMarking(papers[0], papers.slice(1));
+    } catch (err) {
+      setError(err.response?.data?.detail || 'Failed to claim paper');
+    }
+  };
+
   // Submit marks
   const handleSubmitMarks = async () => {
     if (!currentPaper) return;
@@ -113,16 +159,24 @@ const MarkerDashboard = () => {
     
     try {
       const response = await axios.post(
-        `${API}/marker/submit-marks/${currentPaper.id}`,
+        `${API}/marker/submit-marks/${currentPaper.id}${batchMode ? '?prefetch=true' : ''}`,
         marks,
-        { headers: { Authorization: `Bearer ${token}` } }
+        // One key per paper, so a double-click or retry cannot pay twice
+        { headers: { Authorization: `Bearer ${token}`, 'Idempotency-Key': `marks-${currentPaper.id}` } }
       );
       
       setSuccess(`Marks submitted! Written Score: ${response.data.written_score}`);
-      setCurrentPaper(null);
-      setView('pending');
-      fetchPendingPapers();
       fetchPayments();
+      if (response.data.next_paper) {
+        // Straight on to the next held paper; its pages are usually cached already
+        startMarking(response.data.next_paper, response.data.upcoming_papers || []);
+      } else {
+        setCurrentPaper(null);
+        setUpcomingPapers([]);
+        setBatchMode(false);
+        setView('pending');
+        fetchPendingPapers();
+      }
     } catch (err) {
       setError(err.response?.data?.detail || 'Failed to submit marks');
     } finally {
@@ -130,6 +184,21 @@ const MarkerDashboard = () => {
     }
   };
 
+  // Hand the open paper and any held ones back to the queue instead of sitting on their leases
+  const handleCancelMarking = async () => {
+    const held = [currentPaper, ...upcomingPapers].filter(Boolean);
+    setCurrentPaper(null);
+    setUpcomingPapers([]);
+    setBatchMode(false);
+    setView('pending');
+    await Promise.allSettled(held.map(paper =>
+      axios.post(`${API}/marker/papers/${paper.id}/release`, {}, {
+        headers: { Authorization: `Bearer ${token}` }
+      })
+    ));
+    fetchPendingPapers();
+  };
+
   // Get grade label
   const gradeLabel = (grade) => {
     const labels = {
@@ -225,6 +294,15 @@ const MarkerDashboard = () => {
         {/* Pending Papers View */}
         {view === 'pending' && !currentPaper && (
           <div className="grid gap-4">
+            {pendingPapers.length > 0 && (
+              <button
+                onClick={handleClaimNext}
+                data-testid="claim-next-paper"
+                className="justify-self-end px-6 py-2 bg-green-500 text-white font-medium rounded-lg hover:bg-green-600 transition-all"
+              >
+                Mark Next Paper
+              </button>
+            )}
             {loading ? (
               <div className="text-center py-12">
                 <div className="animate-spin rounded-full h-12 w-12 border-4 border-blue-500 border-t-transparent mx-auto mb-4"></div>
@@ -251,6 +329,19 @@ const MarkerDashboard = () => {
                       <p className="text-sm text-gray-500">
                         {paper.paper_photos?.length || 0} pages uploaded
                       </p>
+                      {paper.thumbnails?.length > 0 && (
+                        <div className="flex gap-2 mt-3">
+                          {paper.thumbnails.slice(0, 5).map((thumb, index) => (
+                            <img
+                              key={index}
+                              src={`${process.env.REACT_APP_BACKEND_URL}${thumb}`}
+                              alt={`Page ${index + 1}`}
+                              loading="lazy"
+                              className="h-16 w-12 object-cover rounded border"
+                            />
+                          ))}
+                        </div>
+                      )}
                     </div>
                     <button
                       onClick={() => handleClaimPaper(paper.id)}
@@ -273,6 +364,9 @@ const MarkerDashboard = () => {
             <div className="bg-white rounded-xl p-6 shadow-lg">
               <h3 className="text-lg font-bold text-gray-800 mb-4">
                 Paper: {currentPaper.secret_code}
+                {upcomingPapers.length > 0 && (
+                  <span className="ml-2 text-sm font-normal text-gray-500">+{upcomingPapers.length} held</span>
+                )}
               </h3>
               <div className="space-y-4 max-h-[600px] overflow-y-auto">
                 {currentPaper.paper_photos?.map((photo, index) => (
@@ -367,11 +461,7 @@ const MarkerDashboard = () => {
               {/* Submit */}
               <div className="flex gap-4">
                 <button
-                  onClick={() => {
-                    setCurrentPaper(null);
-                    setView('pending');
-                    fetchPendingPapers();
-                  }}
+                  onClick={handleCancelMarking}
                   className="flex-1 py-3 bg-gray-200 text-gray-700 font-medium rounded-lg hover:bg-gray-300 transition-colors"
                 >
                   Cancel
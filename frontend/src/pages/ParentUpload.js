@@ -20,6 +20,7 @@ const ParentUpload = () => {
   const [selectedFiles, setSelectedFiles] = useState([]);
   const [previewUrls, setPreviewUrls] = useState([]);
   const [remainingSeconds, setRemainingSeconds] = useState(0);
+  const [uploadSessionId, setUploadSessionId] = useState(null); // Session this page opened, reused by retries
 
   // Check upload status
   useEffect(() => {
@@ -77,6 +78,74 @@ const ParentUpload = () => {
     setPreviewUrls(urls);
   };
 
+  // Send one photo in chunks, resuming from the server's received ranges after a failure
+  const uploadPageResumable = async (sessionId, index, file, headers) => {
+    const CHUNK_SIZE = 512 * 1024;
+    const MAX_RETRIES = 8;
+    let retries = 0;
+    let offset = 0;
+    while (offset < file.size) {
+      try {
+        const res = await axios.put(
+          `${API}/parent/upload-sessions/${sessionId}/pages/${index}?offset=${offset}`,
+          file.slice(offset, offset + CHUNK_SIZE),
+          { headers: { ...headers, 'Content-Type': 'application/octet-stream' } }
+        );
+        if (res.data.complete) return;
+        offset = res.data.received.length && res.data.received[0][0] === 0 ? res.data.received[0][1] : 0;
+        retries = 0;
+      } catch (err) {
+        if (err.response && err.response.status < 500) throw err;
+        if (++retries > MAX_RETRIES) throw err;
+        await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+        const session = await axios.get(`${API}/parent/upload-sessions/${sessionId}`, { headers });
+        const received = session.data.pages[index].received;
+        offset = received.length && received[0][0] === 0 ? received[0][1] : 0;
+      }
+    }
+  };
+
+  // A session can be resumed only if it is still open and was opened for exactly these photos
+  const sessionMatchesFiles = (session, files) =>
+    session.status === 'open' &&
+    session.pages.length === files.length &&
+    session.pages.every((page, index) => page.size === files[index].size);
+
+  const createUploadSession = async (headers) => {
+    const res = await axios.post(`${API}/parent/upload-sessions`, {
+      attempt_id: uploadStatus.attempt_id,
+      pages: selectedFiles.map(file => ({ size: file.size, content_type: file.type || 'image/jpeg' }))
+    }, { headers });
+    return res.data;
+  };
+
+  // Resume this attempt's session when it fits the selection; otherwise cancel it and open a new one
+  const openUploadSession = async (headers) => {
+    const knownId = uploadSessionId || uploadStatus.upload_session_id;
+    if (knownId) {
+      try {
+        const existing = (await axios.get(`${API}/parent/upload-sessions/${knownId}`, { headers })).data;
+        if (sessionMatchesFiles(existing, selectedFiles)) {
+          setUploadSessionId(existing.id);
+          return existing.id;
+        }
+        if (existing.status === 'open') {
+          await axios.post(`${API}/parent/upload-sessions/${knownId}/cancel`, {}, { headers });
+        }
+      } catch (err) {
+        if (!err.response || err.response.status !== 404) throw err;
+      }
+    }
+    // The server hands back the attempt's open session if there still is one (e.g. from another tab)
+    let session = await createUploadSession(headers);
+    if (!sessionMatchesFiles(session, selectedFiles)) {
+      await axios.post(`${API}/parent/upload-sessions/${session.id}/cancel`, {}, { headers });
+      session = await createUploadSession(headers);
+    }
+    setUploadSessionId(session.id);
+    return session.id;
+  };
+
   // Handle upload
   const handleUpload = async () => {
     if (selectedFiles.length === 0) {
@@ -88,18 +157,18 @@ const ParentUpload = () => {
     setError('');
 
     try {
-      const formData = new FormData();
-      formData.append('attempt_id', uploadStatus.attempt_id);
-      selectedFiles.forEach(file => {
-        formData.append('photos', file);
-      });
+      const headers = { Authorization: `Bearer ${token}` };
 
-      await axios.post(`${API}/parent/upload-photos`, formData, {
-        headers: {
-          Authorization: `Bearer ${token}`,
-          'Content-Type': 'multipart/form-data'
-        }
-      });
+      // Resumable upload: the session is opened while the window is still running,
+      // then each photo is sent in chunks that survive dropped connections. Pressing
+      // Upload again after a failure resumes the same session.
+      const sessionId = await openUploadSession(headers);
+
+      for (let index = 0; index < selectedFiles.length; index++) {
+        await uploadPageResumable(sessionId, index, selectedFiles[index], headers);
+      }
+
+      await axios.post(`${API}/parent/upload-sessions/${sessionId}/finalize`, {}, { headers });
 
       setSuccess('Photos uploaded successfully!');
       setTimeout(() => navigate('/dashboard'), 2000);